@@ -1,42 +1,134 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context, url_for
+import json
 import os
-from utils import extract_text_from_pdf, get_summary, analyze_sentiment, generate_wordcloud, generate_sentiment_chart
-from config import API_KEY
+import uuid
+from llm_client import get_cache
+from utils import text_store, get_summary, analyze_sentiment, generate_wordcloud, generate_sentiment_chart
+from jobs import JobQueue, QueueFull, Stage
 
 app = Flask(__name__)
 
 # Ensure temp directory exists
 os.makedirs("temp", exist_ok=True)
 
+# Reports processed at the same time, and how many may wait for a free worker
+JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("REPORT_MAX_QUEUED", "20"))
+
+def extract_stage(upload, results):
+    """Extract text from the uploaded PDF"""
+    _, pages = text_store.extract(upload["pdf_path"])
+    # The summary chunks on page boundaries, the other stages take the whole text
+    return {"_pages": pages, "_text": "".join(f"{page}\n" for page in pages), "pages": len(pages)}
+
+def summary_stage(upload, results):
+    """Get summary from Gemini"""
+    return {"summary": get_summary(results["_pages"])}
+
+def sentiment_stage(upload, results):
+    """Perform sentiment analysis"""
+    sentiment, sentiment_scores = analyze_sentiment(results["_text"])
+    return {"sentiment": sentiment, "sentiment_scores": sentiment_scores}
+
+def wordcloud_stage(upload, results):
+    """Generate Word Cloud"""
+    return {"wordcloud_path": generate_wordcloud(results["_text"], f"static/wordcloud-{upload['id']}.png")}
+
+def chart_stage(upload, results):
+    """Generate Sentiment Chart"""
+    path = f"static/sentiment_chart-{upload['id']}.png"
+    return {"sentiment_chart_path": generate_sentiment_chart(results["sentiment_scores"], path)}
+
+def remove_upload_files(job):
+    """Delete a forgotten job's PDF and images"""
+    upload = job.input
+    for path in (upload["pdf_path"], f"static/wordcloud-{upload['id']}.png",
+                 f"static/sentiment_chart-{upload['id']}.png"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Summary, sentiment and word cloud all start as soon as the text is extracted
+jobs = JobQueue([
+    Stage("extract", extract_stage),
+    Stage("summary", summary_stage, needs=["extract"]),
+    Stage("sentiment", sentiment_stage, needs=["extract"]),
+    Stage("wordcloud", wordcloud_stage, needs=["extract"]),
+    Stage("chart", chart_stage, needs=["sentiment"]),
+], workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS, on_forget=remove_upload_files)
+
+def submit_upload(uploaded_file):
+    """Save the uploaded report under a unique name and queue it"""
+    upload_id = uuid.uuid4().hex
+    pdf_path = os.path.join("temp", f"{upload_id}.pdf")
+    uploaded_file.save(pdf_path)  # Save uploaded file
+    try:
+        return jobs.submit({"id": upload_id, "pdf_path": pdf_path, "filename": uploaded_file.filename})
+    except QueueFull:
+        os.remove(pdf_path)
+        raise
+
+def job_links(job):
+    return {"job_id": job.id, "status_url": url_for("job_status", job_id=job.id),
+            "events_url": url_for("job_events", job_id=job.id)}
+
 @app.route("/", methods=["GET", "POST"])
 def index():
-    summary = ""
-    sentiment = ""
-    wordcloud_path = ""
-    sentiment_chart_path = ""
+    job = None
+    error = ""
 
     if request.method == "POST":
         uploaded_file = request.files.get("report")
         if uploaded_file:
-            pdf_path = os.path.join("temp", uploaded_file.filename)
-            uploaded_file.save(pdf_path)  # Save uploaded file
+            try:
+                job = job_links(submit_upload(uploaded_file))
+            except QueueFull:
+                error = "Bahut saari reports line mein hain, thodi der baad try karo."
+
+    return render_template("index.html", job=job, error=error)
 
-            # Extract text from the PDF
-            text = extract_text_from_pdf(pdf_path)
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    uploaded_file = request.files.get("report")
+    if not uploaded_file:
+        return jsonify({"error": "No report uploaded"}), 400
+    try:
+        job = submit_upload(uploaded_file)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    return jsonify(job_links(job)), 202, {"Location": url_for("job_status", job_id=job.id)}
 
-            # Get summary from Gemini
-            summary = get_summary(text)
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.state())
 
-            # Perform sentiment analysis
-            sentiment, sentiment_scores = analyze_sentiment(text)
+@app.route("/status")
+def status():
+    """Hit rates of the extracted text store and the model response cache"""
+    return jsonify({"text_store": text_store.stats(), "response_cache": get_cache().stats()})
 
-            # Generate Word Cloud
-            wordcloud_path = generate_wordcloud(text)
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Stage progress and partial results as server-sent events"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    # A reconnecting EventSource resumes after the last event it received
+    after = request.headers.get("Last-Event-ID", type=int, default=-1)
 
-            # Generate Sentiment Chart
-            sentiment_chart_path = generate_sentiment_chart(sentiment_scores)
+    def stream():
+        for event in jobs.events(job, after):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
 
-    return render_template("index.html", summary=summary, sentiment=sentiment, wordcloud_path=wordcloud_path, sentiment_chart_path=sentiment_chart_path)
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,232 @@
+"""On-disk store of extracted report text, keyed by the SHA-256 of the PDF bytes.
+
+A report uploaded again, under any file name, is served from the store
+instead of being parsed again. Each entry is two files under a directory for
+the current pdf_extract.EXTRACTION_VERSION:
+
+    <sha256>.pages   the pages, each compressed with zlib, back to back
+    <sha256>.json    offset index ([offset, length] per page) and page stats
+
+so one page can be read with a seek and a single decompress. Entries count
+towards a size limit, and the least recently used ones are evicted first.
+A PDF uploaded again while it is still being extracted waits for that
+extraction instead of running its own.
+Directories of older extraction versions are removed when the store opens.
+Only directories the store made itself are removed: their names start with
+VERSION_PREFIX and they hold a MARKER file, so pointing the store at a
+shared directory never deletes anything else in it.
+
+    python extraction_store.py temp/*.pdf
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+from pdf_extract import EXTRACTION_VERSION, extract_text_from_pages
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.getenv("REPORT_TEXT_STORE", os.path.join(BASE_DIR, ".extraction_store"))
+MAX_STORE_BYTES = int(float(os.getenv("REPORT_TEXT_STORE_MB", "512")) * 1024 * 1024)
+VERSION_PREFIX = "extraction-v-"
+MARKER = ".extraction-store"
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(path):
+    """SHA-256 of a file's bytes, read in 1 MB blocks"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class ExtractionStore:
+    def __init__(self, root=STORE_DIR, max_bytes=MAX_STORE_BYTES, version=EXTRACTION_VERSION):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.version = version
+        self.directory = os.path.join(root, VERSION_PREFIX + _safe_name(version))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> Future of the page texts, for extractions in progress
+        self._extracting = {}
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, MARKER), "w") as f:
+            f.write(version)
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if (name.startswith(VERSION_PREFIX) and path != self.directory
+                    and os.path.isfile(os.path.join(path, MARKER))):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def extract(self, pdf_path, workers=None):
+        """(key, page texts) of a PDF, extracting it only if its bytes are not in the store yet"""
+        key = file_sha256(pdf_path)
+        texts = self.pages(key)
+        with self._lock:
+            # Waiting for an extraction already in progress counts as a hit too
+            pending = self._extracting.get(key) if texts is None else None
+            if texts is not None or pending is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                extracting = self._extracting[key] = Future()
+        if texts is not None:
+            return key, texts
+        if pending is not None:
+            return key, pending.result()
+
+        try:
+            texts, stats = extract_text_from_pages(pdf_path, workers)
+            try:
+                self.put(key, texts, stats)
+            except OSError as e:
+                logger.warning("Could not store the extracted text of %s: %s", pdf_path, e)
+            extracting.set_result(texts)
+        except BaseException as e:
+            extracting.set_exception(e)
+            raise
+        finally:
+            # Stored by now, so later lookups find the entry
+            with self._lock:
+                del self._extracting[key]
+        return key, texts
+
+    def text(self, pdf_path, workers=None):
+        """Text of the whole PDF, as pdf_extract.extract_text() gives it"""
+        _, texts = self.extract(pdf_path, workers)
+        return "".join(f"{text}\n" for text in texts)
+
+    def put(self, key, texts, stats=None):
+        blobs = [zlib.compress(text.encode("utf-8"), 6) for text in texts]
+        offsets, position = [], 0
+        for blob in blobs:
+            offsets.append([position, len(blob)])
+            position += len(blob)
+        pages_path, index_path = self._paths(key)
+        suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(pages_path + suffix, "wb") as f:
+            f.writelines(blobs)
+        with open(index_path + suffix, "w") as f:
+            json.dump({"version": self.version, "pages": offsets, "stats": stats or [],
+                       "text_bytes": sum(len(text.encode("utf-8")) for text in texts)}, f)
+        # The index goes in last: an entry without one is not visible
+        os.replace(pages_path + suffix, pages_path)
+        os.replace(index_path + suffix, index_path)
+        self.evict()
+
+    def index(self, key):
+        """Offset index and page stats of an entry, or None if it is not stored"""
+        try:
+            with open(self._paths(key)[1]) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get("version") == self.version else None
+
+    def pages(self, key):
+        """All page texts of an entry, or None"""
+        index = self.index(key)
+        if index is None:
+            return None
+        try:
+            with open(self._paths(key)[0], "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(key)
+        return [zlib.decompress(data[offset:offset + length]).decode("utf-8") for offset, length in index["pages"]]
+
+    def page(self, key, number):
+        """Text of page `number` (1-based) without reading the rest of the document, or None"""
+        index = self.index(key)
+        if index is None or not 1 <= number <= len(index["pages"]):
+            return None
+        offset, length = index["pages"][number - 1]
+        try:
+            with open(self._paths(key)[0], "rb") as f:
+                f.seek(offset)
+                blob = f.read(length)
+        except OSError:
+            return None
+        self._touch(key)
+        return zlib.decompress(blob).decode("utf-8")
+
+    def evict(self):
+        """Remove least recently used entries until the store fits in max_bytes"""
+        with self._lock:
+            entries, total = [], 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                key = name[:-len(".json")]
+                pages_path, index_path = self._paths(key)
+                try:
+                    size = os.path.getsize(pages_path) + os.path.getsize(index_path)
+                    used = os.path.getmtime(index_path)
+                except OSError:
+                    continue
+                entries.append((used, size, key))
+                total += size
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                for path in self._paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+            return total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".pages", base + ".json"
+
+    def _touch(self, key):
+        # The index file's mtime is the entry's last use, which eviction goes by
+        try:
+            os.utime(self._paths(key)[1])
+        except OSError:
+            pass
+
+def _safe_name(version):
+    return "".join(c if c.isalnum() or c in "-._" else "_" for c in version)
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract PDFs through the text store and time repeat loads")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    store = ExtractionStore(args.store)
+    for pdf_path in args.pdfs:
+        began = time.perf_counter()
+        key, texts = store.extract(pdf_path, args.workers)
+        first = time.perf_counter() - began
+        began = time.perf_counter()
+        store.extract(pdf_path, args.workers)
+        repeat = time.perf_counter() - began
+        began = time.perf_counter()
+        store.page(key, len(texts))
+        one_page = time.perf_counter() - began
+        print(f"{pdf_path}: {key[:12]}, {len(texts)} pages, first load {first:.2f} s, "
+              f"repeat {repeat * 1000:.1f} ms, last page alone {one_page * 1000:.2f} ms")
+    print(f"Store: {store.evict() / 1024:.0f} KB, {store.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Background processing of uploaded reports as jobs made of dependent stages.
+
+A job is a small graph of stages. Each stage names the stages whose results
+it needs and starts as soon as they have finished, so independent stages
+(summary, sentiment, word cloud) run side by side once the text has been
+extracted. A fixed number of jobs run at once and the rest wait in a queue
+of bounded length. A failing stage only skips the stages that depend on
+it; the job still delivers every other result.
+
+Every change to a job is recorded as an event with a sequence number.
+Clients can poll the job's state or follow its events as they happen
+(see JobQueue.events, which app.py serves as server-sent events).
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    pass
+
+class Stage:
+    def __init__(self, name, run, needs=()):
+        """`run(job_input, results)` gets the job's input and the results published so far (those of
+        every stage in `needs` included), and returns a dict of results to publish"""
+        self.name = name
+        self.run = run
+        self.needs = tuple(needs)
+
+class Job:
+    def __init__(self, stages, job_input):
+        self.id = uuid.uuid4().hex
+        self.input = job_input
+        self.status = "queued"
+        self.stages = OrderedDict((stage.name, {"status": "waiting", "seconds": None, "error": None})
+                                  for stage in stages)
+        self.results = {}
+        self.events = []
+        self.created = time.time()
+        self.finished = None
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def state(self):
+        """The job as JSON-ready data: status, per-stage progress and the results so far"""
+        with self._changed:
+            return {"id": self.id, "status": self.status, "stages": {name: dict(stage) for name, stage
+                                                                     in self.stages.items()},
+                    "results": {key: value for key, value in self.results.items() if not key.startswith("_")}}
+
+    def _record(self, event, **data):
+        with self._changed:
+            self.events.append({"seq": len(self.events), "event": event, "time": time.time(), **data})
+            self._changed.notify_all()
+
+class JobQueue:
+    def __init__(self, stages, workers=2, max_queued=20, keep=100, on_forget=None):
+        """`on_forget(job)` is called when a finished job is dropped to stay within `keep` jobs"""
+        self.stages = list(stages)
+        names = set()
+        for stage in self.stages:
+            missing = [need for need in stage.needs if need not in names]
+            if missing:
+                raise ValueError(f"Stage {stage.name} needs {', '.join(missing)}, which must come before it")
+            names.add(stage.name)
+        self.max_queued = max_queued
+        self.keep = keep
+        self.on_forget = on_forget
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-job")
+
+    def submit(self, job_input):
+        """Queue a job and return it at once; raises QueueFull when too many jobs are waiting"""
+        job = Job(self.stages, job_input)
+        with self._lock:
+            waiting = sum(1 for queued in self._jobs.values() if queued.status == "queued")
+            if waiting >= self.max_queued:
+                raise QueueFull(f"{waiting} reports are already waiting")
+            self._jobs[job.id] = job
+            self._forget_old()
+        job._record("queued")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def events(self, job, after=-1, timeout=15.0):
+        """Yield the job's events after sequence number `after` as they happen, until it is done.
+
+        Yields None whenever `timeout` seconds pass without an event, so a
+        caller streaming to a client can send a keep-alive.
+        """
+        position = after + 1
+        while True:
+            with job._changed:
+                if position >= len(job.events) and not job.done:
+                    job._changed.wait(timeout)
+                new = job.events[position:]
+                finished = job.done
+            position += len(new)
+            if new:
+                yield from new
+            elif not finished:
+                yield None
+            if finished and position >= len(job.events):
+                return
+
+    def _run(self, job):
+        with job._changed:
+            job.status = "running"
+        job._record("started")
+        # One thread per stage: a stage waits for its inputs before it does any work
+        with ThreadPoolExecutor(max_workers=len(self.stages), thread_name_prefix=f"job-{job.id[:8]}") as pool:
+            futures = {}
+            for stage in self.stages:
+                futures[stage.name] = pool.submit(self._run_stage, job, stage, [futures[n] for n in stage.needs])
+        with job._changed:
+            failed = any(stage["status"] != "done" for stage in job.stages.values())
+            job.status = "failed" if failed else "done"
+            job.finished = time.time()
+        job._record(job.status, seconds=job.finished - job.created)
+
+    def _run_stage(self, job, stage, needs):
+        """Run one stage once its inputs are ready; returns whether it succeeded"""
+        if not all(need.result() for need in needs):
+            self._update(job, stage.name, status="skipped")
+            job._record("stage", stage=stage.name, status="skipped")
+            return False
+        self._update(job, stage.name, status="running")
+        job._record("stage", stage=stage.name, status="running")
+        began = time.perf_counter()
+        try:
+            with job._changed:
+                inputs = dict(job.results)
+            results = stage.run(job.input, inputs) or {}
+        except Exception as e:
+            logger.exception("Stage %s of job %s failed", stage.name, job.id)
+            self._update(job, stage.name, status="failed", seconds=time.perf_counter() - began, error=str(e))
+            job._record("stage", stage=stage.name, status="failed", error=str(e))
+            return False
+        seconds = time.perf_counter() - began
+        with job._changed:
+            job.results.update(results)
+        self._update(job, stage.name, status="done", seconds=seconds)
+        # Results starting with "_" (such as the full text) are for other stages, not for clients
+        job._record("stage", stage=stage.name, status="done", seconds=seconds,
+                    results={key: value for key, value in results.items() if not key.startswith("_")})
+        return True
+
+    def _update(self, job, name, **changes):
+        with job._changed:
+            job.stages[name].update(changes)
+
+    def _forget_old(self):
+        """Drop the oldest finished jobs beyond `keep` (caller holds the lock)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep)]:
+            job = self._jobs.pop(job_id)
+            if self.on_forget:
+                self.on_forget(job)
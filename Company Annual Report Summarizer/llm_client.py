@@ -0,0 +1,236 @@
+"""Shared model client and on-disk response cache for the summarizer.
+
+get_client() hands out one Gemini client per model and process: genai is
+configured once and the model object, with its connections, is reused by
+every request. All calls run on a single long-lived event loop thread
+(see run()), because the async connections belong to the loop that opened
+them. A fresh asyncio.run() per request would open new ones every time.
+
+Responses are cached on disk under SHA-256(model name, prompt version,
+prompt), so a report uploaded again costs no model calls. Entries expire
+after a TTL, and the least recently used ones are evicted once the cache
+outgrows its size limit. Cache reads and writes run in the loop's thread
+pool, so file IO never holds up the model calls in flight.
+
+    python llm_client.py "temp/apple 2024 annual re 62 pages.pdf" --stub-latency 1.0
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from config import API_KEY
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAME = "gemini-1.5-flash"
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(BASE_DIR, ".llm_cache"))
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MB", "256")) * 1024 * 1024)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_models = {}
+_caches = {}
+_loop = None
+
+def run(coroutine):
+    """Run a coroutine on the process's shared event loop and wait for its result"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+class GeminiClient:
+    """Gemini model behind the async generate() interface"""
+
+    def __init__(self, model_name=MODEL_NAME, api_key=API_KEY):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+class ResponseCache:
+    """Prompt -> response files under `root`, with a TTL and an LRU size limit"""
+
+    def __init__(self, root=CACHE_DIR, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(os.path.getsize(os.path.join(root, name)) for name in os.listdir(root)
+                         if name.endswith(".json"))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self._remove(path)
+            with self._lock:
+                self._size -= size
+                self.expired += 1
+                self.misses += 1
+            return None
+        try:
+            # mtime is the entry's last use, which eviction goes by
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key, response, model_name=None):
+        path = self._path(key)
+        temp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temp_path, "w") as f:
+            json.dump({"created": time.time(), "model": model_name, "response": response}, f)
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            # An entry written again (after expiry, or by two jobs at once) replaces the old file
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits (caller holds the lock)"""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes:
+                break
+            self._remove(path)
+            self._size -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired,
+                    "hit_rate": self.hits / lookups if lookups else 0.0, "bytes": self._size}
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class CachedClient:
+    """Any async generate() client with responses served from a ResponseCache"""
+
+    def __init__(self, client, cache, prompt_version=1):
+        self.client = client
+        self.cache = cache
+        self.prompt_version = prompt_version
+        self.model_name = client.model_name
+
+    def key(self, prompt):
+        text = f"{self.model_name}\n{self.prompt_version}\n{prompt}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def generate(self, prompt, limit=None):
+        """`limit`, an async context manager factory, wraps the model call only: cache hits skip it"""
+        key = self.key(prompt)
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, self.cache.get, key)
+        if response is None:
+            if limit is None:
+                response = await self.client.generate(prompt)
+            else:
+                async with limit():
+                    response = await self.client.generate(prompt)
+            try:
+                await loop.run_in_executor(None, self.cache.put, key, response, self.model_name)
+            except OSError as e:
+                logger.warning("Could not cache the model response: %s", e)
+        return response
+
+    def generate_text(self, prompt):
+        """Blocking generate() for synchronous callers"""
+        return run(self.generate(prompt))
+
+def get_model(model_name=MODEL_NAME):
+    """The process's GeminiClient for `model_name`, created on first use"""
+    with _lock:
+        if model_name not in _models:
+            _models[model_name] = GeminiClient(model_name)
+        return _models[model_name]
+
+def get_cache(root=CACHE_DIR):
+    with _lock:
+        if root not in _caches:
+            _caches[root] = ResponseCache(root)
+        return _caches[root]
+
+def get_client(model_name=MODEL_NAME, prompt_version=1):
+    """Shared, cached client for `model_name`; bump `prompt_version` when the prompts change"""
+    return CachedClient(get_model(model_name), get_cache(), prompt_version)
+
+def main():
+    from extraction_store import ExtractionStore
+    from summarizer import PROMPT_VERSION, StubClient, Summarizer
+
+    parser = argparse.ArgumentParser(description="Time a first and a repeat upload through the response cache")
+    parser.add_argument("pdf")
+    parser.add_argument("--stub-latency", type=float, default=1.0, help="seconds per stub model call")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="llm-cache-")
+    try:
+        stub = StubClient(args.stub_latency, jitter=args.stub_latency / 5)
+        client = CachedClient(stub, ResponseCache(cache_dir), PROMPT_VERSION)
+        for upload in ("first upload", "repeat upload"):
+            began = time.perf_counter()
+            calls_before = stub.calls
+            _, pages = ExtractionStore().extract(args.pdf)
+            extracted = time.perf_counter() - began
+            _, stats = run(Summarizer(client, max_concurrency=args.concurrency).summarize(pages))
+            print(f"{upload:<14} {time.perf_counter() - began:7.3f} s (extraction {extracted:.3f} s, "
+                  f"{stats['chunks']} chunks, {stats['calls']} calls, {stub.calls - calls_before} reached the model)")
+        print(f"Response cache: {client.cache.stats()}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
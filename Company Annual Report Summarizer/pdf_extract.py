@@ -0,0 +1,137 @@
+"""Parallel page-level text extraction for annual report PDFs.
+
+The pages are split into contiguous ranges and each range is extracted by a
+worker process that opens the PDF itself, so only page numbers and text
+cross process boundaries. Page texts come back in page order and are joined
+once at the end. Pages without text (blank or scanned) give an empty string
+instead of None, and every page reports how long it took.
+
+The process pool is shared by every extraction in the process. The first
+parallel extraction sets its size (REPORT_EXTRACT_WORKERS, or one worker per
+CPU, unless it asks for another count); it is shut down when the process exits.
+
+    python pdf_extract.py temp/*.pdf --workers 4
+"""
+import argparse
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+# Bump when a change to the extraction alters its output; cached texts of other versions are discarded
+EXTRACTION_VERSION = f"1-pdfplumber-{pdfplumber.__version__}"
+# Below this many pages a pool costs more than it saves
+MIN_PARALLEL_PAGES = 8
+# Ranges per worker: more ranges balance dense and sparse pages better, fewer reopen the PDF less
+RANGES_PER_WORKER = 3
+EXTRACT_WORKERS = int(os.getenv("REPORT_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def extract_text_from_pages(pdf_path, workers=None):
+    """Page texts and per-page stats of a PDF: (texts, stats). `workers=1` extracts in this process;
+    otherwise the shared pool is used and `workers` only sets how finely the pages are split."""
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    workers = workers or EXTRACT_WORKERS
+
+    if workers == 1 or page_count < MIN_PARALLEL_PAGES:
+        results = [_extract_range(pdf_path, 0, page_count)]
+    else:
+        pool = _get_pool(workers)
+        ranges = _page_ranges(page_count, max(workers, _pool_workers) * RANGES_PER_WORKER)
+        results = list(pool.map(_extract_range, [pdf_path] * len(ranges), *zip(*ranges)))
+
+    texts, stats = [], []
+    for range_texts, range_stats in results:
+        texts.extend(range_texts)
+        stats.extend(range_stats)
+    return texts, stats
+
+def extract_text(pdf_path, workers=None):
+    """Text of the whole PDF, one line break after every page"""
+    texts, _ = extract_text_from_pages(pdf_path, workers)
+    return "".join(f"{text}\n" for text in texts)
+
+def _page_ranges(page_count, parts):
+    """Split 0..page_count into at most `parts` contiguous (start, stop) ranges of near-equal size"""
+    parts = max(1, min(parts, page_count))
+    bounds = [round(i * page_count / parts) for i in range(parts + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+def _extract_range(pdf_path, start, stop):
+    texts, stats = [], []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            began = time.perf_counter()
+            try:
+                text = page.extract_text() or ""
+                error = None
+            except Exception as e:
+                # One broken page should not lose the rest of the report
+                text, error = "", str(e)
+            stats.append({
+                "page": page.page_number,
+                "seconds": time.perf_counter() - began,
+                "chars": len(text),
+                "image_only": not text.strip() and bool(page.images),
+                "error": error
+            })
+            texts.append(text)
+            # Drop the parsed layout of this page, long filings otherwise keep every page in memory
+            page.close()
+    return texts, stats
+
+def _get_pool(workers=EXTRACT_WORKERS):
+    """Process pool shared by all requests. The first call sizes it; it is never replaced while a job may use it."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def extract_text_sequential(pdf_path):
+    """The previous extraction: one page after another, appending to one string"""
+    text = ""
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            text += (page.extract_text() or "") + "\n"
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel PDF text extraction")
+    parser.add_argument("pdfs", nargs="*", help="PDF files (default: the PDFs in temp/ and uploads/)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    pdfs = args.pdfs or [os.path.join(base_dir, folder, name) for folder in ("temp", "uploads")
+                         for name in sorted(os.listdir(os.path.join(base_dir, folder))) if name.endswith(".pdf")]
+    for pdf_path in pdfs:
+        began = time.perf_counter()
+        old_text = extract_text_sequential(pdf_path)
+        old_seconds = time.perf_counter() - began
+
+        began = time.perf_counter()
+        texts, stats = extract_text_from_pages(pdf_path, args.workers)
+        new_seconds = time.perf_counter() - began
+        new_text = "".join(f"{text}\n" for text in texts)
+
+        slowest = max(stats, key=lambda page: page["seconds"])
+        print(f"{os.path.relpath(pdf_path, base_dir)}: {len(stats)} pages, {len(new_text):,} chars")
+        print(f"  sequential {old_seconds:6.1f} s   parallel {new_seconds:6.1f} s   "
+              f"speed-up {old_seconds / new_seconds:.2f}x   same text: {old_text == new_text}")
+        print(f"  page time mean {sum(page['seconds'] for page in stats) / len(stats) * 1000:.0f} ms, "
+              f"slowest page {slowest['page']} ({slowest['seconds'] * 1000:.0f} ms), "
+              f"{sum(not page['chars'] for page in stats)} without text, "
+              f"{sum(page['image_only'] for page in stats)} image-only")
+
+if __name__ == "__main__":
+    main()
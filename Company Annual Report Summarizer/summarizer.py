@@ -0,0 +1,263 @@
+"""Map-reduce summarization of long annual reports.
+
+The report is split into chunks that fit a token budget, breaking on page
+boundaries first, then on section headings ("Item 7.", "PART II") and
+blank lines, and on single lines only as a last resort. Each chunk is
+summarized concurrently (map). The partial summaries are combined into the
+final summary (reduce), in several rounds if they do not fit one prompt.
+
+Model calls go through a client object with an async `generate(prompt)`,
+by default the shared, cached Gemini client from llm_client.
+The number of calls in flight and the calls started per minute are both
+bounded per model and process (SUMMARY_MAX_CONCURRENCY and
+SUMMARY_REQUESTS_PER_MINUTE), however many reports are summarized at once.
+Responses served from the response cache take neither limit and are not
+counted as calls.
+A failed call is retried with exponential backoff, and a chunk that
+still fails is left out instead of failing the whole summary. StubClient
+answers locally with a set latency, so the pipeline can be timed offline:
+
+    python summarizer.py "temp/Netflix-10-K-01272025 84 pages.pdf" --stub-latency 1.0 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from llm_client import CachedClient, get_client, run
+
+CHUNK_TOKENS = 6000
+MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = int(os.getenv("SUMMARY_REQUESTS_PER_MINUTE", "0")) or None
+RETRIES = 3
+BACKOFF_SECONDS = 1.0
+# Part of every cached response's key: bump it when a prompt below changes
+PROMPT_VERSION = 1
+
+MAP_PROMPT = """
+    Ye ek company ki annual report ka hissa hai (part {part} of {parts}).
+    Is hisse ke important facts short mein nikaal: revenue, profit, growth, risks, guidance, big events.
+    Numbers exact rakh. Plain English sentences, koi intro nahi.
+
+    {text}
+"""
+
+REDUCE_PROMPT = """
+    Bhai, mujhe is annual report ka ek **chhota summary** de, lekin ek **desi doston ke liye mazedaar aur sarcastic** tone mein likh.
+    Thoda Hinglish daal, aur aise likh ki lagge koi **funny dost samjha raha ho**. Koi bullet points nahi, bas ek **masta flow wala paragraph** likh jo investor padhte hi maza le.
+    Neeche report ke alag alag hisson ke notes hain, inhi se summary bana:
+
+    {text}
+"""
+
+# Partial summaries merged in an intermediate reduce round, when they do not fit one prompt
+INTERMEDIATE_PROMPT = """
+    Ye ek annual report ke hisson ke notes hain. Inhe milaake ek short note bana, saare important numbers rakh.
+
+    {text}
+"""
+
+SECTION_HEADING = re.compile(r"^\s*(item\s+\d+[a-z]?\.|part\s+[ivx]+\b)", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+_limits_lock = threading.Lock()
+_limits = {}
+
+def estimate_tokens(text):
+    """Rough token count: about four characters per token for English prose"""
+    return len(text) // 4 + 1
+
+def _split_oversized(text, max_tokens):
+    """Pieces of `text` within `max_tokens`, split at headings, then blank lines, then lines"""
+    pieces, current, size = [], [], 0
+    for line in text.split("\n"):
+        tokens = estimate_tokens(line)
+        boundary = SECTION_HEADING.match(line) or not line.strip()
+        # Break at a heading or blank line once the piece is half full, anywhere once it would overflow
+        if current and (size + tokens > max_tokens or (boundary and size > max_tokens // 2)):
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        pieces.append("\n".join(current))
+    # A single line longer than the budget is cut by characters
+    limit = max_tokens * 4
+    return [piece[i:i + limit] for piece in pieces for i in range(0, max(len(piece), 1), limit)]
+
+def split_chunks(pages, max_tokens=CHUNK_TOKENS):
+    """Chunks of whole pages within `max_tokens`; `pages` is a list of page texts or one text"""
+    if isinstance(pages, str):
+        pages = [pages]
+    chunks, current, size = [], [], 0
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        parts = [page] if estimate_tokens(page) <= max_tokens else _split_oversized(page, max_tokens)
+        for part in parts:
+            tokens = estimate_tokens(part)
+            if current and size + tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(part)
+            size += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+class StubClient:
+    """Offline stand-in for a model: waits `latency` (+/- `jitter`) seconds and echoes the end of the prompt"""
+
+    def __init__(self, latency=0.5, jitter=0.0, failure_rate=0.0, seed=0):
+        self.model_name = "stub"
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def generate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+        if self._random.random() < self.failure_rate:
+            raise RuntimeError("stub model: simulated failure")
+        words = " ".join(prompt.split()[-60:])
+        return f"[stub summary of {estimate_tokens(prompt)} tokens] {words}"
+
+class RateLimiter:
+    """Spaces call starts so that at most `per_minute` start in any minute"""
+
+    def __init__(self, per_minute=None):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _shared_limits(model_name, max_concurrency, requests_per_minute):
+    """(semaphore, RateLimiter) shared by every summary of `model_name` on the running event loop"""
+    # asyncio primitives belong to the event loop they are used on, so the loop is part of the key
+    key = (asyncio.get_running_loop(), model_name, max_concurrency, requests_per_minute)
+    with _limits_lock:
+        if key not in _limits:
+            _limits[key] = (asyncio.Semaphore(max_concurrency), RateLimiter(requests_per_minute))
+        return _limits[key]
+
+class Summarizer:
+    def __init__(self, client, max_concurrency=MAX_CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 chunk_tokens=CHUNK_TOKENS, retries=RETRIES, backoff=BACKOFF_SECONDS):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.chunk_tokens = chunk_tokens
+        self.retries = retries
+        self.backoff = backoff
+
+    async def summarize(self, pages):
+        """Final summary and run stats of a report given as page texts (or one text)"""
+        began = time.perf_counter()
+        # Shared with concurrent summaries, so the limits hold for the whole process
+        self._semaphore, self._limiter = _shared_limits(self.client.model_name, self.max_concurrency,
+                                                        self.requests_per_minute)
+        self._stats = {"calls": 0, "retries": 0, "failed_chunks": 0}
+
+        chunks = split_chunks(pages, self.chunk_tokens)
+        if not chunks:
+            return "Summary not generated.", {**self._stats, "chunks": 0, "seconds": 0.0}
+        partials = await self._map(MAP_PROMPT, chunks)
+        if not partials:
+            raise RuntimeError(f"All {len(chunks)} chunks failed to summarize")
+        map_seconds = time.perf_counter() - began
+
+        # Reduce rounds until the notes fit one prompt
+        rounds = 0
+        while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > self.chunk_tokens:
+            groups = split_chunks(partials, self.chunk_tokens)
+            if len(groups) >= len(partials):
+                break
+            partials = await self._map(INTERMEDIATE_PROMPT, groups) or partials
+            rounds += 1
+        summary = await self._call(REDUCE_PROMPT.format(text="\n\n".join(partials)))
+        return summary, {**self._stats, "chunks": len(chunks), "reduce_rounds": rounds + 1,
+                         "map_seconds": map_seconds, "seconds": time.perf_counter() - began}
+
+    async def _map(self, template, chunks):
+        """Summaries of the chunks in order, leaving out chunks that failed every retry"""
+        async def one(part, chunk):
+            try:
+                return await self._call(template.format(text=chunk, part=part, parts=len(chunks)))
+            except Exception as e:
+                self._stats["failed_chunks"] += 1
+                logger.warning("Chunk %d of %d not summarized: %s", part, len(chunks), e)
+                return None
+        results = await asyncio.gather(*(one(part, chunk) for part, chunk in enumerate(chunks, 1)))
+        return [result for result in results if result]
+
+    async def _call(self, prompt):
+        for attempt in range(self.retries + 1):
+            try:
+                if isinstance(self.client, CachedClient):
+                    # Cache hits are answered without taking a slot or counting as a call
+                    return await self.client.generate(prompt, limit=self._model_call)
+                async with self._model_call():
+                    return await self.client.generate(prompt)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+            self._stats["retries"] += 1
+            # Backoff happens outside the semaphore, so waiting does not hold a slot
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    @contextlib.asynccontextmanager
+    async def _model_call(self):
+        """One call to the model: holds a concurrency slot and a rate limit turn, and is counted"""
+        async with self._semaphore:
+            await self._limiter.wait()
+            self._stats["calls"] += 1
+            yield
+
+def summarize(pages, client=None, **options):
+    """Blocking summarize() for synchronous callers such as Flask views: (summary, stats)"""
+    summarizer = Summarizer(client or get_client(prompt_version=PROMPT_VERSION), **options)
+    return run(summarizer.summarize(pages))
+
+def main():
+    from extraction_store import ExtractionStore
+
+    parser = argparse.ArgumentParser(description="Time map-reduce summarization of a report against a stub model")
+    parser.add_argument("pdf")
+    parser.add_argument("--stub-latency", type=float, default=1.0, help="seconds per stub model call")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests-per-minute", type=int, default=None)
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    args = parser.parse_args()
+
+    _, pages = ExtractionStore().extract(args.pdf)
+    print(f"{len(pages)} pages, ~{estimate_tokens(''.join(pages)):,} tokens, "
+          f"{len(split_chunks(pages, args.chunk_tokens))} chunks of up to {args.chunk_tokens:,} tokens")
+    for concurrency in args.concurrency:
+        client = StubClient(args.stub_latency, args.jitter, args.failure_rate)
+        _, stats = summarize(pages, client, max_concurrency=concurrency, requests_per_minute=args.requests_per_minute,
+                             chunk_tokens=args.chunk_tokens, backoff=0.1)
+        print(f"concurrency {concurrency:>2}: {stats['seconds']:6.2f} s ({stats['map_seconds']:.2f} s map), "
+              f"{stats['calls']} calls, {stats['retries']} retries, {stats['failed_chunks']} chunks lost")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, Patch
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from commodity_predictor import CommodityPredictor
+from figure_cache import FigureCache, normalize_events, normalize_selection, single_trace_change
+from forecasting import ForecastService
+from price_data import load_prices, load_report
+from price_history import PriceHistoryStore
+from price_stats import load_statistics
+import os
 import sys
+import time
 import traceback
 
 # Initialize the Dash app with better error handling
@@ -19,19 +27,53 @@ app = dash.Dash(
 try:
     # Load the data
     print("Loading data...")
-    df = pd.read_csv('commodity_prices[1].csv')
-    print("Data loaded successfully")
+    startup_began = time.perf_counter()
+    df = load_prices()
+    stats = load_report()
+    print(f"Data loaded successfully from {stats['source']} in {stats['seconds'] * 1000:.1f} ms")
 
-    # Initialize the predictor
+    # Initialize the predictor on the same frame and its cached statistics
     print("Initializing predictor...")
-    predictor = CommodityPredictor()
-    print("Predictor initialized successfully")
+    predictor = CommodityPredictor(df, statistics=load_statistics())
+    print(f"Predictor initialized successfully; start-up took {(time.perf_counter() - startup_began) * 1000:.1f} ms")
+
+    # Loads the saved forecast models; training only happens in the background, and the
+    # retrain poller starts with the first forecast request (see update_forecast)
+    forecast_service = ForecastService()
+
+    # High-frequency history ingested with price_history.py, if configured; otherwise the yearly data
+    hf_store = PriceHistoryStore(os.environ['COMMODITY_HF_STORE']) if os.getenv('COMMODITY_HF_STORE') else None
+    if hf_store is not None and not hf_store.commodities():
+        print(f"No price history in {hf_store.root}; showing yearly prices")
+        hf_store = None
+    historical_commodities = hf_store.commodities() if hf_store else predictor.commodities
+    HF_MAX_POINTS = int(os.getenv('COMMODITY_HF_MAX_POINTS', '2000'))
+
+    # Figures already built for a set of callback inputs, and historical traces per commodity and window
+    figure_cache = FigureCache()
+    trace_cache = FigureCache(maxsize=512)
 
 except Exception as e:
     print(f"Error during initialization: {str(e)}")
     traceback.print_exc()
     sys.exit(1)
 
+def statistics_table(statistics):
+    """Table of the per-commodity statistics, fastest-growing first"""
+    table = statistics.sort_values('cagr', ascending=False)
+    percent = lambda value: '' if pd.isna(value) else f"{value:.1f}%"
+    columns = {
+        'Commodity': table.index,
+        'Years': [f"{first:.0f}-{last:.0f}" for first, last in zip(table['first_year'], table['last_year'])],
+        'Latest Price': table['latest'].map(lambda value: f"{value:,.2f}"),
+        'CAGR': table['cagr'].map(percent),
+        'Trend / Year': table['trend'].map(percent),
+        'Mean Change': table['mean_change'].map(percent),
+        'Volatility': table['volatility'].map(percent),
+        'Max Drawdown': table['max_drawdown'].map(percent)
+    }
+    return dbc.Table.from_dataframe(pd.DataFrame(columns), striped=True, bordered=False, hover=True, size='sm')
+
 # Define the layout
 app.layout = dbc.Container([
     dbc.Row([
@@ -101,15 +143,71 @@ app.layout = dbc.Container([
                     dcc.Dropdown(
                         id='commodity-dropdown',
                         options=[{'label': col, 'value': col} 
-                                for col in df.columns if col != 'Year'],
-                        value=['Gold', 'Crude Oil', 'Wheat'],
+                                for col in historical_commodities],
+                        value=[col for col in ['Gold', 'Crude Oil', 'Wheat'] if col in historical_commodities]
+                              or historical_commodities[:3],
                         multi=True
                     ),
-                    dcc.Graph(id='historical-graph')
+                    dcc.Graph(id='historical-graph'),
+                    # The commodities and window the historical graph currently shows, for partial updates
+                    dcc.Store(id='historical-selection')
+                ])
+            ])
+        ])
+    ], className="mt-4"),
+
+    dbc.Row([
+        dbc.Col([
+            dbc.Card([
+                dbc.CardHeader("Price Correlations"),
+                dbc.CardBody([
+                    dcc.Dropdown(
+                        id='correlation-window',
+                        options=[{'label': 'Full history', 'value': 0}] +
+                                [{'label': f'Rolling {window} years', 'value': window}
+                                 for window in predictor.correlations.windows],
+                        value=0,
+                        clearable=False
+                    ),
+                    dcc.Slider(
+                        id='correlation-year',
+                        min=int(df['Year'].min()),
+                        max=int(df['Year'].max()),
+                        step=1,
+                        value=int(df['Year'].max()),
+                        marks={int(year): str(int(year)) for year in df['Year'] if int(year) % 10 == 0}
+                    ),
+                    dcc.Graph(id='correlation-graph')
                 ])
             ])
         ])
-    ], className="mt-4")
+    ], className="mt-4"),
+
+    dbc.Row([
+        dbc.Col([
+            dbc.Card([
+                dbc.CardHeader("Commodity Statistics"),
+                dbc.CardBody([
+                    # Computed once per version of the price file
+                    statistics_table(predictor.statistics)
+                ])
+            ])
+        ])
+    ], className="mt-4"),
+
+    dbc.Row([
+        dbc.Col([
+            dbc.Card([
+                dbc.CardHeader("Next-Year Forecast (Random Forest)"),
+                dbc.CardBody([
+                    html.Div(id='forecast-status', className="text-muted"),
+                    dcc.Graph(id='forecast-graph'),
+                    # Picks up a model retrained in the background
+                    dcc.Interval(id='forecast-interval', interval=30 * 1000)
+                ])
+            ])
+        ])
+    ], className="mt-4 mb-4")
 ])
 
 @app.callback(
@@ -126,67 +224,214 @@ def update_prediction(n_clicks, disasters, wars, policies):
         
         print(f"Predicting with parameters: disasters={disasters}, wars={wars}, policies={policies}")
         
-        # Get predictions from the model
-        predictions = predictor.predict(disasters, wars, policies)
-        
-        # Create the figure
-        fig = go.Figure()
-        
-        # Add bars for price changes
-        fig.add_trace(go.Bar(
-            x=list(predictions.keys()),
-            y=[change['change'] for change in predictions.values()],
-            text=[f"{change['change']:.1f}%" for change in predictions.values()],
-            textposition='auto',
-        ))
-        
-        fig.update_layout(
-            title='Predicted Price Changes',
-            xaxis_title='Commodity',
-            yaxis_title='Predicted Price Change (%)',
-            showlegend=False
-        )
-        
-        return fig
+        key = ('prediction', normalize_events(disasters), normalize_events(wars), normalize_events(policies))
+        return figure_cache.get_or_build(key, lambda: build_prediction_figure(*key[1:]))
     except Exception as e:
         print(f"Error in prediction: {str(e)}")
         traceback.print_exc()
         return go.Figure()
 
+def build_prediction_figure(disasters, wars, policies):
+    # Get predictions from the model
+    predictions = predictor.predict(disasters, wars, policies)
+
+    # Create the figure
+    fig = go.Figure()
+        
+    # Add bars for price changes
+    fig.add_trace(go.Bar(
+        x=list(predictions.keys()),
+        y=[change['change'] for change in predictions.values()],
+        text=[f"{change['change']:.1f}%" for change in predictions.values()],
+        textposition='auto',
+    ))
+
+    fig.update_layout(
+        title='Predicted Price Changes',
+        xaxis_title='Commodity',
+        yaxis_title='Predicted Price Change (%)',
+        showlegend=False
+    )
+
+    return fig
+
 @app.callback(
-    Output('historical-graph', 'figure'),
-    [Input('commodity-dropdown', 'value')]
+    [Output('historical-graph', 'figure'),
+     Output('historical-selection', 'data')],
+    [Input('commodity-dropdown', 'value'),
+     Input('historical-graph', 'relayoutData')],
+    [State('historical-selection', 'data')]
 )
-def update_historical(selected_commodities):
+def update_historical(selected_commodities, relayout, shown):
     try:
-        if not selected_commodities:
-            return go.Figure()
-        
-        print(f"Plotting historical data for: {selected_commodities}")
+        selection = normalize_selection(selected_commodities, historical_commodities)
+        if not selection:
+            return go.Figure(), {'commodities': [], 'window': None}
+
+        shown = shown or {}
+        shown_selection = shown.get('commodities')
+        # Only the high-frequency chart fetches new points on zoom and pan
+        window = zoom_window(relayout, shown.get('window')) if hf_store else None
+        state = {'commodities': list(selection), 'window': window}
+        if shown_selection == list(selection) and shown.get('window') == window:
+            return dash.no_update, dash.no_update
         
-        fig = go.Figure()
+        print(f"Plotting historical data for: {list(selection)}")
         
+        if shown_selection is not None and shown.get('window') == window:
+            # Adding or removing one commodity only sends that change
+            change = single_trace_change(shown_selection, selection)
+            if change is not None:
+                patch = Patch()
+                operation, target = change
+                if operation == 'append':
+                    patch['data'].append(historical_trace(target, window))
+                else:
+                    del patch['data'][target]
+                return patch, state
+        elif shown_selection == list(selection):
+            # Zoom or pan: only the points change, the layout stays as the user left it
+            patch = Patch()
+            for i, commodity in enumerate(selection):
+                trace = historical_trace(commodity, window)
+                patch['data'][i]['x'] = trace['x']
+                patch['data'][i]['y'] = trace['y']
+            return patch, state
+
+        key = ('historical', selection, tuple(window or ()))
+        return figure_cache.get_or_build(key, lambda: build_historical_figure(selection, window)), state
+    except Exception as e:
+        print(f"Error in historical graph: {str(e)}")
+        traceback.print_exc()
+        return go.Figure(), None
+
+def zoom_window(relayout, current):
+    """The x-axis window ([start, end], or None for everything) a relayout event leaves the chart at"""
+    if not relayout:
+        return current
+    if relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout:
+        return [str(relayout['xaxis.range[0]']), str(relayout['xaxis.range[1]'])]
+    if 'xaxis.range' in relayout:
+        return [str(bound) for bound in relayout['xaxis.range']]
+    return current
+
+def historical_trace(commodity, window=None):
+    # Built as a one-trace figure, so it is encoded exactly like the traces of a full figure
+    key = (commodity, tuple(window or ()))
+    figure = trace_cache.get_or_build(key, lambda: build_historical_figure([commodity], window))
+    return figure['data'][0]
+
+def build_historical_figure(selected_commodities, window=None):
+    fig = go.Figure()
+
+    if hf_store is not None:
+        # Downsampled to at most HF_MAX_POINTS per trace, at the resolution the window needs
+        start, end = window or (None, None)
         for commodity in selected_commodities:
-            fig.add_trace(go.Scatter(
-                x=df['Year'],
-                y=df[commodity],
-                name=commodity,
-                mode='lines+markers'
-            ))
-        
+            times, values, _ = hf_store.chart_series(commodity, start, end, HF_MAX_POINTS)
+            # Epoch milliseconds on a date axis travel as a compact binary array, unlike date strings
+            milliseconds = times.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+            fig.add_trace(go.Scatter(x=milliseconds, y=values, name=commodity, mode='lines'))
         fig.update_layout(
             title='Historical Price Trends',
-            xaxis_title='Year',
+            xaxis_title='Date',
+            xaxis_type='date',
             yaxis_title='Price',
-            showlegend=True
+            showlegend=True,
+            # Keeps the user's zoom when the figure is replaced
+            uirevision='historical'
         )
-        
+        if window:
+            fig.update_xaxes(range=window)
+        return fig
+
+    for commodity in selected_commodities:
+        fig.add_trace(go.Scatter(
+            x=df['Year'],
+            y=df[commodity],
+            name=commodity,
+            mode='lines+markers'
+        ))
+
+    fig.update_layout(
+        title='Historical Price Trends',
+        xaxis_title='Year',
+        yaxis_title='Price',
+        showlegend=True
+    )
+
+    return fig
+
+@app.callback(
+    Output('correlation-graph', 'figure'),
+    [Input('correlation-window', 'value'),
+     Input('correlation-year', 'value')]
+)
+def update_correlation(window, year):
+    try:
+        correlations = predictor.correlations
+        if window:
+            matrix = correlations.matrix(window, year)
+            title = f'Price Correlations, {window} Years to {year}'
+        else:
+            matrix = correlations.matrix()
+            title = 'Price Correlations, Full History'
+
+        fig = go.Figure(go.Heatmap(
+            z=matrix,
+            x=correlations.commodities,
+            y=correlations.commodities,
+            zmin=-1,
+            zmax=1,
+            colorscale='RdBu',
+            reversescale=True
+        ))
+        fig.update_layout(title=title, height=700)
         return fig
     except Exception as e:
-        print(f"Error in historical graph: {str(e)}")
+        print(f"Error in correlation graph: {str(e)}")
         traceback.print_exc()
         return go.Figure()
 
+@app.callback(
+    [Output('forecast-graph', 'figure'),
+     Output('forecast-status', 'children')],
+    [Input('forecast-interval', 'n_intervals')]
+)
+def update_forecast(n_intervals):
+    try:
+        # Started by the serving process, under a WSGI server too, but never by importing app
+        forecast_service.start()
+        model = forecast_service.model
+        if model is None:
+            status = "Training the forecast model..." if forecast_service.training else "No forecast model yet."
+            return go.Figure(), status
+
+        forecast = sorted(model.forecast.items(), key=lambda item: abs(item[1]), reverse=True)
+        fig = go.Figure(go.Bar(
+            x=[commodity for commodity, _ in forecast],
+            y=[change for _, change in forecast],
+            text=[f"{change:.1f}%" for _, change in forecast],
+            textposition='auto',
+        ))
+        fig.update_layout(
+            title='Forecast Price Change for Next Year',
+            xaxis_title='Commodity',
+            yaxis_title='Forecast Price Change (%)',
+            showlegend=False
+        )
+
+        status = f"Model {model.version}, trained on {model.rows:,} commodity-years"
+        if forecast_service.training:
+            status += " (retraining on new data)"
+        return fig, status
+    except Exception as e:
+        print(f"Error in forecast graph: {str(e)}")
+        traceback.print_exc()
+        return go.Figure(), "Forecast unavailable"
+
 if __name__ == '__main__':
     try:
         print("Starting server...")
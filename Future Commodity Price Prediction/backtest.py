@@ -0,0 +1,191 @@
+"""Walk-forward backtest of CommodityPredictor on the price history.
+
+For every cut-off year t, a predictor is fitted on the years up to t and its
+no-event prediction (the trend term) is compared with the actual change from
+t to t + 1, for every commodity. The metrics are set against a no-change
+forecast, so a skill above 0 means the trend beats assuming prices stay flat.
+
+Folds run in a process pool. Each worker loads the prices through
+price_data, which memory-maps the columnar cache, so the data is parsed once
+and shared through the page cache. Fold results are cached on disk under a
+key made of the model's source (the predictor and the price_stats and
+correlations modules it builds on) and a hash chain over the rows the fold
+reads (years up to t + 1). Editing a price therefore only recomputes the
+folds that can see it, and editing the model recomputes all of them.
+
+    python backtest.py --workers 4
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import commodity_predictor
+import correlations
+import price_data
+import price_stats
+
+# Every module whose code decides a fold's result; editing any of them invalidates the cache
+MODEL_MODULES = (commodity_predictor, price_stats, correlations)
+
+CACHE_DIR = os.getenv('COMMODITY_BACKTEST_CACHE', os.path.join(price_data.BASE_DIR, '.backtest_cache'))
+CACHE_FORMAT = 1
+MIN_TRAINING_YEARS = 10
+
+def fold_keys(prices, model_key):
+    """Cache key of the fold at every row position: model, columns and every row up to the next year"""
+    chain = hashlib.sha256(f"{CACHE_FORMAT}:{model_key}:{list(prices.columns)}".encode())
+    rows = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+    hashes = []
+    for row in rows:
+        chain.update(row.tobytes())
+        hashes.append(chain.hexdigest())
+    # Fold t reads rows 0..t + 1
+    return [hashes[t + 1] for t in range(len(rows) - 1)]
+
+def model_key():
+    """Hash of the model's source, impact factors included"""
+    digest = hashlib.sha256()
+    for module in MODEL_MODULES:
+        digest.update(f"{module.__name__}\n".encode())
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+class Backtest:
+    def __init__(self, path=None, cache_dir=CACHE_DIR, min_training_years=MIN_TRAINING_YEARS):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.min_training_years = min_training_years
+
+    def run(self, workers=None, use_cache=True):
+        """Run every fold (cached ones are read back) and return per-commodity metrics and timing"""
+        started = time.perf_counter()
+        prices = _sorted(price_data.load_prices(self.path))
+        commodities = [column for column in prices.columns if column != 'Year']
+        keys = fold_keys(prices, model_key())
+        positions = range(self.min_training_years - 1, len(prices) - 1)
+
+        folds = {}
+        for t in positions:
+            fold = self._read(keys[t]) if use_cache else None
+            if fold is not None and fold['commodities'] == commodities:
+                folds[t] = fold
+        cached = len(folds)
+        pending = [t for t in positions if t not in folds]
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(pending) <= 1:
+            _init_worker(self.path)
+            computed = map(_run_fold, pending)
+            folds.update(zip(pending, computed))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self.path,)) as pool:
+                folds.update(zip(pending, pool.map(_run_fold, pending)))
+        for t in pending:
+            self._write(keys[t], folds[t])
+
+        predicted = np.array([folds[t]['predicted'] for t in positions], dtype=np.float64)
+        actual = np.array([folds[t]['actual'] for t in positions], dtype=np.float64)
+        return {
+            'folds': len(positions),
+            'computed': len(pending),
+            'cached': cached,
+            'first_cutoff': int(folds[positions[0]]['year']) if len(positions) else None,
+            'last_cutoff': int(folds[positions[-1]]['year']) if len(positions) else None,
+            'fold_seconds': sum(folds[t]['seconds'] for t in pending),
+            'seconds': time.perf_counter() - started,
+            'commodities': _metrics(commodities, predicted.reshape(-1, len(commodities)),
+                                    actual.reshape(-1, len(commodities)))
+        }
+
+    def _read(self, key):
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, fold):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            temp_path = f"{path}.tmp-{os.getpid()}"
+            with open(temp_path, 'w') as f:
+                json.dump(fold, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not cache backtest fold {fold['year']}: {e}")
+
+def _sorted(prices):
+    if 'Year' in prices and not prices['Year'].is_monotonic_increasing:
+        return prices.sort_values('Year', kind='stable').reset_index(drop=True)
+    return prices
+
+def _metrics(commodities, predicted, actual):
+    """Per-commodity error metrics over the folds where both the prediction and the outcome exist"""
+    usable = np.isfinite(predicted) & np.isfinite(actual)
+    folds = usable.sum(axis=0)
+    errors = np.where(usable, predicted - actual, 0.0)
+    naive = np.where(usable, np.abs(actual), 0.0)
+    hits = usable & (np.sign(predicted) == np.sign(actual))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mae = np.abs(errors).sum(axis=0) / folds
+        rmse = np.sqrt((errors ** 2).sum(axis=0) / folds)
+        bias = errors.sum(axis=0) / folds
+        naive_mae = naive.sum(axis=0) / folds
+        direction = hits.sum(axis=0) / folds
+        skill = 1 - mae / naive_mae
+    return {commodity: {'folds': int(folds[j]), 'mae': float(mae[j]), 'rmse': float(rmse[j]),
+                        'bias': float(bias[j]), 'naive_mae': float(naive_mae[j]), 'skill': float(skill[j]),
+                        'direction': float(direction[j])}
+            for j, commodity in enumerate(commodities)}
+
+_prices = None
+
+def _init_worker(path):
+    global _prices
+    _prices = _sorted(price_data.load_prices(path))
+
+def _run_fold(t):
+    """Fit on rows 0..t and compare the no-event prediction with the change from row t to t + 1"""
+    started = time.perf_counter()
+    predictor = commodity_predictor.CommodityPredictor(_prices.iloc[:t + 1])
+    predicted = predictor.predict_many(np.zeros((1, len(predictor.events))))[0]
+    filled = _prices[predictor.commodities].iloc[:t + 2].ffill().to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        actual = (filled[t + 1] / filled[t] - 1) * 100
+    return {
+        'year': int(_prices['Year'].iloc[t]) if 'Year' in _prices else t,
+        'commodities': predictor.commodities,
+        # NaN (no prediction or no outcome) is stored as null
+        'predicted': [float(value) if np.isfinite(value) else None for value in predicted],
+        'actual': [float(value) if np.isfinite(value) else None for value in actual],
+        'seconds': time.perf_counter() - started
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the commodity predictor")
+    parser.add_argument('prices', nargs='?', default=None, help="price CSV (default: the dashboard's)")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--min-training-years', type=int, default=MIN_TRAINING_YEARS)
+    parser.add_argument('--no-cache', action='store_true', help="recompute every fold")
+    args = parser.parse_args()
+
+    result = Backtest(args.prices, min_training_years=args.min_training_years).run(args.workers,
+                                                                                    not args.no_cache)
+    print(f"{result['folds']} folds (cut-offs {result['first_cutoff']}-{result['last_cutoff']}): "
+          f"{result['computed']} computed, {result['cached']} cached, "
+          f"{result['fold_seconds']:.2f} s of fitting, {result['seconds']:.2f} s in total")
+    print(f"{'Commodity':<15}{'folds':>6}{'MAE':>8}{'RMSE':>8}{'bias':>8}{'no-chg':>8}{'skill':>8}{'dir':>7}")
+    for commodity, stats in sorted(result['commodities'].items(), key=lambda item: -item[1]['skill']):
+        print(f"{commodity:<15}{stats['folds']:>6}" + ''.join(f"{stats[key]:8.1f}" for key in
+                                                             ('mae', 'rmse', 'bias', 'naive_mae'))
+              + f"{stats['skill']:8.2f}{stats['direction']:7.0%}")
+
+if __name__ == '__main__':
+    main()
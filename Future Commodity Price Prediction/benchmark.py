@@ -0,0 +1,60 @@
+"""Latency and payload size of the dashboard callbacks, building figures vs the figure cache.
+
+    python benchmark.py [--repeats 200]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from plotly.io.json import to_json_plotly
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app
+
+def measure(call, repeats):
+    """Mean seconds per call() and the size of what Dash would send for its result"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = call()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            # Serialization is part of every response, so it is timed too
+            payload = to_json_plotly(call())
+        seconds = (time.perf_counter() - started) / repeats
+    return seconds, len(payload.encode('utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks")
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    selection = ['Gold', 'Crude Oil', 'Wheat', 'Silver', 'Maize']
+    events = (['drought', 'flood'], ['regional'], ['subsidies'])
+    shown = {'commodities': selection, 'window': None}
+    rows = [
+        ("Historical, figure built", lambda: app.build_historical_figure(selection)),
+        ("Historical, cached", lambda: app.update_historical(selection, None, None)[0]),
+        ("Historical, add one commodity", lambda: app.update_historical(selection + ['Tea'], None, shown)[0]),
+        ("Historical, remove one commodity", lambda: app.update_historical(selection[1:], None, shown)[0]),
+        ("Prediction, figure built", lambda: app.build_prediction_figure(*events)),
+        ("Prediction, cached", lambda: app.update_prediction(1, *events))
+    ]
+    if app.hf_store is not None:
+        # With COMMODITY_HF_STORE set, the historical chart comes from the high-frequency store
+        hf_selection = app.historical_commodities[:3]
+        days = app.hf_store.level(hf_selection[0], 'day')[0]
+        week = [str(days[0].astype('datetime64[ns]')), str(days[min(7, len(days) - 1)].astype('datetime64[ns]'))]
+        shown_full = {'commodities': hf_selection, 'window': None}
+        zoom = {'xaxis.range[0]': week[0], 'xaxis.range[1]': week[1]}
+        rows = [
+            ("High-frequency, figure built", lambda: app.build_historical_figure(hf_selection)),
+            ("High-frequency, zoom built", lambda: app.build_historical_figure(hf_selection, week)),
+            ("High-frequency, zoom, cached", lambda: app.update_historical(hf_selection, zoom, shown_full)[0])
+        ] + rows[4:]
+    print(f"{'Callback':<34}{'latency':>12}{'payload':>12}")
+    for name, call in rows:
+        seconds, size = measure(call, args.repeats)
+        print(f"{name:<34}{seconds * 1e6:>9.0f} us{size:>8,} B")
+
+if __name__ == '__main__':
+    main()
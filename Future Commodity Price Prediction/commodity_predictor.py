@@ -1,12 +1,18 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestRegressor
+from correlations import CorrelationService
+from price_data import load_prices
+from price_stats import compute_statistics, load_statistics
+
+# Event groups, in the order predict() takes them
+EVENT_TYPES = ('natural_disasters', 'wars', 'policies')
 
 class CommodityPredictor:
-    def __init__(self):
-        # Load historical data
-        self.df = pd.read_csv('commodity_prices[1].csv')
+    def __init__(self, df=None, statistics=None):
+        # Historical data, shared with the dashboard when it passes its frame in; the cached
+        # statistics belong to the price file, so they are only used with its frame
+        self.df = load_prices() if df is None else df
+        self.statistics = load_statistics() if df is None and statistics is None else statistics
         self.commodities = [col for col in self.df.columns if col != 'Year']
         
         # Define impact factors for different events
@@ -58,66 +64,65 @@ class CommodityPredictor:
     
     def initialize_model(self):
         """Initialize and train the prediction model using historical data"""
-        # Calculate year-over-year changes
-        self.price_changes = {}
-        for commodity in self.commodities:
-            # Use ffill() instead of fillna(method='ffill')
-            filled_data = self.df[commodity].ffill()
-            changes = filled_data.pct_change(fill_method=None) * 100
-            self.price_changes[commodity] = changes.mean()
+        # Mean year-over-year change of every commodity, from the statistics table
+        if self.statistics is None:
+            self.statistics = compute_statistics(self.df)
+        self.price_changes = self.statistics['mean_change'].to_dict()
+        self.compile_impacts()
+        self.correlations = CorrelationService(self.df)
     
+    def compile_impacts(self):
+        """Compile impact_factors into an event x commodity matrix and the trend term into a bias vector"""
+        self.events = [(event_type, event) for event_type in EVENT_TYPES
+                       for event in self.impact_factors[event_type]]
+        self.event_index = {event: i for i, event in enumerate(self.events)}
+        column = {commodity: j for j, commodity in enumerate(self.commodities)}
+
+        self.impact_matrix = np.zeros((len(self.events), len(self.commodities)))
+        for i, (event_type, event) in enumerate(self.events):
+            for commodity, impact in self.impact_factors[event_type][event].items():
+                if commodity in column:
+                    self.impact_matrix[i, column[commodity]] = impact
+        self.trend_bias = np.array([self.price_changes.get(commodity, 0) * 0.2 for commodity in self.commodities])
+
+    def encode_scenarios(self, scenarios):
+        """Multi-hot matrix (scenarios x events) for a list of (disasters, wars, policies) tuples.
+
+        An event listed twice counts twice, as it does in predict(); unknown
+        events are ignored.
+        """
+        encoded = np.zeros((len(scenarios), len(self.events)))
+        for row, scenario in enumerate(scenarios):
+            for event_type, events in zip(EVENT_TYPES, scenario):
+                for event in events or ():
+                    i = self.event_index.get((event_type, event))
+                    if i is not None:
+                        encoded[row, i] += 1
+        return encoded
+
+    def predict_many(self, scenarios):
+        """Price changes (%) of every commodity for a batch of scenarios.
+
+        `scenarios` is a multi-hot matrix with one column per entry of
+        self.events (see encode_scenarios). Returns a scenarios x commodities
+        matrix whose columns follow self.commodities.
+        """
+        return np.asarray(scenarios, dtype=np.float64) @ self.impact_matrix + self.trend_bias
+
     def predict(self, disasters=None, wars=None, policies=None):
         """Predict price changes based on input events"""
-        predictions = {}
-        
-        # Initialize with base changes
-        for commodity in self.commodities:
-            predictions[commodity] = {'change': 0}
-        
-        # Add impact of natural disasters
-        if disasters:
-            for disaster in disasters:
-                if disaster in self.impact_factors['natural_disasters']:
-                    impacts = self.impact_factors['natural_disasters'][disaster]
-                    for commodity, impact in impacts.items():
-                        if commodity in predictions:
-                            predictions[commodity]['change'] += impact
-        
-        # Add impact of wars
-        if wars:
-            for war in wars:
-                if war in self.impact_factors['wars']:
-                    impacts = self.impact_factors['wars'][war]
-                    for commodity, impact in impacts.items():
-                        if commodity in predictions:
-                            predictions[commodity]['change'] += impact
-        
-        # Add impact of policies
-        if policies:
-            for policy in policies:
-                if policy in self.impact_factors['policies']:
-                    impacts = self.impact_factors['policies'][policy]
-                    for commodity, impact in impacts.items():
-                        if commodity in predictions:
-                            predictions[commodity]['change'] += impact
-        
-        # Add historical trend component
-        for commodity in self.commodities:
-            predictions[commodity]['change'] += self.price_changes.get(commodity, 0) * 0.2
-        
-        # Filter out commodities with no significant change
-        predictions = {k: v for k, v in predictions.items() 
-                      if abs(v['change']) > 0.5}
-        
-        # Sort by absolute change
-        predictions = dict(sorted(predictions.items(), 
-                                key=lambda x: abs(x[1]['change']), 
-                                reverse=True))
-        
-        return predictions
+        changes = self.predict_many(self.encode_scenarios([(disasters, wars, policies)]))[0]
+
+        # Keep commodities with a significant change, largest first
+        significant = np.flatnonzero(np.abs(changes) > 0.5)
+        order = significant[np.argsort(-np.abs(changes[significant]), kind='stable')]
+        return {self.commodities[j]: {'change': changes[j]} for j in order}
 
     def get_historical_correlation(self, commodity1, commodity2):
-        """Calculate historical correlation between two commodities"""
+        """Historical correlation between two commodities, looked up in the precomputed matrix"""
+        if commodity1 in self.correlations.index and commodity2 in self.correlations.index:
+            return self.correlations.pair(commodity1, commodity2)
+        # Year is not in the matrix but correlates like any other column, as it always has
         if commodity1 in self.df.columns and commodity2 in self.df.columns:
             return self.df[commodity1].corr(self.df[commodity2])
         return 0 
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Pairwise price correlations of all commodities, full-history and rolling.
+
+Correlations are computed from running sufficient statistics per pair,
+over the years in which both commodities have a price (like Series.corr).
+The statistics are the overlap count, the sums, the sums of squares and the
+cross products. Missing early years, e.g. for Coal and Lamb, only drop out
+of the pairs they belong to. All pairs come from a few masked matrix
+products, and the rolling windows for every end year come from cumulative
+sums of the same per-year terms.
+
+Appending a year adds its terms to the full-history statistics and moves
+each rolling window on by one year, in O(commodities^2). Matrices are stored
+ready-made, so pair lookups are constant time.
+"""
+import threading
+
+import numpy as np
+
+DEFAULT_WINDOWS = (10, 20)
+
+def _year_terms(rows):
+    """Per-year (count, sum, sum of squares, cross product) terms, each years x n x n"""
+    present = np.isfinite(rows).astype(np.float64)
+    values = np.where(present > 0, rows, 0.0)
+    return (np.einsum('ti,tj->tij', present, present),
+            np.einsum('ti,tj->tij', values, present),
+            np.einsum('ti,tj->tij', values ** 2, present),
+            np.einsum('ti,tj->tij', values, values))
+
+def _correlation(stats, min_periods):
+    """Correlation matrix from (count, sum, sum of squares, cross product) matrices.
+
+    Entry [i, j] of the sum matrices covers commodity i over the years it
+    shares with j, so the transposes give the partner's side of each pair.
+    """
+    count, sums, squares, cross = stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = cross - sums * sums.T / count
+        variance = squares - sums ** 2 / count
+        correlation = covariance / np.sqrt(variance * variance.T)
+    # Variances at rounding-error level mean a constant series: no correlation defined
+    degenerate = ~(variance > 1e-12 * squares) | ~(variance.T > 1e-12 * squares.T)
+    correlation[(count < max(min_periods, 2)) | degenerate] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+class CorrelationService:
+    def __init__(self, prices, windows=DEFAULT_WINDOWS, min_periods=3):
+        """`prices` has one column per commodity (and optionally Year), one row per year.
+        Rolling windows need `min_periods` shared years to give a correlation."""
+        self.years = list(prices['Year']) if 'Year' in prices else list(range(len(prices)))
+        self._positions = {year: t for t, year in enumerate(self.years)}
+        prices = prices.drop(columns=['Year'], errors='ignore')
+        self.commodities = list(prices.columns)
+        self.index = {commodity: i for i, commodity in enumerate(self.commodities)}
+        self.windows = tuple(windows)
+        self.min_periods = min_periods
+        self._lock = threading.Lock()
+
+        rows = prices.to_numpy(dtype=np.float64)
+        # Correlation ignores shifts; centring each column keeps the running sums well-conditioned
+        present = np.isfinite(rows)
+        self._offset = np.nansum(rows, axis=0) / np.maximum(present.sum(axis=0), 1)
+        self._rows = list(rows - self._offset)
+
+        terms = _year_terms(rows - self._offset)
+        cumulative = [np.cumsum(term, axis=0) for term in terms]
+        self._full = tuple(c[-1] if len(rows) else np.zeros((len(self.commodities),) * 2) for c in cumulative)
+        self.full = _correlation(self._full, 1)
+
+        # window -> current window statistics, and one matrix per end year
+        self._window_stats = {}
+        self.rolling = {}
+        for window in self.windows:
+            window_stats = [c.copy() for c in cumulative]
+            for stat, c in zip(window_stats, cumulative):
+                stat[window:] -= c[:-window]
+            self._window_stats[window] = tuple(stat[-1] for stat in window_stats) if len(rows) else self._full
+            self.rolling[window] = [_correlation(tuple(stat[t] for stat in window_stats), min_periods)
+                                    for t in range(len(rows))]
+
+    def append(self, year, prices):
+        """Add one year of prices ({commodity: price}; missing commodities count as missing)"""
+        row = np.array([prices.get(commodity, np.nan) for commodity in self.commodities], dtype=np.float64)
+        row -= self._offset
+        added = tuple(term[0] for term in _year_terms(row[None, :]))
+        with self._lock:
+            self._full = tuple(total + term for total, term in zip(self._full, added))
+            self.full = _correlation(self._full, 1)
+            for window in self.windows:
+                stats = tuple(total + term for total, term in zip(self._window_stats[window], added))
+                if len(self._rows) >= window:
+                    leaving = _year_terms(self._rows[-window][None, :])
+                    stats = tuple(total - term[0] for total, term in zip(stats, leaving))
+                self._window_stats[window] = stats
+                self.rolling[window].append(_correlation(stats, self.min_periods))
+            self._rows.append(row)
+            self._positions[year] = len(self.years)
+            self.years.append(year)
+
+    def matrix(self, window=None, year=None):
+        """Full-history matrix, or the `window`-year rolling matrix ending at `year` (default: latest)"""
+        if window is None:
+            return self.full
+        if window not in self.rolling:
+            raise ValueError(f"No {window}-year rolling window; available: {', '.join(map(str, self.windows))}")
+        position = len(self.years) - 1 if year is None else self._positions[year]
+        return self.rolling[window][position]
+
+    def pair(self, commodity1, commodity2, window=None, year=None):
+        """Correlation of two commodities; NaN if they do not overlap enough, KeyError if unknown"""
+        return float(self.matrix(window, year)[self.index[commodity1], self.index[commodity2]])
@@ -0,0 +1,71 @@
+"""Bounded LRU cache of dashboard figures, stored ready to send.
+
+A cached figure is the plain dict Dash would otherwise produce by
+validating and serializing a plotly Figure on every callback. Returning it
+skips building the figure altogether, and Dash only has to JSON-encode
+lists and strings.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+
+class FigureCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """The figure cached under `key`, or build() converted with figure_dict() and cached"""
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+
+        # Built outside the lock; two callbacks racing on one key just build it twice
+        figure = figure_dict(build())
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+        return figure
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._figures), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+def figure_dict(fig):
+    """A plotly figure or trace as plain JSON types (numpy arrays become lists, NaN becomes None)"""
+    return json.loads(to_json_plotly(fig))
+
+def normalize_events(values):
+    """Dropdown events as a cache key: the order events are picked in does not change a prediction"""
+    return tuple(sorted(set(values or ())))
+
+def normalize_selection(values, known):
+    """Commodity selection as a cache key: trace order is kept, duplicates and unknown names dropped"""
+    seen = set()
+    return tuple(value for value in values or () if value in known and not (value in seen or seen.add(value)))
+
+def single_trace_change(shown, selected):
+    """('append', name) or ('delete', index) if `selected` differs from `shown` by one trace, else None"""
+    if shown is None:
+        return None
+    shown, selected = tuple(shown), tuple(selected)
+    if len(selected) == len(shown) + 1 and selected[:-1] == shown:
+        return 'append', selected[-1]
+    if len(selected) == len(shown) - 1:
+        for i, name in enumerate(shown):
+            if shown[:i] + shown[i + 1:] == selected:
+                return 'delete', i
+    return None
@@ -0,0 +1,213 @@
+"""Next-year price change forecasts from a random forest per commodity.
+
+Features are built for every commodity and year at once from the wide price
+frame: lagged yearly % changes, rolling means and volatility of the changes,
+and the price relative to its 5-year average and to its running peak. The
+target is the following year's % change. Each commodity gets its own
+StandardScaler + RandomForestRegressor pipeline; the commodities are trained
+in parallel with joblib (`n_jobs`).
+
+The fitted models are saved to models/forecast.joblib together with the key
+of the data they were trained on (see price_data.cache_key), and loaded at
+start-up. ForecastService retrains in a background thread when the price file
+changes and keeps serving the previous model until the new one is ready.
+
+    python forecasting.py [--n-jobs 4]
+"""
+import argparse
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+import price_data
+
+DEFAULT_ARTIFACT = os.getenv('COMMODITY_FORECAST_MODEL', os.path.join(price_data.BASE_DIR, 'models', 'forecast.joblib'))
+FEATURES = ('change', 'change_lag1', 'change_lag2', 'mean_3', 'mean_5', 'volatility_5', 'vs_mean_5', 'vs_peak')
+MIN_TRAINING_ROWS = 10
+ARTIFACT_FORMAT = 1
+
+def yearly_changes(prices):
+    """Year-over-year % changes of every commodity, carrying prices over gaps"""
+    return prices.ffill().pct_change(fill_method=None) * 100
+
+def build_features(prices):
+    """(years x commodities x FEATURES) feature array and (years x commodities) next-year % change targets.
+
+    `prices` holds one column per commodity and one row per year. Row t of
+    the features only uses prices up to year t; the target of row t is the
+    change from t to t + 1 (NaN for the last year).
+    """
+    filled = prices.ffill()
+    changes = yearly_changes(prices)
+    mean_5 = filled.rolling(5, min_periods=3).mean()
+    columns = {
+        'change': changes,
+        'change_lag1': changes.shift(1),
+        'change_lag2': changes.shift(2),
+        'mean_3': changes.rolling(3, min_periods=2).mean(),
+        'mean_5': changes.rolling(5, min_periods=3).mean(),
+        'volatility_5': changes.rolling(5, min_periods=3).std(),
+        'vs_mean_5': (filled / mean_5 - 1) * 100,
+        'vs_peak': (filled / filled.cummax() - 1) * 100
+    }
+    features = np.stack([columns[name].to_numpy(dtype=np.float64) for name in FEATURES], axis=-1)
+    return features, changes.shift(-1).to_numpy(dtype=np.float64)
+
+def _fit_commodity(features, target, seed):
+    usable = np.isfinite(features).all(axis=1) & np.isfinite(target)
+    if usable.sum() < MIN_TRAINING_ROWS:
+        return None
+    model = make_pipeline(StandardScaler(),
+                          RandomForestRegressor(n_estimators=100, min_samples_leaf=3, random_state=seed, n_jobs=1))
+    model.fit(features[usable], target[usable])
+    return model
+
+class ForecastModel:
+    """One fitted pipeline per commodity plus the next-year forecast of the data it was trained on"""
+
+    def __init__(self, models, data_key, forecast, rows, seconds):
+        self.models = models
+        self.data_key = data_key
+        self.forecast = forecast
+        self.rows = rows
+        self.training_seconds = seconds
+        self.trained_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    @property
+    def version(self):
+        return f"{self.data_key[:12]}@{self.trained_at}"
+
+    @classmethod
+    def train(cls, prices, data_key, n_jobs=-1, seed=0):
+        """Fit every commodity column of `prices` (a Year column, if present, is ignored)"""
+        started = time.perf_counter()
+        prices = prices.drop(columns=['Year'], errors='ignore')
+        commodities = list(prices.columns)
+        features, targets = build_features(prices)
+        fitted = Parallel(n_jobs=n_jobs)(delayed(_fit_commodity)(features[:, j], targets[:, j], seed)
+                                         for j in range(len(commodities)))
+        models = {commodity: model for commodity, model in zip(commodities, fitted) if model is not None}
+        # Forecast from the latest year whose features are complete
+        forecast = {}
+        for j, commodity in enumerate(commodities):
+            complete = np.flatnonzero(np.isfinite(features[:, j]).all(axis=1))
+            if commodity in models and len(complete):
+                forecast[commodity] = float(models[commodity].predict(features[complete[-1:], j])[0])
+        rows = int(np.isfinite(targets).sum())
+        return cls(models, data_key, forecast, rows, time.perf_counter() - started)
+
+    def predict(self, prices):
+        """Next-year % change per commodity from the latest year of `prices`"""
+        prices = prices.drop(columns=['Year'], errors='ignore')
+        features, _ = build_features(prices)
+        forecast = {}
+        for j, commodity in enumerate(prices.columns):
+            if commodity in self.models and np.isfinite(features[-1, j]).all():
+                forecast[commodity] = float(self.models[commodity].predict(features[-1:, j])[0])
+        return forecast
+
+    def save(self, path=DEFAULT_ARTIFACT):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{os.getpid()}"
+        # Saved as a plain dict, so the artifact does not depend on where this class was imported from
+        joblib.dump({'format': ARTIFACT_FORMAT, **vars(self)}, temp_path)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_ARTIFACT):
+        state = joblib.load(path)
+        if state.pop('format', None) != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported forecast model artifact in {path}")
+        model = cls.__new__(cls)
+        model.__dict__.update(state)
+        return model
+
+class ForecastService:
+    """Serves the latest ForecastModel and retrains it in the background when the price file changes"""
+
+    def __init__(self, path=None, artifact_path=DEFAULT_ARTIFACT, n_jobs=-1):
+        self.path = path
+        self.artifact_path = artifact_path
+        self.n_jobs = n_jobs
+        self.model = None
+        self.error = None
+        self._training = None
+        self._lock = threading.Lock()
+        self._poller = None
+        self._start_lock = threading.Lock()
+        if os.path.exists(artifact_path):
+            try:
+                self.model = ForecastModel.load(artifact_path)
+            except Exception as e:
+                print(f"Could not load the forecast model from {artifact_path}: {e}")
+
+    @property
+    def training(self):
+        return self._training is not None and self._training.is_alive()
+
+    def refresh(self):
+        """Start background training if the served model was not trained on the current data"""
+        data_key = price_data.cache_key(self.path)
+        with self._lock:
+            if (self.model is not None and self.model.data_key == data_key) or self.training:
+                return False
+            self._training = threading.Thread(target=self._train, args=(data_key,), name='forecast-training',
+                                              daemon=True)
+            self._training.start()
+            return True
+
+    def _train(self, data_key):
+        try:
+            prices = price_data.load_prices(self.path, refresh=True)
+            model = ForecastModel.train(prices, data_key, self.n_jobs)
+            model.save(self.artifact_path)
+            # Requests in flight keep the model they already read
+            self.model = model
+            self.error = None
+            print(f"Forecast model {model.version} trained in {model.training_seconds:.1f} s")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Forecast training failed: {e}")
+
+    def start(self, poll_interval=60.0):
+        """Check for new data now and then every `poll_interval` seconds; once started, calls return at once"""
+        if self._poller is not None:
+            return self
+        with self._start_lock:
+            if self._poller is None:
+                self.refresh()
+                self._poller = threading.Thread(target=self._poll, args=(poll_interval,), name='forecast-poller',
+                                                daemon=True)
+                self._poller.start()
+        return self
+
+    def _poll(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Could not check the price file: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the next-year commodity forecast models")
+    parser.add_argument('prices', nargs='?', default=None, help="price CSV (default: the dashboard's)")
+    parser.add_argument('--model', default=DEFAULT_ARTIFACT, help="artifact path")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="commodities trained in parallel (-1: all cores)")
+    args = parser.parse_args()
+
+    model = ForecastModel.train(price_data.load_prices(args.prices), price_data.cache_key(args.prices), args.n_jobs)
+    model.save(args.model)
+    print(f"Trained {len(model.models)} commodity models on {model.rows:,} rows in {model.training_seconds:.1f} s")
+    for commodity, change in sorted(model.forecast.items(), key=lambda item: -abs(item[1])):
+        print(f"{commodity:<15}{change:8.1f}%")
+
+if __name__ == '__main__':
+    main()
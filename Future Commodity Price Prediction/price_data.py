@@ -0,0 +1,174 @@
+"""Shared loading of the commodity price history.
+
+The CSV is parsed once into a columnar cache: one .npy file per column under
+.price_cache/, named after the SHA-256 of the source file. Later loads
+memory-map those files instead of parsing text, which keeps start-up and
+worker spawn time flat as the history grows. An index next to the cache
+records the source's mtime and size, so an unchanged file is recognised
+without hashing it. A file that was only touched is hashed once and then
+matches its existing cache again.
+
+Within a process, load_prices() returns the same frame to every caller, so
+the dashboard and the predictor share one copy.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV = os.getenv('COMMODITY_PRICES', os.path.join(BASE_DIR, 'commodity_prices[1].csv'))
+CACHE_DIR = os.getenv('COMMODITY_PRICE_CACHE', os.path.join(BASE_DIR, '.price_cache'))
+CACHE_FORMAT = 1
+
+# path -> (source SHA-256, frame)
+_frames = {}
+_lock = threading.Lock()
+
+# path -> {'source': 'memory' | 'cache' | 'csv', 'seconds': float} of its latest load
+_load_stats = {}
+
+def load_prices(path=None, refresh=False):
+    """The price history as a DataFrame, loaded once per process.
+
+    With `refresh`, the source file is checked first and a changed file is
+    loaded again; callers holding the old frame keep it unchanged.
+    """
+    path = os.path.abspath(path or DEFAULT_CSV)
+    started = time.perf_counter()
+    with _lock:
+        if path in _frames and not (refresh and _frames[path][0] != cache_key(path)):
+            _load_stats[path] = {'source': 'memory', 'seconds': time.perf_counter() - started}
+            return _frames[path][1]
+        digest, frame, source = _load(path)
+        _frames[path] = (digest, frame)
+        _load_stats[path] = {'source': source, 'seconds': time.perf_counter() - started}
+        return frame
+
+def load_report(path=None):
+    """Where the latest load_prices(path) got its frame from and how long it took"""
+    return _load_stats.get(os.path.abspath(path or DEFAULT_CSV))
+
+def cache_key(path=None):
+    """SHA-256 of the price file's contents; other caches built from the same data can key on it"""
+    path = os.path.abspath(path or DEFAULT_CSV)
+    return _source_hash(path, os.stat(path))
+
+def cache_dir(path=None):
+    """Cache directory of the price file's current contents; derived caches can be stored in it"""
+    path = os.path.abspath(path or DEFAULT_CSV)
+    return _columns_dir(path, cache_key(path))
+
+def clear_memory():
+    """Forget the in-process frames, e.g. after the price file has been replaced"""
+    with _lock:
+        _frames.clear()
+
+def _load(path):
+    stat = os.stat(path)
+    digest = _source_hash(path, stat)
+    columns_dir = _columns_dir(path, digest)
+
+    frame = _read_columns(columns_dir)
+    if frame is not None:
+        return digest, frame, 'cache'
+
+    frame = pd.read_csv(path)
+    try:
+        _write_columns(frame, columns_dir)
+    except OSError as e:
+        # A read-only checkout still works, it just parses the CSV every time
+        print(f"Could not write the price cache to {columns_dir}: {e}")
+        return digest, frame, 'csv'
+    # Serve the cached copy so every process gets the same memory-mapped layout
+    return digest, _read_columns(columns_dir), 'csv'
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _columns_dir(path, digest):
+    return os.path.join(CACHE_DIR, f"{_stem(path)}-{digest[:16]}")
+
+def _index_path(path):
+    return os.path.join(CACHE_DIR, f"{_stem(path)}.index.json")
+
+def _source_hash(path, stat):
+    """Hash of the source file, taken from the index while its mtime and size are unchanged"""
+    index_path = _index_path(path)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['path'] == path and index['mtime_ns'] == stat.st_mtime_ns and index['size'] == stat.st_size:
+            return index['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _write_json(index_path, {'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest})
+    except OSError:
+        pass
+    return digest
+
+def _read_columns(columns_dir):
+    try:
+        with open(os.path.join(columns_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != CACHE_FORMAT:
+        return None
+    columns = {name: np.load(os.path.join(columns_dir, f"{i:04d}.npy"), mmap_mode='r').view(np.ndarray)
+               for i, name in enumerate(meta['columns'])}
+    # copy=False keeps the columns memory-mapped instead of consolidating them into one block
+    return pd.DataFrame(columns, copy=False)
+
+def _write_columns(frame, columns_dir):
+    if os.path.exists(os.path.join(columns_dir, 'meta.json')):
+        return
+    temp_dir = f"{columns_dir}.tmp-{os.getpid()}"
+    os.makedirs(temp_dir, exist_ok=True)
+    for i, name in enumerate(frame.columns):
+        values = frame[name].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(os.path.join(temp_dir, f"{i:04d}.npy"), values)
+    # meta.json is written last: a directory without it is incomplete
+    _write_json(os.path.join(temp_dir, 'meta.json'), {'format': CACHE_FORMAT, 'columns': list(frame.columns),
+                                                       'rows': len(frame)})
+    try:
+        os.rename(temp_dir, columns_dir)
+    except OSError:
+        # Another process finished the same cache first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _write_json(path, data):
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+if __name__ == '__main__':
+    # python price_data.py [prices.csv]: build the cache and compare parse and cache load times
+    source = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV)
+    started = time.perf_counter()
+    pd.read_csv(source)
+    parse_seconds = time.perf_counter() - started
+    frame = load_prices(source)
+    clear_memory()
+    started = time.perf_counter()
+    load_prices(source)
+    print(f"{len(frame):,} rows x {len(frame.columns)} columns")
+    print(f"CSV parse:  {parse_seconds * 1000:.1f} ms")
+    print(f"Cache load: {(time.perf_counter() - started) * 1000:.1f} ms")
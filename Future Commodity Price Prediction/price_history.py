@@ -0,0 +1,324 @@
+"""High-frequency commodity price history: partitioned storage, resampling and chart downsampling.
+
+Raw observations (timestamp, price) are stored per commodity and calendar
+year, as a pair of .npy files (int64 nanosecond timestamps, float64 prices)
+that are memory-mapped on read, so a query only touches the years it spans.
+Each rewrite goes to a new version directory, and a small pointer file
+(<year>.current) is then switched to it with one atomic os.replace, so a
+reader sees either the old or the new partition and never a missing one.
+Every ingest also refreshes rollups per commodity: the last price of each
+day, week, month and year. Daily closes come from the raw partitions, weeks
+and months from the days, and years from the months.
+
+chart_series() answers a chart query for a time window: it takes the finest
+level with at most LTTB_INPUT_LIMIT points in the window, then reduces it to
+`max_points` with largest-triangle-three-buckets, which keeps the visual
+shape (peaks, troughs) of the series. A trace never ships more than
+`max_points` points, and zooming in fetches finer data.
+
+    python price_history.py ingest ticks.csv --store hf_prices
+    python price_history.py info --store hf_prices
+
+The CSV is either long (timestamp, commodity, price columns) or wide (a
+timestamp column followed by one column per commodity).
+"""
+import argparse
+import os
+import shutil
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ('raw', 'day', 'week', 'month', 'year')
+LTTB_INPUT_LIMIT = 200_000
+DEFAULT_MAX_POINTS = 2000
+
+NS_PER_DAY = 86_400 * 10 ** 9
+# Suffix of the file naming the current version directory of a partition or rollup
+POINTER = '.current'
+
+def _bucket(timestamps, level):
+    """Bucket number of each int64 ns timestamp at `level`; monotonic in time"""
+    if level == 'day':
+        return timestamps // NS_PER_DAY
+    if level == 'week':
+        # Weeks start on Monday; day 0 (1970-01-01) was a Thursday
+        return (timestamps // NS_PER_DAY + 3) // 7
+    unit = {'month': 'M', 'year': 'Y'}[level]
+    return timestamps.astype('datetime64[ns]').astype(f'datetime64[{unit}]').astype(np.int64)
+
+def resample_last(timestamps, values, level):
+    """Last observation of every `level` bucket of a time-sorted series, vectorized"""
+    if len(timestamps) == 0:
+        return timestamps, values
+    buckets = _bucket(timestamps, level)
+    last = np.flatnonzero(np.diff(buckets)) if len(buckets) > 1 else np.array([], dtype=np.int64)
+    last = np.append(last, len(buckets) - 1)
+    return timestamps[last], values[last]
+
+def lttb(x, y, threshold):
+    """Indices of the `threshold` points largest-triangle-three-buckets keeps of (x, y).
+
+    The first and last points are always kept. The rest are split into
+    threshold - 2 buckets, and from each bucket the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i covers [edges[i], edges[i + 1]); the last edge closes at the final point
+    edges = np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Average of every bucket up front, from cumulative sums
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(y)])
+    sizes = np.diff(edges)
+    mean_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / sizes, x[-1])
+    mean_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / sizes, y[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+def _to_ns(value):
+    """int64 ns for a timestamp-like value (str, datetime, datetime64, int ns); None stays None"""
+    if value is None:
+        return None
+    return pd.Timestamp(value).value
+
+class PriceHistoryStore:
+    def __init__(self, root):
+        self.root = root
+
+    def commodities(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, name)) and not name.startswith('.'))
+
+    def _dir(self, commodity):
+        return os.path.join(self.root, quote(commodity, safe=''))
+
+    def _years(self, commodity):
+        directory = self._dir(commodity)
+        if not os.path.isdir(directory):
+            return []
+        # Year directories without a pointer come from stores written before versioning
+        names = {name[:-len(POINTER)] if name.endswith(POINTER) else name for name in os.listdir(directory)}
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _partition(self, commodity, year):
+        return self._load(os.path.join(self._dir(commodity), str(year)))
+
+    def _current(self, directory):
+        """The version directory `directory`'s pointer names; `directory` itself if it has none"""
+        try:
+            with open(directory + POINTER) as f:
+                return os.path.join(os.path.dirname(directory), f.read().strip())
+        except FileNotFoundError:
+            return directory
+
+    def _load(self, directory, attempts=3):
+        """Memory-mapped (t, v) of the current version of `directory`"""
+        for attempt in range(attempts):
+            current = self._current(directory)
+            try:
+                return (np.load(os.path.join(current, 't.npy'), mmap_mode='r'),
+                        np.load(os.path.join(current, 'v.npy'), mmap_mode='r'))
+            except FileNotFoundError:
+                # Superseded and removed between reading the pointer and opening it: look again
+                if attempt == attempts - 1:
+                    raise
+
+    def _write(self, directory, timestamps, values):
+        """Write (t, v) to a new version directory, then switch `directory`'s pointer to it atomically"""
+        parent, name = os.path.split(directory)
+        version = f"{name}.v{time.time_ns()}-{os.getpid()}"
+        os.makedirs(os.path.join(parent, version))
+        np.save(os.path.join(parent, version, 't.npy'), np.ascontiguousarray(timestamps, dtype=np.int64))
+        np.save(os.path.join(parent, version, 'v.npy'), np.ascontiguousarray(values, dtype=np.float64))
+        previous = os.path.basename(self._current(directory))
+        temp = f"{directory}{POINTER}.tmp-{os.getpid()}"
+        with open(temp, 'w') as f:
+            f.write(version)
+        os.replace(temp, directory + POINTER)
+        # A reader may have just resolved the previous version, so it stays until the next rewrite
+        for entry in os.listdir(parent):
+            if (entry == name or entry.startswith(f"{name}.v")) and entry not in (version, previous):
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+    def ingest(self, commodity, timestamps, values):
+        """Add observations of one commodity (any order; a repeated timestamp keeps the latest value).
+        Call rebuild_rollups() when done ingesting."""
+        for year, part in _split_years(timestamps, values).items():
+            self._merge(commodity, year, [part])
+
+    def _merge(self, commodity, year, parts):
+        """Merge (timestamps, values) parts, oldest first, into one year partition with a single rewrite"""
+        if year in self._years(commodity):
+            parts = [self._partition(commodity, year)] + list(parts)
+        new_t = np.concatenate([t for t, _ in parts])
+        new_v = np.concatenate([v for _, v in parts])
+        # Stable sort, then keep the last of equal timestamps: later rows win
+        order = np.argsort(new_t, kind='stable')
+        new_t, new_v = new_t[order], new_v[order]
+        keep = np.append(new_t[1:] != new_t[:-1], True)
+        self._write(os.path.join(self._dir(commodity), str(year)), new_t[keep], new_v[keep])
+
+    def rebuild_rollups(self, commodity):
+        """Recompute the day/week/month/year levels of one commodity from its partitions"""
+        # Days never span years, so daily closes come partition by partition
+        daily = [resample_last(*self._partition(commodity, year), 'day') for year in self._years(commodity)]
+        day = (np.concatenate([t for t, _ in daily]) if daily else np.array([], dtype=np.int64),
+               np.concatenate([v for _, v in daily]) if daily else np.array([]))
+        # Weeks straddle month ends, so months come from days rather than weeks
+        month = resample_last(*day, 'month')
+        rollups = {'day': day, 'week': resample_last(*day, 'week'), 'month': month, 'year': resample_last(*month, 'year')}
+        for level, (timestamps, values) in rollups.items():
+            self._write(os.path.join(self._dir(commodity), f'_{level}'), timestamps, values)
+
+    def level(self, commodity, level):
+        """(timestamps, values) of a rollup level, memory-mapped"""
+        return self._load(os.path.join(self._dir(commodity), f'_{level}'))
+
+    def read(self, commodity, start=None, end=None, level='raw'):
+        """Observations in [start, end] (either may be None) at `level`, as (int64 ns, float64) arrays"""
+        start_ns, end_ns = _to_ns(start), _to_ns(end)
+        if level != 'raw':
+            timestamps, values = self.level(commodity, level)
+            lo, hi = _window(timestamps, start_ns, end_ns)
+            return np.asarray(timestamps[lo:hi]), np.asarray(values[lo:hi])
+
+        parts_t, parts_v = [], []
+        for year in self._overlapping_years(commodity, start_ns, end_ns):
+            timestamps, values = self._partition(commodity, year)
+            lo, hi = _window(timestamps, start_ns, end_ns)
+            parts_t.append(timestamps[lo:hi])
+            parts_v.append(values[lo:hi])
+        if not parts_t:
+            return np.array([], dtype=np.int64), np.array([])
+        return np.concatenate(parts_t), np.concatenate(parts_v)
+
+    def count(self, commodity, start=None, end=None, level='raw'):
+        """Number of observations in [start, end] at `level`, without reading them"""
+        start_ns, end_ns = _to_ns(start), _to_ns(end)
+        if level != 'raw':
+            lo, hi = _window(self.level(commodity, level)[0], start_ns, end_ns)
+            return hi - lo
+        total = 0
+        for year in self._overlapping_years(commodity, start_ns, end_ns):
+            lo, hi = _window(self._partition(commodity, year)[0], start_ns, end_ns)
+            total += hi - lo
+        return total
+
+    def _overlapping_years(self, commodity, start_ns, end_ns):
+        first = None if start_ns is None else pd.Timestamp(start_ns).year
+        last = None if end_ns is None else pd.Timestamp(end_ns).year
+        return [year for year in self._years(commodity)
+                if (first is None or year >= first) and (last is None or year <= last)]
+
+    def chart_series(self, commodity, start=None, end=None, max_points=DEFAULT_MAX_POINTS):
+        """At most `max_points` points of the window for plotting: (datetime64 times, values, level used)"""
+        for level in LEVELS:
+            if self.count(commodity, start, end, level) <= max(LTTB_INPUT_LIMIT, max_points):
+                break
+        timestamps, values = self.read(commodity, start, end, level)
+        kept = lttb(timestamps, values, max_points)
+        return timestamps[kept].astype('datetime64[ns]'), values[kept], level
+
+    def yearly_frame(self):
+        """Year x commodity frame of year-end prices, the shape CommodityPredictor works with"""
+        columns = {}
+        for commodity in self.commodities():
+            timestamps, values = self.level(commodity, 'year')
+            years = np.asarray(timestamps).astype('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+            columns[commodity] = pd.Series(np.asarray(values), index=years)
+        frame = pd.DataFrame(columns).sort_index()
+        return frame.rename_axis('Year').reset_index()
+
+def _window(timestamps, start_ns, end_ns):
+    lo = 0 if start_ns is None else int(np.searchsorted(timestamps, start_ns, side='left'))
+    hi = len(timestamps) if end_ns is None else int(np.searchsorted(timestamps, end_ns, side='right'))
+    return lo, hi
+
+def _split_years(timestamps, values):
+    """{year: (int64 ns timestamps, float64 values)} of the finite observations"""
+    timestamps = pd.to_datetime(pd.Series(timestamps)).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    timestamps, values = timestamps[valid], values[valid]
+    years = timestamps.astype('datetime64[ns]').astype('datetime64[Y]').astype(np.int64) + 1970
+    return {int(year): (timestamps[years == year], values[years == year]) for year in np.unique(years)}
+
+def ingest_csv(path, store, chunk_size=1_000_000, buffer_rows=20_000_000):
+    """Stream a long or wide price CSV into the store; returns the commodities touched.
+
+    Chunks are buffered per commodity and year, and each partition is
+    rewritten once per `buffer_rows` rows read rather than once per chunk.
+    A file that fits in the buffer therefore writes every partition exactly once.
+    """
+    touched = set()
+    pending = {}
+    buffered = 0
+
+    def add(commodity, timestamps, values):
+        nonlocal buffered
+        touched.add(commodity)
+        for year, part in _split_years(timestamps, values).items():
+            pending.setdefault((commodity, year), []).append(part)
+            buffered += len(part[0])
+
+    def flush():
+        nonlocal buffered
+        for (commodity, year), parts in pending.items():
+            store._merge(commodity, year, parts)
+        pending.clear()
+        buffered = 0
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        time_column = chunk.columns[0]
+        if 'commodity' in chunk.columns and 'price' in chunk.columns:
+            for commodity, rows in chunk.groupby('commodity', sort=False):
+                add(str(commodity), rows[time_column], rows['price'])
+        else:
+            for commodity in chunk.columns[1:]:
+                add(commodity, chunk[time_column], chunk[commodity])
+        if buffered >= buffer_rows:
+            flush()
+    flush()
+    for commodity in touched:
+        store.rebuild_rollups(commodity)
+    return sorted(touched)
+
+def main():
+    parser = argparse.ArgumentParser(description="High-frequency commodity price store")
+    parser.add_argument('command', choices=['ingest', 'info'])
+    parser.add_argument('csv', nargs='?', help="price CSV to ingest")
+    parser.add_argument('--store', default=os.getenv('COMMODITY_HF_STORE', 'hf_prices'))
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--buffer-rows', type=int, default=20_000_000,
+                        help="rows held in memory before the touched year partitions are rewritten")
+    args = parser.parse_args()
+
+    store = PriceHistoryStore(args.store)
+    if args.command == 'ingest':
+        if not args.csv:
+            parser.error("ingest needs a CSV file")
+        print(f"Ingested {', '.join(ingest_csv(args.csv, store, args.chunk_size, args.buffer_rows))}")
+    for commodity in store.commodities():
+        counts = ', '.join(f"{level} {store.count(commodity, level=level):,}" for level in LEVELS)
+        print(f"{commodity}: {counts}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Summary statistics of every commodity, computed in one pass over the price frame.
+
+All statistics come from whole-array operations on the years x commodities
+price matrix: prices are carried forward over gaps, and first and last
+valid years come from masks. The log-price trend is a masked least-squares
+fit using column sums. Nothing loops over commodities in Python.
+
+    mean_change   mean yearly % change (the predictor's trend input)
+    cagr          compound annual growth from the first to the last price, %
+    volatility    standard deviation of the yearly % changes
+    max_drawdown  largest fall from a running peak, % (negative)
+    trend         log-linear price trend, % per year
+
+load_statistics() caches the table as statistics.json in the price file's
+cache directory (see price_data.cache_dir), so it is recomputed exactly
+when the price cache is rebuilt.
+
+    python price_stats.py [prices.csv]
+"""
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import price_data
+
+STATISTICS = ('mean_change', 'cagr', 'volatility', 'max_drawdown', 'trend', 'first_year', 'last_year', 'latest')
+CACHE_FORMAT = 2
+
+# path -> (source SHA-256, statistics frame)
+_statistics = {}
+_lock = threading.Lock()
+
+def compute_statistics(prices):
+    """Commodity x STATISTICS frame for a frame with one column per commodity (and optionally Year)"""
+    years = (prices['Year'] if 'Year' in prices else pd.Series(range(len(prices)))).to_numpy(dtype=np.float64)
+    prices = prices.drop(columns=['Year'], errors='ignore')
+    values = prices.to_numpy(dtype=np.float64)
+    filled = prices.ffill().to_numpy(dtype=np.float64)
+    present = np.isfinite(values)
+    count = present.sum(axis=0)
+    seen = count > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Yearly changes as in forecasting.yearly_changes: carried-forward prices, NaN before the first price
+        changes = np.full_like(filled, np.nan)
+        changes[1:] = (filled[1:] / filled[:-1] - 1) * 100
+        valid = np.isfinite(changes)
+        n_changes = valid.sum(axis=0)
+        # Each commodity summed as one contiguous row, first year included, which is the order
+        # Series.pct_change().mean() adds in: the predictor's trend stays identical to the old loop's
+        mean_change = np.ascontiguousarray(np.where(valid, changes, 0).T).sum(axis=1) / n_changes
+        deviations = np.where(valid, changes - mean_change, 0)
+        volatility = np.sqrt((deviations ** 2).sum(axis=0) / (n_changes - 1))
+
+        first = present.argmax(axis=0)
+        last = len(values) - 1 - present[::-1].argmax(axis=0)
+        columns = np.arange(values.shape[1])
+        first_price, last_price = values[first, columns], values[last, columns]
+        span = years[last] - years[first]
+        cagr = ((last_price / first_price) ** (1 / span) - 1) * 100
+
+        peaks = np.fmax.accumulate(filled, axis=0)
+        drawdowns = np.where(np.isfinite(filled), filled / peaks - 1, 0)
+        max_drawdown = drawdowns.min(axis=0) * 100 if len(values) else np.zeros(len(columns))
+
+        # Least-squares slope of log price on year, over positive prices only
+        usable = present & (values > 0)
+        n = usable.sum(axis=0)
+        log_prices = np.where(usable, np.log(np.where(usable, values, 1)), 0)
+        x = np.where(usable, years[:, None] - years.mean(), 0)
+        slope = (n * (x * log_prices).sum(axis=0) - x.sum(axis=0) * log_prices.sum(axis=0)) \
+            / (n * (x ** 2).sum(axis=0) - x.sum(axis=0) ** 2)
+        trend = np.expm1(slope) * 100
+
+    cagr[~seen | (span <= 0) | ~(first_price > 0) | ~(last_price > 0)] = np.nan
+    max_drawdown[~seen] = np.nan
+    trend[n < 2] = np.nan
+    return pd.DataFrame({
+        'mean_change': mean_change,
+        'cagr': cagr,
+        'volatility': volatility,
+        'max_drawdown': max_drawdown,
+        'trend': trend,
+        'first_year': np.where(seen, years[first], np.nan),
+        'last_year': np.where(seen, years[last], np.nan),
+        'latest': np.where(seen, last_price, np.nan)
+    }, index=pd.Index(prices.columns, name='commodity'), columns=list(STATISTICS))
+
+def load_statistics(path=None):
+    """Statistics of the price file, computed once per version of its contents"""
+    path = os.path.abspath(path or price_data.DEFAULT_CSV)
+    digest = price_data.cache_key(path)
+    with _lock:
+        if path in _statistics and _statistics[path][0] == digest:
+            return _statistics[path][1]
+        cache_path = os.path.join(price_data.cache_dir(path), 'statistics.json')
+        statistics = _read(cache_path)
+        if statistics is None:
+            statistics = compute_statistics(price_data.load_prices(path, refresh=True))
+            try:
+                _write(cache_path, statistics)
+            except OSError as e:
+                print(f"Could not write the statistics cache to {cache_path}: {e}")
+        _statistics[path] = (digest, statistics)
+        return statistics
+
+def _read(cache_path):
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('format') != CACHE_FORMAT or cached.get('columns') != list(STATISTICS):
+        return None
+    values = np.array(cached['values'], dtype=np.float64).reshape(-1, len(STATISTICS))
+    return pd.DataFrame(values, index=pd.Index(cached['commodities'], name='commodity'), columns=list(STATISTICS))
+
+def _write(cache_path, statistics):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # NaN is stored as null, which np.array(..., dtype=np.float64) turns back into NaN
+    values = [[value if np.isfinite(value) else None for value in row] for row in statistics.to_numpy().tolist()]
+    temp_path = f"{cache_path}.tmp-{os.getpid()}"
+    with open(temp_path, 'w') as f:
+        json.dump({'format': CACHE_FORMAT, 'columns': list(STATISTICS), 'commodities': list(statistics.index),
+                   'values': values}, f)
+    os.replace(temp_path, cache_path)
+
+if __name__ == '__main__':
+    pd.set_option('display.width', 120)
+    print(load_statistics(sys.argv[1] if len(sys.argv) > 1 else None).round(2).to_string())
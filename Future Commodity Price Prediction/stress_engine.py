@@ -0,0 +1,238 @@
+"""Monte Carlo stress testing of commodity prices under random events.
+
+Each simulated path draws which events happen (independently, with a yearly
+occurrence probability each), how strong each occurring event turns out
+(its impact factor times a normal multiplier around 1), and a market shock
+for every commodity from the historical covariance of yearly price changes,
+so commodities move together the way they have in the past. The change of a
+commodity on a path is
+
+    trend + sum of occurring events' impacts x multiplier + market shock
+
+which, with every multiplier at 1 and no shock, is exactly predict_many().
+A price cannot fall by more than all of it, so changes are floored at -100%.
+
+Paths are drawn in chunks, each from its own child of one SeedSequence, so a
+seed reproduces the same result whatever the number of workers. Chunks are
+reduced to fine per-commodity histograms as they finish, which keeps memory
+flat for any number of paths; percentiles and tail metrics are read off the
+merged histograms.
+
+    python stress_engine.py --paths 2000000 --workers 4 --seed 7
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from commodity_predictor import EVENT_TYPES
+
+# Largest possible fall, in %: the price reaches zero
+MIN_CHANGE = -100.0
+
+# Chance of each event within a year
+EVENT_PROBABILITIES = {
+    ('natural_disasters', 'drought'): 0.15,
+    ('natural_disasters', 'flood'): 0.20,
+    ('natural_disasters', 'hurricane'): 0.25,
+    ('natural_disasters', 'earthquake'): 0.10,
+    ('wars', 'regional'): 0.20,
+    ('wars', 'global'): 0.02,
+    ('wars', 'trade'): 0.15,
+    ('policies', 'trade_restrictions'): 0.20,
+    ('policies', 'subsidies'): 0.30,
+    ('policies', 'environmental'): 0.25
+}
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+TAIL_LEVELS = (95, 99)
+BINS = 16384
+
+class StressEngine:
+    def __init__(self, predictor, probabilities=None, impact_uncertainty=0.3, volatility_scale=1.0):
+        """`impact_uncertainty` is the standard deviation of the impact multiplier, `volatility_scale`
+        scales the historical market shocks (0 switches them off)"""
+        probabilities = {**EVENT_PROBABILITIES, **(probabilities or {})}
+        self.commodities = list(predictor.commodities)
+        self.events = list(predictor.events)
+        self.probabilities = np.array([probabilities.get(event, 0.0) for event in self.events])
+        self.impact_matrix = predictor.impact_matrix
+        self.trend_bias = np.nan_to_num(predictor.trend_bias)
+        self.impact_uncertainty = impact_uncertainty
+        self.shock_factor = volatility_scale * _covariance_factor(predictor.df[self.commodities])
+        self.edges = self._histogram_range()
+
+    def _histogram_range(self):
+        """Per-commodity [low, high) histogram range, wide enough that overflow is negligible"""
+        largest_event_move = np.abs(self.impact_matrix).sum(axis=0) * (1 + 8 * self.impact_uncertainty)
+        shock_sd = np.sqrt((self.shock_factor ** 2).sum(axis=1))
+        reach = largest_event_move + 10 * shock_sd + 1.0
+        # Nothing falls below MIN_CHANGE, so the bins start there at the lowest
+        return np.stack([np.maximum(self.trend_bias - reach, MIN_CHANGE), self.trend_bias + reach], axis=1)
+
+    def run(self, paths=1_000_000, seed=0, workers=None, chunk_size=100_000, scenario=None):
+        """Simulate `paths` paths and return per-commodity distribution statistics.
+
+        `scenario` is an optional (disasters, wars, policies) tuple of events
+        that happen on every path; the rest stay random.
+        """
+        probabilities = self.probabilities.copy()
+        for event_type, events in zip(EVENT_TYPES, scenario or ()):
+            for event in events or ():
+                if (event_type, event) in self.events:
+                    probabilities[self.events.index((event_type, event))] = 1.0
+
+        sizes = [chunk_size] * (paths // chunk_size) + ([paths % chunk_size] if paths % chunk_size else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        params = (probabilities, self.impact_matrix, self.trend_bias, self.impact_uncertainty, self.shock_factor,
+                  self.edges)
+        workers = workers or os.cpu_count() or 1
+
+        started = time.perf_counter()
+        if workers == 1 or len(sizes) == 1:
+            _init_worker(params)
+            chunks = map(_simulate_chunk, sizes, seeds)
+            total = _merge(chunks)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(params,)) as pool:
+                # map() yields in chunk order, so the merged sums do not depend on scheduling
+                total = _merge(pool.map(_simulate_chunk, sizes, seeds))
+        seconds = time.perf_counter() - started
+
+        return {
+            'paths': paths,
+            'seed': seed,
+            'seconds': seconds,
+            'paths_per_second': paths / seconds if seconds else float('inf'),
+            'commodities': self._summarize(total)
+        }
+
+    def _summarize(self, total):
+        counts, value_sums, sums, squares, lows, highs, paths = total
+        widths = (self.edges[:, 1] - self.edges[:, 0]) / BINS
+        summary = {}
+        for j, commodity in enumerate(self.commodities):
+            cumulative = np.cumsum(counts[j])
+            mean = sums[j] / paths
+            stats = {
+                'mean': float(mean),
+                'std': float(np.sqrt(max(squares[j] / paths - mean ** 2, 0.0))),
+                'min': float(lows[j]),
+                'max': float(highs[j]),
+                'prob_decline': _share_below(0.0, cumulative, counts[j], self.edges[j, 0], widths[j], paths)
+            }
+            for q in PERCENTILES:
+                stats[f'p{q}'] = _quantile(q / 100, cumulative, counts[j], self.edges[j, 0], widths[j], paths,
+                                           lows[j], highs[j])
+            for level in TAIL_LEVELS:
+                # Value at risk and expected shortfall of a long position, as positive % losses
+                tail = 1 - level / 100
+                var = -_quantile(tail, cumulative, counts[j], self.edges[j, 0], widths[j], paths, lows[j], highs[j])
+                stats[f'var_{level}'] = var
+                stats[f'es_{level}'] = -_tail_mean(tail, cumulative, counts[j], value_sums[j], -var, paths)
+            summary[commodity] = stats
+        return summary
+
+def _covariance_factor(prices):
+    """F with F @ F.T the covariance of yearly % changes (pairwise over the years both commodities have)"""
+    changes = prices.ffill().pct_change(fill_method=None) * 100
+    covariance = np.nan_to_num(changes.cov().to_numpy())
+    # Pairwise estimates need not be positive semi-definite; drop any negative directions
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+_params = None
+
+def _init_worker(params):
+    global _params
+    _params = params
+
+def _simulate_chunk(size, seed):
+    """Histogram sufficient statistics of `size` simulated paths"""
+    probabilities, impact_matrix, trend_bias, impact_uncertainty, shock_factor, edges = _params
+    rng = np.random.default_rng(seed)
+    events, commodities = impact_matrix.shape
+
+    occurs = rng.random((size, events)) < probabilities
+    strength = occurs * (1 + impact_uncertainty * rng.standard_normal((size, events)))
+    changes = strength @ impact_matrix + trend_bias
+    changes += rng.standard_normal((size, shock_factor.shape[1])) @ shock_factor.T
+    np.maximum(changes, MIN_CHANGE, out=changes)
+
+    # One bincount over every commodity's bins at once
+    scaled = (changes - edges[:, 0]) * (BINS / (edges[:, 1] - edges[:, 0]))
+    bins = np.clip(scaled.astype(np.int64), 0, BINS - 1) + np.arange(commodities) * BINS
+    counts = np.bincount(bins.ravel(), minlength=commodities * BINS).reshape(commodities, BINS)
+    value_sums = np.bincount(bins.ravel(), weights=changes.ravel(), minlength=commodities * BINS)
+    return (counts, value_sums.reshape(commodities, BINS), changes.sum(axis=0), (changes ** 2).sum(axis=0),
+            changes.min(axis=0), changes.max(axis=0), size)
+
+def _merge(chunks):
+    total = None
+    for counts, value_sums, sums, squares, lows, highs, size in chunks:
+        if total is None:
+            total = [counts, value_sums, sums, squares, lows, highs, size]
+            continue
+        total[0] = total[0] + counts
+        total[1] = total[1] + value_sums
+        total[2] = total[2] + sums
+        total[3] = total[3] + squares
+        total[4] = np.minimum(total[4], lows)
+        total[5] = np.maximum(total[5], highs)
+        total[6] += size
+    return total
+
+def _quantile(q, cumulative, counts, low, width, paths, smallest, largest):
+    """q-quantile, interpolating linearly inside its histogram bin"""
+    rank = q * paths
+    b = min(int(np.searchsorted(cumulative, rank, side='left')), len(counts) - 1)
+    before = cumulative[b] - counts[b]
+    fraction = (rank - before) / counts[b] if counts[b] else 0.0
+    return float(np.clip(low + (b + fraction) * width, smallest, largest))
+
+def _share_below(value, cumulative, counts, low, width, paths):
+    position = (value - low) / width
+    if position <= 0:
+        return 0.0
+    b = min(int(position), len(counts) - 1)
+    before = cumulative[b] - counts[b]
+    return float((before + counts[b] * min(position - b, 1.0)) / paths)
+
+def _tail_mean(tail, cumulative, counts, value_sums, cutoff, paths):
+    """Mean of the lowest `tail` share of paths: whole bins below the cut-off plus a share of its bin"""
+    rank = tail * paths
+    b = min(int(np.searchsorted(cumulative, rank, side='left')), len(counts) - 1)
+    before = cumulative[b] - counts[b]
+    total = value_sums[:b].sum()
+    if counts[b]:
+        # The cut-off bin's paths are taken at their average value
+        total += (rank - before) * value_sums[b] / counts[b]
+    else:
+        total += (rank - before) * cutoff
+    return float(total / rank)
+
+def main():
+    from commodity_predictor import CommodityPredictor
+
+    parser = argparse.ArgumentParser(description="Monte Carlo stress test of commodity price changes")
+    parser.add_argument('--paths', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--impact-uncertainty', type=float, default=0.3)
+    parser.add_argument('--volatility-scale', type=float, default=1.0)
+    args = parser.parse_args()
+
+    engine = StressEngine(CommodityPredictor(), impact_uncertainty=args.impact_uncertainty,
+                          volatility_scale=args.volatility_scale)
+    result = engine.run(args.paths, args.seed, args.workers, args.chunk_size)
+    print(f"{result['paths']:,} paths in {result['seconds']:.2f} s ({result['paths_per_second']:,.0f} paths/s)")
+    print(f"{'Commodity':<15}{'mean':>8}{'p5':>8}{'p50':>8}{'p95':>8}{'VaR95':>8}{'ES95':>8}{'VaR99':>8}{'ES99':>8}")
+    for commodity, stats in result['commodities'].items():
+        print(f"{commodity:<15}" + ''.join(f"{stats[key]:8.1f}" for key in
+                                           ('mean', 'p5', 'p50', 'p95', 'var_95', 'es_95', 'var_99', 'es_99')))
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,390 @@
-from flask import Flask, render_template, request, jsonify
-from credit_risk_model import BusinessData, CreditRiskAssessor
+from flask import Flask, render_template, request, jsonify, Response
+from pydantic import ValidationError
+from werkzeug.exceptions import HTTPException
+from credit_risk_model import BusinessData, CreditRiskAssessor, RISK_TIERS
+from micro_batcher import MicroBatcher, score_records
+from assessment_cache import AssessmentCache, cache_key
+from scoring_config import ConfigWatcher
+from batch_validation import FIELD_SPECS, validate_batch, validate_record
+from pd_model import PDModel
+from portfolio import PortfolioAggregator
+import metrics
+from what_if import what_if_report, sensitivity_grid
 import json
+import os
+import numpy as np
+import threading
+import time
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
+# Micro-batching: once ASSESS_BATCH_MIN_CONCURRENCY /assess calls are in flight,
+# they are coalesced into one vectorized score_batch call, closed after
+# ASSESS_BATCH_WINDOW_MS or ASSESS_MAX_BATCH records. Below that each request
+# is scored on its own, which is faster (see `python benchmark.py`)
+app.config['MICRO_BATCHING'] = os.getenv('ASSESS_MICRO_BATCHING', '1') == '1'
+app.config['BATCH_WINDOW_MS'] = float(os.getenv('ASSESS_BATCH_WINDOW_MS', '0.1'))
+app.config['MAX_BATCH'] = int(os.getenv('ASSESS_MAX_BATCH', '256'))
+app.config['BATCH_MIN_CONCURRENCY'] = int(os.getenv('ASSESS_BATCH_MIN_CONCURRENCY', '32'))
+
+# One long-lived assessor shared by every request. Its scoring config
+# (SCORING_CONFIG, default src/scoring_config.json) is reloaded when the file changes.
+# The watcher starts with the app, so it also runs under a WSGI server.
+assessor = CreditRiskAssessor(os.getenv('SCORING_CONFIG'))
+config_watcher = ConfigWatcher(assessor, interval=float(os.getenv('SCORING_CONFIG_POLL_SECONDS', '1'))).start()
+
+# Assessment cache: ASSESS_CACHE_SIZE results in memory (0 disables) for
+# ASSESS_CACHE_TTL seconds, plus an optional SQLite tier at ASSESS_CACHE_DISK
+# shared by every worker process
+cache_size = int(os.getenv('ASSESS_CACHE_SIZE', '10000'))
+cache = AssessmentCache(max_entries=cache_size, ttl=float(os.getenv('ASSESS_CACHE_TTL', '300')),
+                        disk_path=os.getenv('ASSESS_CACHE_DISK')) if cache_size > 0 else None
+
+# Optional trained PD model (see pd_model.py), chosen per request with model=pd_model
+pd_model = PDModel.load(os.environ['PD_MODEL']) if os.getenv('PD_MODEL') else None
+
+# Live portfolio view: applications sent with an application_id (and optional
+# exposure) are kept in running segment totals, snapshotted to
+# PORTFOLIO_SNAPSHOT every PORTFOLIO_SNAPSHOT_SECONDS so restarts need no rescan.
+# Snapshots start with the app: each one also compacts the journal.
+portfolio = PortfolioAggregator(os.getenv('PORTFOLIO_SNAPSHOT')).start_snapshots(
+    float(os.getenv('PORTFOLIO_SNAPSHOT_SECONDS', '60')))
+_portfolio_views = {}
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher() -> MicroBatcher:
+    # Started lazily so the debug reloader's parent process never spawns one
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(assessor, max_batch_size=app.config['MAX_BATCH'],
+                                    max_wait=app.config['BATCH_WINDOW_MS'] / 1000,
+                                    min_concurrency=app.config['BATCH_MIN_CONCURRENCY'])
+        return _batcher
+
+def get_recommendation(risk_tier):
+    if risk_tier == "Low Risk":
+        return "Eligible for low-interest loans"
+    elif risk_tier == "Moderate Risk":
+        return "Higher interest rates may apply, collateral may be needed"
+    else:
+        return "High-risk application, may require significant collateral or face rejection"
+
+def assessment_response(result):
+    response = {
+        'success': True,
+        'risk_score': result['risk_score'],
+        'risk_tier': result['risk_tier'],
+        'probability_of_default': f"{result['probability_of_default']:.2%}",
+        'recommendation': get_recommendation(result['risk_tier']),
+        'config_version': result['config_version']
+    }
+    if 'pd_model' in result:
+        response['pd_model'] = result['pd_model']
+    return response
+
+def portfolio_exposure(data):
+    """The exposure to record for an application, or None if it has no application_id"""
+    if data.get('application_id') is None:
+        return None
+    exposure = float(data.get('exposure', 0))
+    if not exposure >= 0:
+        raise ValueError('exposure must be a non-negative number')
+    return exposure
+
+def record_in_portfolio(data, result, exposure):
+    portfolio.put(data['application_id'], str(data['industry_risk']).lower(), str(data['location_type']).lower(),
+                  data['business_type'], result['risk_tier'], exposure, result['probability_of_default'])
+
+def select_pd_model(name):
+    """The PD model a request asked for: None for the heuristic 1 - score/100"""
+    if name in (None, '', 'heuristic'):
+        return None
+    if name != 'pd_model':
+        raise ValueError(f"Unknown model: {name!r} (expected 'heuristic' or 'pd_model')")
+    if pd_model is None:
+        raise ValueError('No PD model is loaded; start the app with PD_MODEL set to a model directory')
+    return pd_model
+
+def scoring_version(config_version, model):
+    # Heuristic and model-based results for the same application are cached apart
+    return f"{config_version}+pd_model:{model.version}" if model else config_version
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def assess_single(data, model=None, timer=None):
+    """Score one application through BusinessData (not micro-batched). Validated against
+    FIELD_SPECS like a batch, so both paths accept and reject the same input."""
+    plan = assessor.plan
+    values, errors = validate_record(data, plan.categories)
+    if errors:
+        for error in errors:
+            metrics.validation_failures.inc(error.field)
+        raise ValueError('; '.join(f"{error.field}: {error.message}" for error in errors))
+    business_data = BusinessData(**values)
+    # `timer` is only passed for requests whose stages are sampled
+    if timer:
+        timer.mark('validation')
+
+    components = {} if timer else None
+    risk_score, risk_tier, probability_of_default = assessor.calculate_risk_score(business_data, plan, components)
+    if timer:
+        timer.mark('final_score', components)
+
+    result = {
+        'risk_score': risk_score,
+        'risk_tier': risk_tier,
+        'probability_of_default': probability_of_default,
+        'config_version': plan.version
+    }
+    if model:
+        result['probability_of_default'] = float(model.predict({name: [getattr(business_data, name)] for name in FIELD_SPECS})[0])
+        result['pd_model'] = model.version
+        if timer:
+            timer.mark('pd_model')
+    return result
+
+def failure_response(endpoint, e):
+    """Error JSON for a failed request. Bad input is counted by field and its message returned;
+    anything else is unexpected: logged with its traceback, counted by exception type and
+    answered with a 500 that does not leak its details."""
+    if isinstance(e, ValidationError):
+        for error in e.errors():
+            metrics.validation_failures.inc(str(error['loc'][0]) if error['loc'] else 'request')
+    elif isinstance(e, KeyError):
+        metrics.validation_failures.inc(str(e.args[0]))
+
+    if isinstance(e, (ValueError, KeyError, HTTPException)):
+        metrics.request_failures.inc(endpoint, 'invalid')
+    else:
+        metrics.request_failures.inc(endpoint, 'error')
+        metrics.errors_total.inc(endpoint, type(e).__name__)
+        app.logger.exception('%s failed', endpoint)
+        return jsonify({'success': False, 'error': 'Internal error while processing the request'}), 500
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    })
+
+# Bound once: the per-request observation then skips the label lookup
+_assess_seconds = metrics.request_seconds.labels('/assess')
+
 @app.route('/assess', methods=['POST'])
 def assess_risk():
+    started = time.perf_counter()
+    # Stage marks only for the sampled requests; the rest skip them entirely
+    timer = metrics.stage_timer()
+    if not timer.sampled:
+        timer = None
     try:
         data = request.json
-        
-        # Convert the data to match BusinessData model
-        business_data = BusinessData(
-            business_vintage=float(data['business_vintage']),
-            existing_loan_count=int(data['existing_loan_count']),
-            repayment_delays=int(data['repayment_delays']),
-            annual_turnover=float(data['annual_turnover']),
-            profit_margin=float(data['profit_margin']),
-            debt_to_income_ratio=float(data['debt_to_income_ratio']),
-            
-            gst_filing_delay=int(data['gst_filing_delay']),
-            upi_monthly_volume=float(data['upi_monthly_volume']),
-            upi_volatility=float(data['upi_volatility']),
-            social_media_rating=float(data['social_media_rating']),
-            negative_keywords=int(data['negative_keywords']),
-            avg_monthly_balance=float(data['avg_monthly_balance']),
-            min_monthly_balance=float(data['min_monthly_balance']),
-            ecommerce_rating=float(data['ecommerce_rating']),
-            return_rate=float(data['return_rate']),
-            industry_risk=data['industry_risk'],
-            
-            business_type=data['business_type'],
-            employee_count=int(data['employee_count']),
-            location_type=data['location_type']
-        )
-        
-        assessor = CreditRiskAssessor()
-        risk_score, risk_tier, probability_of_default = assessor.calculate_risk_score(business_data)
-        
-        recommendation = ""
-        if risk_tier == "Low Risk":
-            recommendation = "Eligible for low-interest loans"
-        elif risk_tier == "Moderate Risk":
-            recommendation = "Higher interest rates may apply, collateral may be needed"
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        model = select_pd_model(request.args.get('model') or data.get('model'))
+        exposure = portfolio_exposure(data)
+        if timer:
+            timer.mark('json_parse')
+
+        # Repeat assessments skip validation and scoring entirely
+        key = cache_key(data, scoring_version(assessor.plan.version, model)) if cache else None
+        result = cache.get(key) if cache else None
+        if timer:
+            timer.mark('cache_lookup')
+        if result is None:
+            if app.config['MICRO_BATCHING']:
+                # Inline below the batcher's concurrency threshold; otherwise queue wait plus
+                # the batch's own stages (recorded under path="batch")
+                result = get_batcher().assess(data, lambda: assess_single(data, model, timer), model)
+                if timer:
+                    timer.mark('micro_batch')
+            else:
+                result = assess_single(data, model, timer)
+            if cache:
+                cache.put(cache_key(data, scoring_version(result['config_version'], model)), result)
+                if timer:
+                    timer.mark('cache_store')
+        if exposure is not None:
+            record_in_portfolio(data, result, exposure)
+            if timer:
+                timer.mark('portfolio')
+
+        response = jsonify(assessment_response(result))
+        if timer:
+            timer.mark('serialization')
+            metrics.observe_stages('request', timer)
+    except Exception as e:
+        return failure_response('/assess', e)
+
+    if metrics.ENABLED:
+        _assess_seconds.observe(time.perf_counter() - started)
+    return response
+
+def cached_score_records(records, model=None):
+    """score_records, answering repeat records from the cache and scoring only the rest"""
+    if not cache:
+        return score_records(records, assessor, model)
+
+    version = scoring_version(assessor.plan.version, model)
+    results = [cache.get(cache_key(record, version)) for record in records]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        for i, result in zip(misses, score_records([records[i] for i in misses], assessor, model)):
+            results[i] = result
+            if not isinstance(result, ValueError):
+                cache.put(cache_key(records[i], scoring_version(result['config_version'], model)), result)
+    return results
+
+@app.route('/assess_batch', methods=['POST'])
+def assess_batch():
+    """Score many applications in one call.
+
+    Accepts a JSON array of application objects, or NDJSON (one object per
+    line, Content-Type application/x-ndjson). Results come back in input
+    order, as a JSON array or NDJSON to match the request. ?model=pd_model
+    takes the probability of default from the trained PD model.
+    """
+    started = time.perf_counter()
+    ndjson = request.mimetype in ('application/x-ndjson', 'application/jsonl')
+    try:
+        if ndjson:
+            records = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
         else:
-            recommendation = "High-risk application, may require significant collateral or face rejection"
-        
-        return jsonify({
+            records = request.get_json(force=True)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError('Expected a JSON array of objects')
+
+        exposures = [portfolio_exposure(record) for record in records]
+        results = []
+        for record, exposure, result in zip(records, exposures,
+                                            cached_score_records(records, select_pd_model(request.args.get('model')))):
+            if isinstance(result, ValueError):
+                results.append({'success': False, 'error': str(result)})
+                continue
+            if exposure is not None:
+                record_in_portfolio(record, result, exposure)
+            results.append(assessment_response(result))
+    except Exception as e:
+        return failure_response('/assess_batch', e)
+
+    if ndjson:
+        response = Response(''.join(json.dumps(result) + '\n' for result in results), mimetype='application/x-ndjson')
+    else:
+        response = jsonify({'success': True, 'results': results})
+    metrics.request_seconds.observe(time.perf_counter() - started, '/assess_batch')
+    return response
+
+@app.route('/what_if', methods=['POST'])
+def what_if():
+    """Minimum change per feature for one application to cross each tier threshold.
+
+    Body: {"application": {...}, "features": [...], "grid": {feature: [values]}}.
+    "features" is optional (default: every numeric feature). "grid" is
+    optional and takes one or two features; the response then also holds the
+    risk score and tier at every combination of their values.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json(force=True)
+        if not isinstance(data, dict) or not isinstance(data.get('application'), dict):
+            raise ValueError('Expected a JSON object with an "application" object')
+
+        plan = assessor.plan
+        batch, errors = validate_batch([data['application']], plan.categories)
+        if errors:
+            for error in errors:
+                metrics.validation_failures.inc(error.field)
+            raise ValueError('; '.join(f"{error.field}: {error.message}" for error in errors))
+
+        result = {
             'success': True,
-            'risk_score': risk_score,
-            'risk_tier': risk_tier,
-            'probability_of_default': f"{probability_of_default:.2%}",
-            'recommendation': recommendation
-        })
-        
+            'config_version': plan.version,
+            'thresholds': {'Low Risk': plan.low_risk_min, 'Moderate Risk': plan.moderate_risk_min},
+            'minimum_changes': what_if_report(assessor, batch, data.get('features'), plan)[0]
+        }
+        if data.get('grid'):
+            grid = sensitivity_grid(assessor, batch, data['grid'], plan)
+            result['grid'] = {
+                'features': data['grid'],
+                'risk_score': grid['risk_score'][0].tolist(),
+                'risk_tier': np.asarray(RISK_TIERS)[grid['tier_code'][0]].tolist()
+            }
+        response = jsonify(result)
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
+        return failure_response('/what_if', e)
+
+    metrics.request_seconds.observe(time.perf_counter() - started, '/what_if')
+    return response
+
+@app.route('/portfolio')
+def portfolio_view():
+    """Exposure, average and exposure-weighted PD and expected loss per segment.
+
+    ?by=industry_risk|location_type|business_type|risk_tier limits the
+    breakdown to one dimension. The JSON is built once per portfolio change.
+    """
+    by = request.args.get('by')
+    view = _portfolio_views.get(by)
+    if view is None or view[0] != portfolio.version:
+        try:
+            breakdown = portfolio.breakdown(by)
+        except Exception as e:
+            return failure_response('/portfolio', e)
+        view = (breakdown['version'], json.dumps({'success': True, **breakdown}))
+        _portfolio_views[by] = view
+    return Response(view[1], mimetype='application/json')
+
+@app.route('/portfolio/<application_id>', methods=['DELETE'])
+def portfolio_remove(application_id):
+    """Take a repaid, closed or withdrawn application out of the portfolio view"""
+    return jsonify({'success': True, 'removed': portfolio.remove(application_id)})
+
+def service_metrics():
+    # Read at scrape time from the components that keep their own counters
+    lines = []
+    if cache:
+        stats = cache.stats()
+        for name in ('hits', 'disk_hits', 'misses', 'evictions', 'expirations'):
+            lines += metrics.gauge_lines(f'msme_cache_{name}_total', f'Assessment cache {name.replace("_", " ")}',
+                                         stats[name], 'counter')
+        lines += metrics.gauge_lines('msme_cache_entries', 'Assessments held in the memory cache', stats['entries'])
+    lines += metrics.gauge_lines('msme_config_reloads_total', 'Scoring config hot reloads', config_watcher.reloads, 'counter')
+    lines += metrics.gauge_lines('msme_portfolio_applications', 'Applications in the portfolio view', len(portfolio))
+    lines += metrics.gauge_lines('msme_profiler_samples_total', 'Stack samples taken by the sampling profiler',
+                                 metrics.profiler.samples, 'counter')
+    return lines
+
+metrics.REGISTRY.collector(service_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    """GET: sampled stacks in collapsed (flame graph) format.
+    POST {"enabled": true|false, "interval_ms": 5, "reset": true}: switch the profiler at runtime.
+    """
+    if request.method == 'GET':
+        return Response(metrics.profiler.report(int(request.args.get('limit', 200))), mimetype='text/plain')
+
+    options = request.get_json(force=True, silent=True) or {}
+    if options.get('reset'):
+        metrics.profiler.reset()
+    if options.get('enabled') is True:
+        metrics.profiler.start(float(options.get('interval_ms', 5)) / 1000)
+    elif options.get('enabled') is False:
+        metrics.profiler.stop()
+    return jsonify({'success': True, 'running': metrics.profiler.running, 'interval_ms': metrics.profiler.interval * 1000,
+                    'samples': metrics.profiler.samples})
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify(cache.stats() if cache else {'enabled': False})
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True, threaded=True)
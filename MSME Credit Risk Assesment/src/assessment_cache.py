@@ -0,0 +1,162 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from batch_validation import FIELD_SPECS
+
+def cache_key(record: Dict[str, Any], config_version: str) -> Optional[str]:
+    """Stable hash of the BusinessData fields of a JSON record plus the config version.
+
+    Values are normalized the same way validate_batch reads them (numbers and
+    numeric strings as floats, categoricals lower-cased), so "3", 3 and 3.0
+    share a key. Returns None for records that cannot be normalized; those
+    are never cached.
+    """
+    values = []
+    for name, (kind, _, _) in FIELD_SPECS.items():
+        value = record.get(name)
+        if value is None:
+            return None
+        if kind in ('float', 'int'):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None
+            if not math.isfinite(value):
+                return None
+        elif kind == 'category':
+            value = str(value).lower()
+        elif not isinstance(value, str):
+            return None
+        values.append(value)
+
+    canonical = json.dumps([config_version, values], separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class AssessmentCache:
+    """LRU cache of assessment results with a TTL and an optional shared disk tier.
+
+    The memory tier is an OrderedDict bounded by `max_entries`. The disk tier
+    is a SQLite file that several worker processes can share. A memory miss
+    that hits disk is promoted to memory. Only successful assessments should
+    be stored.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, disk_path: Optional[str] = None,
+                 disk_max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_writes = 0
+        if disk_path:
+            with self._disk() as db:
+                db.execute('CREATE TABLE IF NOT EXISTS assessments (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+                db.execute('CREATE INDEX IF NOT EXISTS assessments_expires ON assessments (expires)')
+
+    def _disk(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared across threads; keep one per thread
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.disk_path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        value, remaining = self._disk_get(key) if self.disk_path else (None, 0.0)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            # Promoted with the disk row's remaining lifetime, not a fresh TTL
+            self._store(key, value, now, remaining)
+        return value
+
+    def put(self, key: Optional[str], value: Dict[str, Any]):
+        if key is None:
+            return
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self.disk_path:
+            self._disk_put(key, value)
+
+    def _store(self, key: str, value: Dict[str, Any], now: float, ttl: Optional[float] = None):
+        self._entries[key] = (now + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str) -> Tuple[Optional[Dict[str, Any]], float]:
+        """(value, seconds until it expires), or (None, 0.0)"""
+        # The disk tier is shared between processes, so it expires on wall-clock time
+        now = time.time()
+        row = self._disk().execute('SELECT value, expires FROM assessments WHERE key = ? AND expires > ?',
+                                   (key, now)).fetchone()
+        return (json.loads(row[0]), row[1] - now) if row else (None, 0.0)
+
+    def _disk_put(self, key: str, value: Dict[str, Any]):
+        db = self._disk()
+        with db:
+            db.execute('INSERT OR REPLACE INTO assessments VALUES (?, ?, ?)',
+                       (key, json.dumps(value), time.time() + self.ttl))
+        self._disk_writes += 1
+        if self._disk_writes % 1000 == 0:
+            self._prune_disk(db)
+
+    def _prune_disk(self, db: sqlite3.Connection):
+        with db:
+            db.execute('DELETE FROM assessments WHERE expires <= ?', (time.time(),))
+            db.execute('DELETE FROM assessments WHERE key IN (SELECT key FROM assessments ORDER BY expires '
+                       'LIMIT max(0, (SELECT count(*) FROM assessments) - ?))', (self.disk_max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            with self._disk() as db:
+                db.execute('DELETE FROM assessments')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
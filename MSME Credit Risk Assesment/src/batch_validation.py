@@ -0,0 +1,290 @@
+from functools import lru_cache
+from itertools import chain
+import math
+from operator import itemgetter
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, Mapping
+import numpy as np
+import pandas as pd
+
+# Field name -> (kind, lower bound, upper bound). Bounds are inclusive sanity
+# limits for bulk imports; None means unbounded on that side.
+FIELD_SPECS = {
+    # Core Parameters
+    'business_vintage': ('float', 0, 200),
+    'existing_loan_count': ('int', 0, None),
+    'repayment_delays': ('int', 0, None),
+    'annual_turnover': ('float', 0, None),
+    'profit_margin': ('float', -1, 1),
+    'debt_to_income_ratio': ('float', 0, None),
+
+    # Alternative Data
+    'gst_filing_delay': ('int', 0, None),
+    'upi_monthly_volume': ('float', 0, None),
+    'upi_volatility': ('float', 0, None),
+    'social_media_rating': ('float', 0, 5),
+    'negative_keywords': ('int', 0, None),
+    'avg_monthly_balance': ('float', None, None),
+    'min_monthly_balance': ('float', None, None),
+    'ecommerce_rating': ('float', 0, 5),
+    'return_rate': ('float', 0, 1),
+    'industry_risk': ('category', None, None),
+
+    # Business Metadata
+    'business_type': ('str', None, None),
+    'employee_count': ('int', 0, None),
+    'location_type': ('category', None, None)
+}
+
+FIELD_NAMES = tuple(FIELD_SPECS)
+NUMERIC_FIELDS = tuple(name for name, (kind, _, _) in FIELD_SPECS.items() if kind in ('float', 'int'))
+
+# JSON batches up to this many records are first checked with one plain NumPy
+# pass (see _validate_small_records): the per-column pandas work of the full
+# validation costs more than scoring a few dozen records. Anything the quick
+# pass cannot accept as-is goes through the full validation for its messages.
+SMALL_BATCH_ROWS = 512
+_LOWER = np.array([-np.inf if FIELD_SPECS[name][1] is None else FIELD_SPECS[name][1] for name in NUMERIC_FIELDS])
+_UPPER = np.array([np.inf if FIELD_SPECS[name][2] is None else FIELD_SPECS[name][2] for name in NUMERIC_FIELDS])
+_INTEGER = np.array([FIELD_SPECS[name][0] == 'int' for name in NUMERIC_FIELDS])
+_numeric_values = itemgetter(*NUMERIC_FIELDS)
+
+# Default allowed values for categorical fields, in code order. The scoring
+# config can change them; pass ScoringPlan.categories to validate_batch.
+CATEGORIES = {
+    'industry_risk': ('low', 'medium', 'high'),
+    'location_type': ('urban', 'rural')
+}
+
+class FieldError(NamedTuple):
+    row: int  # position in the input batch
+    field: str
+    message: str
+
+class BusinessBatch:
+    """Validated BusinessData columns for many businesses.
+
+    One NumPy array per field (the scored categoricals as compact pd.Categorical codes)
+    instead of one model object per row. Supports `batch[field]`, so it can be
+    passed straight to CreditRiskAssessor.score_batch.
+    """
+    __slots__ = FIELD_NAMES + ('row_index',)
+
+    def __init__(self, columns: Dict[str, Union[np.ndarray, pd.Categorical]], row_index: np.ndarray):
+        for name in FIELD_NAMES:
+            setattr(self, name, columns[name])
+        # Positions of these rows in the batch that was validated
+        self.row_index = row_index
+
+    def __getitem__(self, name: str):
+        if name not in FIELD_SPECS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __len__(self) -> int:
+        return len(self.row_index)
+
+    def keys(self) -> Tuple[str, ...]:
+        return FIELD_NAMES
+
+def validate_batch(data: Union[pd.DataFrame, Mapping[str, Sequence], Sequence[Mapping]],
+                   categories: Optional[Mapping[str, Tuple[str, ...]]] = None) -> Tuple[BusinessBatch, List[FieldError]]:
+    """Validate a whole batch of applications column by column.
+
+    `data` may be a DataFrame, a mapping of field name to column, or a list of
+    JSON-style records. `categories` overrides the allowed categorical values
+    (defaults to CATEGORIES). Returns the valid rows as a BusinessBatch plus
+    one FieldError per invalid (row, field); rows with any error are dropped.
+    """
+    categories = categories or CATEGORIES
+    # Work column by column; building a DataFrame from a mapping would copy
+    # and consolidate every column before we have even looked at it
+    if isinstance(data, pd.DataFrame):
+        size = len(data)
+    elif isinstance(data, Mapping):
+        size = len(next(iter(data.values()), ()))
+    else:
+        # JSON records: transposing in Python is far cheaper than a DataFrame
+        # for the small batches the /assess service produces
+        data = list(data)
+        size = len(data)
+        if 0 < size <= SMALL_BATCH_ROWS:
+            batch = _validate_small_records(data, categories)
+            if batch is not None:
+                return batch, []
+        data = {name: [record.get(name) for record in data] for name in FIELD_SPECS}
+
+    columns = {}
+    errors = []
+    invalid = np.zeros(size, dtype=bool)
+    for name, (kind, lower, upper) in FIELD_SPECS.items():
+        raw = data[name] if name in data else np.full(size, np.nan)
+        if kind == 'category':
+            values, problems = _validate_category(raw, _category_dtype(tuple(categories[name])))
+        elif kind == 'str':
+            values, problems = _validate_str(raw)
+        else:
+            values, problems = _validate_number(raw, kind, lower, upper)
+
+        columns[name] = values
+        for message, mask in problems:
+            if not mask.any():
+                continue
+            rows = np.flatnonzero(mask)
+            invalid[rows] = True
+            errors.extend(FieldError(int(row), name, message) for row in rows)
+
+    errors.sort(key=lambda error: error.row)
+    keep = np.flatnonzero(~invalid)
+    if len(keep) < size:
+        columns = {name: values[keep] for name, values in columns.items()}
+    return BusinessBatch(columns, keep), errors
+
+def validate_record(record: Mapping[str, Any],
+                    categories: Optional[Mapping[str, Tuple[str, ...]]] = None) -> Tuple[Dict[str, Any], List[FieldError]]:
+    """Validate one JSON-style application with the same rules and messages as validate_batch.
+
+    Returns the field values (ints as int, categoricals lowercased) and the
+    record's FieldErrors, all with row 0. Used by the per-request /assess
+    path, where building columns for a single record would cost more than
+    the scoring itself.
+    """
+    categories = categories or CATEGORIES
+    values = {}
+    errors = []
+    for name, (kind, lower, upper) in FIELD_SPECS.items():
+        raw = record.get(name)
+        if kind == 'category':
+            value, problems = _check_category(raw, tuple(categories[name]))
+        elif kind == 'str':
+            value, problems = raw, ['field required'] if _is_missing(raw) else []
+        else:
+            value, problems = _check_number(raw, kind, lower, upper)
+        values[name] = value
+        if problems:
+            errors.extend(FieldError(0, name, message) for message in problems)
+    return values, errors
+
+def _validate_small_records(records: List[Mapping[str, Any]],
+                            categories: Mapping[str, Tuple[str, ...]]) -> Optional[BusinessBatch]:
+    """The BusinessBatch validate_batch would build for these records, or None unless every
+    record is valid with plain JSON types (then the full validation finds the errors)"""
+    try:
+        numbers = np.fromiter(chain.from_iterable(map(_numeric_values, records)), dtype=np.float64,
+                              count=len(records) * len(NUMERIC_FIELDS)).reshape(len(records), -1)
+    except (KeyError, TypeError, ValueError):
+        return None
+    # NaN (a missing field) fails both bounds
+    valid = (numbers >= _LOWER) & (numbers <= _UPPER) & np.isfinite(numbers)
+    valid &= ~_INTEGER | (numbers == np.floor(numbers))
+    if not valid.all():
+        return None
+
+    columns = {}
+    for i, name in enumerate(NUMERIC_FIELDS):
+        column = numbers[:, i]
+        columns[name] = column.astype(np.int64) if _INTEGER[i] else column
+    for name, (kind, _, _) in FIELD_SPECS.items():
+        if kind == 'category':
+            allowed = tuple(categories[name])
+            codes = [allowed.index(key) if key in allowed else -1
+                     for key in (value.lower() if type(value) is str else None for value in
+                                 (record.get(name) for record in records))]
+            if -1 in codes:
+                return None
+            columns[name] = pd.Categorical.from_codes(np.array(codes, dtype=np.int8),
+                                                      dtype=_category_dtype(allowed), validate=False)
+        elif kind == 'str':
+            values = [record.get(name) for record in records]
+            if not all(type(value) is str for value in values):
+                return None
+            columns[name] = np.array(values, dtype=object)
+    return BusinessBatch(columns, np.arange(len(records)))
+
+def _check_number(raw: Any, kind: str, lower: Optional[float], upper: Optional[float]):
+    # Scalar twin of _validate_number: what np.asarray would accept, float() accepts
+    try:
+        value = float(raw)
+        missing = value != value
+    except (TypeError, ValueError):
+        value = math.nan
+        missing = _is_missing(raw)
+    present = math.isfinite(value)
+
+    problems = ['field required'] if missing else [] if present else ['value is not a valid number']
+    if present:
+        if kind == 'int' and value != math.floor(value):
+            problems.append('value is not a valid integer')
+        if lower is not None and value < lower:
+            problems.append(f'must be >= {lower}')
+        if upper is not None and value > upper:
+            problems.append(f'must be <= {upper}')
+
+    if kind == 'int':
+        return (int(value) if present else 0), problems
+    return value, problems
+
+def _check_category(raw: Any, allowed: Tuple[str, ...]):
+    if _is_missing(raw):
+        return None, ['field required']
+    key = str(raw).lower()
+    return key, ([] if key in allowed else [f"must be one of {', '.join(allowed)}"])
+
+def _is_missing(value: Any) -> bool:
+    # None, NaN and NaT, as pd.isna sees them; the common JSON types are decided without it
+    if value is None:
+        return True
+    if isinstance(value, (str, bool, int)):
+        return False
+    if isinstance(value, float):
+        return value != value
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+def _validate_number(raw: Sequence, kind: str, lower: Optional[float], upper: Optional[float]):
+    try:
+        # Fast path for numbers, numeric strings and None
+        values = np.asarray(raw, dtype=np.float64)
+        missing = np.isnan(values)
+    except (TypeError, ValueError):
+        missing = np.asarray(pd.isna(raw), dtype=bool)
+        values = pd.Series(pd.to_numeric(raw, errors='coerce'), copy=False).to_numpy(dtype=np.float64, na_value=np.nan)
+    present = np.isfinite(values)
+
+    problems = [('field required', missing), ('value is not a valid number', ~present & ~missing)]
+    if kind == 'int':
+        problems.append(('value is not a valid integer', present & (values != np.floor(values))))
+    if lower is not None:
+        problems.append((f'must be >= {lower}', present & (values < lower)))
+    if upper is not None:
+        problems.append((f'must be <= {upper}', present & (values > upper)))
+
+    if kind == 'int':
+        values = np.where(present, values, 0).astype(np.int64)
+    return values, problems
+
+def _validate_category(raw: Sequence, dtype: pd.CategoricalDtype):
+    # Normalize the handful of distinct values rather than every row
+    allowed = tuple(dtype.categories)
+    codes, uniques = _factorize(raw)
+    table = np.array([allowed.index(key) if key in allowed else -1
+                      for key in (str(value).lower() for value in uniques)] + [-1], dtype=np.int8)
+    # factorize marks missing values with -1, which picks the trailing -1 entry
+    mapped = table[codes]
+    values = pd.Categorical.from_codes(mapped, dtype=dtype, validate=False)
+    missing = codes < 0
+    return values, [('field required', missing), (f"must be one of {', '.join(allowed)}", (mapped < 0) & ~missing)]
+
+def _validate_str(raw: Sequence):
+    values = np.asarray(raw, dtype=object)
+    return values, [('field required', np.asarray(pd.isna(values), dtype=bool))]
+
+@lru_cache(maxsize=32)
+def _category_dtype(allowed: Tuple[str, ...]) -> pd.CategoricalDtype:
+    # Cached: constructing a CategoricalDtype re-validates its categories
+    return pd.CategoricalDtype(allowed)
+
+def _factorize(raw: Sequence):
+    # Series (possibly Arrow-backed) factorize natively; anything else goes through object
+    return pd.factorize(raw if isinstance(raw, pd.Series) else np.asarray(raw, dtype=object))
@@ -0,0 +1,209 @@
+"""Throughput benchmarks for the credit risk scoring paths.
+
+Run from the src directory:
+
+    python benchmark.py --rows 1000000
+"""
+import argparse
+import threading
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+import metrics
+from batch_validation import validate_batch, validate_record
+from credit_risk_model import BusinessData, CreditRiskAssessor
+from micro_batcher import MicroBatcher
+from pd_model import PDModel, PDModelTrainer
+
+BUSINESS_TYPES = np.array(['Proprietorship', 'Partnership', 'Private Limited', 'LLP'], dtype=object)
+
+def make_synthetic_batch(rows: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Random but plausible loan-book columns covering every BusinessData field"""
+    rng = np.random.default_rng(seed)
+    return {
+        'business_vintage': rng.uniform(0, 20, rows).round(1),
+        'existing_loan_count': rng.integers(0, 6, rows),
+        'repayment_delays': rng.integers(0, 6, rows),
+        'annual_turnover': rng.uniform(1, 800, rows).round(2),
+        'profit_margin': rng.uniform(-0.3, 0.4, rows).round(3),
+        'debt_to_income_ratio': rng.uniform(0, 1.5, rows).round(2),
+
+        'gst_filing_delay': rng.integers(0, 120, rows),
+        'upi_monthly_volume': rng.uniform(0, 15, rows).round(2),
+        'upi_volatility': rng.uniform(0, 1, rows).round(2),
+        'social_media_rating': rng.uniform(0, 5, rows).round(1),
+        'negative_keywords': rng.integers(0, 20, rows),
+        'avg_monthly_balance': rng.uniform(0, 200, rows).round(2),
+        'min_monthly_balance': rng.uniform(0, 50, rows).round(2),
+        'ecommerce_rating': rng.uniform(0, 5, rows).round(1),
+        'return_rate': rng.uniform(0, 0.7, rows).round(2),
+        'industry_risk': rng.choice(np.array(['low', 'medium', 'high'], dtype=object), rows),
+
+        'business_type': rng.choice(BUSINESS_TYPES, rows),
+        'employee_count': rng.integers(1, 200, rows),
+        'location_type': rng.choice(np.array(['urban', 'rural'], dtype=object), rows)
+    }
+
+def row_as_business_data(columns: Dict[str, np.ndarray], i: int) -> BusinessData:
+    return BusinessData(**{name: column[i].item() if hasattr(column[i], 'item') else column[i]
+                           for name, column in columns.items()})
+
+def check_against_per_record(assessor: CreditRiskAssessor, columns: Dict[str, np.ndarray], sample: int) -> int:
+    """Score the first `sample` rows both ways and return the number of mismatches"""
+    head = {name: column[:sample] for name, column in columns.items()}
+    batch = assessor.score_batch(head)
+
+    mismatches = 0
+    for i in range(sample):
+        risk_score, risk_tier, pd = assessor.calculate_risk_score(row_as_business_data(head, i))
+        if (risk_score != batch['risk_score'][i] or risk_tier != batch['risk_tier'][i]
+                or pd != batch['probability_of_default'][i]):
+            mismatches += 1
+    return mismatches
+
+def synthetic_pd_model(assessor: CreditRiskAssessor, rows: int = 50_000, seed: int = 0) -> PDModel:
+    """A PD model fitted to defaults drawn from the heuristic PD, for timing only"""
+    columns = make_synthetic_batch(rows, seed)
+    defaulted = np.random.default_rng(seed + 1).random(rows) < assessor.score_batch(columns)['probability_of_default']
+    trainer = PDModelTrainer.for_data(columns, seed=seed)
+    trainer.fit(columns, defaulted.astype(np.int64))
+    return trainer.serving_model()
+
+def bench_score_batch(assessor: CreditRiskAssessor, columns: Dict[str, np.ndarray], repeats: int) -> float:
+    """Best-of-`repeats` wall time for one score_batch call"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        assessor.score_batch(columns)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_concurrent(handle, records, clients: int):
+    """Drive `handle(record)` from `clients` threads; return (requests/s, p50, p99 latency in ms)"""
+    latencies = []
+    per_client = [records[i::clients] for i in range(clients)]
+
+    def client(share):
+        local = []
+        for record in share:
+            start = time.perf_counter()
+            handle(record)
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(share,)) for share in per_client]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return len(records) / elapsed, p50, p99
+
+def bench_metrics_overhead(records, rounds: int = 5) -> Tuple[float, float]:
+    """(instrumentation seconds, handler seconds with metrics off) per call of the real /assess
+    view (single-record path, no cache). Every record is sent with metrics on and off back to
+    back, in alternating order, and the overhead is the median of the paired differences:
+    on one busy CPU, timing whole rounds of each is noisier than the overhead itself."""
+    import app as service
+    service.app.config['MICRO_BATCHING'] = False
+    service.cache = None
+    enabled = metrics.ENABLED
+    differences, bare = [], []
+    try:
+        for _ in range(rounds):
+            for i, record in enumerate(records):
+                seconds = {}
+                for metrics.ENABLED in ((True, False) if i % 2 else (False, True)):
+                    # Only the view itself is timed, not building the request around it
+                    with service.app.test_request_context('/assess', method='POST', json=record):
+                        start = time.perf_counter()
+                        service.assess_risk()
+                        seconds[metrics.ENABLED] = time.perf_counter() - start
+                differences.append(seconds[True] - seconds[False])
+                bare.append(seconds[False])
+    finally:
+        metrics.ENABLED = enabled
+    return float(np.median(differences)), float(np.median(bare))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the credit risk scoring paths")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--check', type=int, default=2000, help="rows to cross-check against calculate_risk_score")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 16, 64, 128],
+                        help="concurrent clients for the /assess serving benchmark")
+    parser.add_argument('--requests', type=int, default=20000, help="requests sent in the serving benchmark")
+    parser.add_argument('--overhead-requests', type=int, default=2000,
+                        help="requests per round when timing /assess with metrics on and off")
+    parser.add_argument('--pd-model', help="trained PD model directory (default: fit one to synthetic outcomes)")
+    args = parser.parse_args()
+
+    assessor = CreditRiskAssessor()
+    columns = make_synthetic_batch(args.rows, args.seed)
+
+    mismatches = check_against_per_record(assessor, columns, min(args.check, args.rows))
+    print(f"Per-record cross-check: {mismatches} mismatches in {min(args.check, args.rows)} rows")
+
+    start = time.perf_counter()
+    for i in range(min(args.check, args.rows)):
+        assessor.calculate_risk_score(row_as_business_data(columns, i))
+    per_record = (time.perf_counter() - start) / max(1, min(args.check, args.rows))
+
+    start = time.perf_counter()
+    batch, errors = validate_batch(columns)
+    validation = time.perf_counter() - start
+
+    elapsed = bench_score_batch(assessor, columns, args.repeats)
+    print(f"calculate_risk_score: {1 / per_record:,.0f} records/s (including BusinessData construction)")
+    print(f"validate_batch:       {args.rows / validation:,.0f} records/s ({len(errors)} field errors)")
+    print(f"score_batch:          {args.rows / elapsed:,.0f} records/s ({args.rows:,} rows in {elapsed * 1000:.1f} ms)")
+
+    # Trained PD model on the same validated batch, on top of the heuristic score
+    if args.pd_model:
+        start = time.perf_counter()
+        model = PDModel.load(args.pd_model)
+        print(f"PDModel.load:         {(time.perf_counter() - start) * 1000:.2f} ms")
+    else:
+        model = synthetic_pd_model(assessor, seed=args.seed)
+    best = float('inf')
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        model.predict(batch)
+        best = min(best, time.perf_counter() - start)
+    print(f"PDModel.predict:      {args.rows / best:,.0f} records/s ({args.rows:,} rows in {best * 1000:.1f} ms)")
+
+    # Serving path: JSON records from concurrent clients, one at a time vs micro-batched
+    # once enough are in flight (what /assess does by default)
+    sample = {name: column[:args.requests] for name, column in make_synthetic_batch(args.requests, args.seed + 1).items()}
+    records = [{name: (column[i].item() if hasattr(column[i], 'item') else column[i]) for name, column in sample.items()}
+               for i in range(args.requests)]
+    lock = threading.Lock()
+
+    def per_request(record):
+        # What /assess does by default (app.assess_single): validate, build BusinessData, score
+        with lock:
+            values, errors = validate_record(record, assessor.plan.categories)
+            assessor.calculate_risk_score(BusinessData(**values))
+
+    for clients in args.clients:
+        batcher = MicroBatcher(assessor)
+        for label, handle in (("per-request", per_request),
+                              ("micro-batched", lambda record: batcher.assess(record, lambda: per_request(record)))):
+            rate, p50, p99 = bench_concurrent(handle, records, clients)
+            print(f"/assess {label:<13} {rate:,.0f} requests/s, p50 {p50:.2f} ms, p99 {p99:.2f} ms ({clients} clients)")
+        print(f"  {batcher.inline / len(records):.0%} scored inline, "
+              f"mean micro-batch size {batcher.records / max(1, batcher.batches):.1f}")
+
+    instrumentation, bare = bench_metrics_overhead(records[:args.overhead_requests])
+    print(f"/metrics instrumentation: {instrumentation * 1e6:.2f} us per request, "
+          f"{instrumentation / bare:.2%} of the /assess handler's own time ({bare * 1e6:.0f} us with metrics off), "
+          f"{instrumentation / per_record:.2%} of one calculate_risk_score call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""In-process metrics for the scoring service, rendered in Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label values, updated
+under one lock per metric. Request latency and counts are exact: every
+request makes one histogram observation. An observation is only appended
+to a deque (atomic, no lock); the queued values are folded into the
+buckets in bulk with NumPy every FOLD_EVERY observations and before every
+read. Per-stage timings are taken for one request or batch in
+STAGE_SAMPLE_EVERY (METRICS_STAGE_SAMPLE, default 64); the others get a
+timer whose marks do nothing, and the scorer skips its component clocks
+for them. METRICS_ENABLED=0 turns the per-request instrumentation of
+/assess off, which is how benchmark.py measures its cost.
+SamplingProfiler is an optional stack sampler that can be switched on at
+runtime to see where the time inside a stage goes.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter, deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Seconds; wide enough for a single-record stage (microseconds) and a large batch
+LATENCY_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+# Queued observations per series before the observing thread folds them into the buckets
+FOLD_EVERY = 1024
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items)
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._bounds = np.asarray(self.buckets, dtype=np.float64)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        # label values -> observations not folded into _values yet
+        self._pending: Dict[Tuple[str, ...], deque] = {}
+        self._lock = threading.Lock()
+
+    def _series(self, labelvalues: Tuple[str, ...]) -> list:
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value: float, *labelvalues: str):
+        pending = self._pending.get(labelvalues)
+        if pending is None:
+            pending = self._queue(labelvalues)
+        pending.append(value)
+        if len(pending) >= FOLD_EVERY:
+            with self._lock:
+                self._fold(labelvalues, pending)
+
+    def labels(self, *labelvalues: str) -> 'HistogramSeries':
+        """One series, for hot paths: its observe(value) skips looking up the label values"""
+        return HistogramSeries(self, labelvalues, self._queue(labelvalues))
+
+    def _queue(self, labelvalues: Tuple[str, ...]) -> deque:
+        with self._lock:
+            self._series(labelvalues)
+            return self._pending.setdefault(labelvalues, deque())
+
+    def _fold(self, labelvalues: Tuple[str, ...], pending: deque):
+        """Move queued observations into the series (caller holds the lock)"""
+        # Only the values queued so far: other threads may keep appending meanwhile
+        values = np.fromiter((pending.popleft() for _ in range(len(pending))), dtype=np.float64)
+        if not len(values):
+            return
+        series = self._values[labelvalues]
+        counts = np.bincount(np.searchsorted(self._bounds, values, side='left'), minlength=len(self.buckets) + 1)
+        series[0] = [total + int(added) for total, added in zip(series[0], counts)]
+        series[1] += float(values.sum())
+        series[2] += len(values)
+
+    def _fold_all(self):
+        """Fold every series' queued observations before a read (caller holds the lock)"""
+        for labelvalues, pending in self._pending.items():
+            if pending:
+                self._fold(labelvalues, pending)
+
+    def observe_many(self, observations: Iterable[Tuple[Tuple[str, ...], float]]):
+        """Record several (label values, value) pairs under one lock acquisition"""
+        buckets = self.buckets
+        with self._lock:
+            for labelvalues, value in observations:
+                series = self._series(labelvalues)
+                series[0][bisect_left(buckets, value)] += 1
+                series[1] += value
+                series[2] += 1
+
+    def totals(self, *labelvalues: str) -> Tuple[float, int]:
+        """(sum, count) of one series"""
+        with self._lock:
+            self._fold_all()
+            series = self._values.get(labelvalues)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            self._fold_all()
+            items = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items())
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class HistogramSeries:
+    """One labelled series of a Histogram (see Histogram.labels)"""
+    __slots__ = ('_histogram', '_labelvalues', '_pending')
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...], pending: deque):
+        self._histogram = histogram
+        self._labelvalues = labelvalues
+        self._pending = pending
+
+    def observe(self, value: float):
+        pending = self._pending
+        pending.append(value)
+        if len(pending) >= FOLD_EVERY:
+            with self._histogram._lock:
+                self._histogram._fold(self._labelvalues, pending)
+
+class Registry:
+    """Metrics to render, plus collectors that produce lines at scrape time (e.g. cache stats)"""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], List[str]]):
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+def gauge_lines(name: str, documentation: str, value: float, kind: str = 'gauge') -> List[str]:
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"]
+
+class StageTimer:
+    """Lap timer: mark(stage) charges the time since the previous mark to `stage`"""
+    __slots__ = ('marks',)
+    sampled = True
+
+    def __init__(self):
+        self.marks = [(None, time.perf_counter(), None)]
+
+    def mark(self, stage: str, parts: Optional[Dict[str, float]] = None):
+        """`parts` are sub-stages of this lap timed elsewhere (e.g. inside the scorer); they are
+        reported as stages of their own and `stage` gets the remainder"""
+        self.marks.append((stage, time.perf_counter(), parts))
+
+    def timings(self) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        previous = self.marks[0][1]
+        for stage, now, parts in self.marks[1:]:
+            elapsed = now - previous
+            for part, seconds in (parts or {}).items():
+                timings[part] = timings.get(part, 0.0) + seconds
+                elapsed -= seconds
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+            previous = now
+        return timings
+
+class _UnsampledTimer:
+    """Stand-in StageTimer for requests whose stages are not sampled: marks cost one no-op call"""
+    __slots__ = ()
+    sampled = False
+
+    def mark(self, stage: str, parts: Optional[Dict[str, float]] = None):
+        pass
+
+UNSAMPLED = _UnsampledTimer()
+
+class SamplingProfiler:
+    """Statistical profiler: samples every thread's stack every `interval` seconds.
+
+    Off by default; start() and stop() can be called at any time. report()
+    returns the sampled stacks in collapsed format ("outer;inner count" per
+    line), which flame graph tools read directly.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    def start(self, interval: Optional[float] = None):
+        with self._lock:
+            if interval:
+                self.interval = interval
+            if self._thread is None or not self._thread.is_alive():
+                self._running.set()
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while self._running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def report(self, limit: int = 200) -> str:
+        with self._lock:
+            common = self._stacks.most_common(limit)
+        return ''.join(f"{stack} {count}\n" for stack, count in common)
+
+# The service's metrics
+REGISTRY = Registry()
+# Successful requests are counted by msme_request_seconds_count
+request_seconds = REGISTRY.histogram('msme_request_seconds', 'Latency of successful requests', ('endpoint',))
+request_failures = REGISTRY.counter('msme_request_failures_total', 'Failed requests by endpoint and outcome (invalid or error)',
+                                    ('endpoint', 'outcome'))
+stage_seconds = REGISTRY.histogram('msme_stage_seconds', 'Time per processing stage, sampled; path is request or batch',
+                                   ('path', 'stage'))
+batches_total = REGISTRY.counter('msme_batches_total', 'Batches scored through score_records')
+batch_records_total = REGISTRY.counter('msme_batch_records_total', 'Valid applications scored through score_records')
+batch_size = REGISTRY.histogram('msme_batch_size', 'Records per scored batch', buckets=SIZE_BUCKETS)
+validation_failures = REGISTRY.counter('msme_validation_failures_total', 'Rejected applications, by offending field',
+                                       ('field',))
+errors_total = REGISTRY.counter('msme_errors_total', 'Unexpected errors, by endpoint and exception type',
+                                ('endpoint', 'type'))
+profiler = SamplingProfiler()
+
+ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+STAGE_SAMPLE_EVERY = max(1, int(os.getenv('METRICS_STAGE_SAMPLE', '64')))
+# True once every STAGE_SAMPLE_EVERY draws
+_stage_samples = itertools.cycle((True,) + (False,) * (STAGE_SAMPLE_EVERY - 1))
+
+def stage_timer():
+    """A StageTimer for one request or batch in STAGE_SAMPLE_EVERY, otherwise the no-op UNSAMPLED"""
+    return StageTimer() if ENABLED and next(_stage_samples) else UNSAMPLED
+
+def observe_stages(path: str, timer):
+    if timer.sampled:
+        stage_seconds.observe_many(((path, stage), seconds) for stage, seconds in timer.timings().items())
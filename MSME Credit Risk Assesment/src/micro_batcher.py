@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+import metrics
+from batch_validation import validate_batch
+from credit_risk_model import CreditRiskAssessor
+
+class MicroBatcher:
+    """Coalesce concurrent single-record assessments into small score_batch calls.
+
+    Request threads call submit() and wait on the returned Future. A single
+    scoring thread drains the queue, closing a batch after `max_wait` seconds
+    or `max_batch_size` records, whichever comes first, then validates and
+    scores the batch in one go and resolves every caller's Future.
+
+    Handing a request to the scoring thread and back costs more than scoring
+    it alone, so batching only pays once many requests arrive together.
+    assess() scores in the caller's thread until `min_concurrency` requests
+    are being assessed at once, and batches beyond that.
+    """
+
+    def __init__(self, assessor: CreditRiskAssessor, max_batch_size: int = 256, max_wait: float = 0.0001,
+                 min_concurrency: int = 32):
+        self.assessor = assessor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.min_concurrency = min_concurrency
+        self.batches = 0
+        self.records = 0
+        self.inline = 0
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='assess-micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict[str, Any], pd_model=None) -> Future:
+        """Queue one JSON record; the Future resolves to a result dict or a ValueError"""
+        future = Future()
+        self._queue.put((record, future, pd_model))
+        return future
+
+    def assess(self, record: Dict[str, Any], inline: Callable[[], Any], pd_model=None) -> Any:
+        """The result for one JSON record: `inline()` when few requests are in flight, otherwise
+        the micro-batched result (a ValueError from the batch is raised)"""
+        with self._active_lock:
+            self._active += 1
+            batched = self._active >= self.min_concurrency
+        try:
+            if batched:
+                return self.submit(record, pd_model).result()
+            self.inline += 1
+            return inline()
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # Whatever is already queued joins the batch even once the window has closed
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch: List[Tuple[Dict[str, Any], Future, Any]]):
+        self.batches += 1
+        self.records += len(batch)
+        # Requests may ask for different PD models; score each group as one batch
+        groups: Dict[int, List[Tuple[Dict[str, Any], Future, Any]]] = {}
+        for item in batch:
+            groups.setdefault(id(item[2]), []).append(item)
+
+        for group in groups.values():
+            try:
+                results = score_records([record for record, _, _ in group], self.assessor, group[0][2])
+            except Exception as e:
+                for _, future, _ in group:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(group, results):
+                if isinstance(result, ValueError):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+def score_records(records: List[Dict[str, Any]], assessor: CreditRiskAssessor, pd_model=None) -> List[Any]:
+    """Validate and score JSON records as one batch.
+
+    Returns one entry per input record, in order: a dict with risk_score,
+    risk_tier, probability_of_default and config_version, or a ValueError
+    naming every invalid field of that record. With a `pd_model` (a
+    pd_model.PDModel), probability_of_default comes from that model and the
+    dict also names its version under 'pd_model'.
+    """
+    timer = metrics.stage_timer()
+    # One plan for the whole batch, even if the config reloads meanwhile
+    plan = assessor.plan
+    batch, errors = validate_batch(records, plan.categories)
+    timer.mark('validate_batch')
+    components = {} if timer.sampled else None
+    scores = assessor.score_batch(batch, plan, components)
+    timer.mark('final_score', components)
+    probability_of_default = scores['probability_of_default']
+    if pd_model is not None:
+        probability_of_default = pd_model.predict(batch)
+        timer.mark('pd_model')
+
+    results: List[Any] = [None] * len(records)
+    for row, risk_score, risk_tier, pd in zip(batch.row_index.tolist(), scores['risk_score'].tolist(),
+                                              scores['risk_tier'].tolist(), probability_of_default.tolist()):
+        results[row] = {'risk_score': risk_score, 'risk_tier': risk_tier, 'probability_of_default': pd,
+                        'config_version': plan.version}
+        if pd_model is not None:
+            results[row]['pd_model'] = pd_model.version
+
+    messages: Dict[int, List[str]] = {}
+    for error in errors:
+        messages.setdefault(error.row, []).append(f"{error.field}: {error.message}")
+    for row, problems in messages.items():
+        results[row] = ValueError('; '.join(problems))
+    timer.mark('results')
+
+    metrics.observe_stages('batch', timer)
+    metrics.batches_total.inc()
+    metrics.batch_size.observe(len(records))
+    metrics.batch_records_total.inc(amount=len(batch))
+    for error in errors:
+        metrics.validation_failures.inc(error.field)
+    return results
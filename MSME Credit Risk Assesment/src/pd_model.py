@@ -0,0 +1,240 @@
+"""Logistic probability-of-default model trained on repayment outcomes.
+
+Run from the src directory:
+
+    python pd_model.py train outcomes.csv --model models/pd_model
+    python pd_model.py update new_outcomes.csv --model models/pd_model
+
+The outcomes file holds the BusinessData fields plus a 0/1 `defaulted`
+column. Training fits a logistic regression by SGD on log loss and reports
+AUC, Brier score and calibration on a holdout, next to the heuristic
+1 - score/100. `update` continues training on newly labelled rows with
+partial_fit.
+
+The model directory holds a compact serving artifact, model.json plus
+weights.npy, with feature scaling folded into the weights. Loading it
+memory-maps the weights and takes milliseconds. Inference is one dense dot
+product plus a table lookup per categorical field. trainer.pkl keeps the SGD
+state; only `update` needs it.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from batch_validation import FIELD_SPECS, validate_batch
+from credit_risk_model import CreditRiskAssessor
+
+NUMERIC_FEATURES = tuple(name for name, (kind, _, _) in FIELD_SPECS.items() if kind in ('float', 'int'))
+CATEGORICAL_FEATURES = ('industry_risk', 'location_type', 'business_type')
+LABEL = 'defaulted'
+
+ARTIFACT_FORMAT = 1
+
+class PDModel:
+    """Serving side of the PD model: memory-mapped weights and a vectorized predict()"""
+
+    def __init__(self, meta: Dict[str, Any], weights: np.ndarray):
+        self.meta = meta
+        self.version = meta['version']
+        self.weights = weights
+        self.intercept = float(weights[0])
+        self.numeric_weights = weights[1:1 + len(NUMERIC_FEATURES)].tolist()
+
+        # One weight table per categorical field; unseen values score 0
+        offset = 1 + len(NUMERIC_FEATURES)
+        self.category_weights = {}
+        for field in CATEGORICAL_FEATURES:
+            values = meta['categories'][field]
+            self.category_weights[field] = dict(zip(values, weights[offset:offset + len(values)].tolist()))
+            offset += len(values)
+
+    @classmethod
+    def load(cls, path: str) -> 'PDModel':
+        with open(os.path.join(path, 'model.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported PD model artifact format in {path}")
+        return cls(meta, np.load(os.path.join(path, 'weights.npy'), mmap_mode='r'))
+
+    def predict(self, data: Mapping[str, Sequence]) -> np.ndarray:
+        """Probability of default for a batch; `data` is anything score_batch accepts"""
+        # Accumulating column by column avoids materialising a rows x features matrix
+        logit = np.full(len(data['industry_risk']), self.intercept)
+        for name, weight in zip(NUMERIC_FEATURES, self.numeric_weights):
+            logit += weight * np.asarray(data[name], dtype=np.float64)
+        for field in CATEGORICAL_FEATURES:
+            logit += _category_lookup(data[field], self.category_weights[field], field == 'industry_risk')
+        return 1 / (1 + np.exp(-logit))
+
+def _category_lookup(values: Sequence, weights: Dict[str, float], lowercase: bool) -> np.ndarray:
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        categorical = values if isinstance(values, pd.Categorical) else pd.Categorical(values)
+        codes, uniques = categorical.codes, categorical.categories
+    else:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    table = np.array([weights.get(str(value).lower() if lowercase else value, 0.0) for value in uniques] + [0.0])
+    return table[codes]
+
+class PDModelTrainer:
+    """Training side: feature encoding, the SGD classifier and artifact export"""
+
+    def __init__(self, categories: Dict[str, List[str]], mean: np.ndarray, scale: np.ndarray, alpha: float = 1e-4,
+                 seed: int = 0):
+        from sklearn.linear_model import SGDClassifier
+
+        self.categories = categories
+        self.mean = mean
+        self.scale = scale
+        self.classifier = SGDClassifier(loss='log_loss', alpha=alpha, max_iter=50, tol=1e-5, random_state=seed)
+        self.rows = 0
+        self.updates = 0
+        self.trained_at = time.strftime('%Y%m%d%H%M%S')
+
+    @classmethod
+    def for_data(cls, data: Mapping[str, Sequence], **kwargs) -> 'PDModelTrainer':
+        """Fix the feature encoding (scaling, category levels) from the initial training data"""
+        numeric = _numeric_matrix(data)
+        scale = numeric.std(axis=0)
+        categories = {field: sorted(pd.unique(np.asarray(data[field], dtype=object)).tolist())
+                      for field in CATEGORICAL_FEATURES}
+        return cls(categories, numeric.mean(axis=0), np.where(scale > 0, scale, 1.0), **kwargs)
+
+    def design_matrix(self, data: Mapping[str, Sequence]) -> np.ndarray:
+        columns = [(_numeric_matrix(data) - self.mean) / self.scale]
+        for field in CATEGORICAL_FEATURES:
+            values = np.asarray(data[field], dtype=object)
+            columns.append(np.stack([values == level for level in self.categories[field]], axis=1).astype(np.float64))
+        return np.hstack(columns)
+
+    def fit(self, data: Mapping[str, Sequence], labels: np.ndarray):
+        self.classifier.fit(self.design_matrix(data), labels)
+        self.rows += len(labels)
+
+    def partial_fit(self, data: Mapping[str, Sequence], labels: np.ndarray):
+        self.classifier.partial_fit(self.design_matrix(data), labels, classes=np.array([0, 1]))
+        self.rows += len(labels)
+        self.updates += 1
+
+    @property
+    def version(self) -> str:
+        return f"{self.trained_at}.{self.updates}"
+
+    def serving_model(self, metrics: Optional[Dict[str, float]] = None) -> PDModel:
+        """The current fit as a PDModel, with the feature scaling folded into its weights"""
+        coef = self.classifier.coef_[0]
+        numeric_coef = coef[:len(NUMERIC_FEATURES)] / self.scale
+        intercept = self.classifier.intercept_[0] - float(numeric_coef @ self.mean)
+        weights = np.concatenate([[intercept], numeric_coef, coef[len(NUMERIC_FEATURES):]])
+        meta = {
+            'format': ARTIFACT_FORMAT,
+            'version': self.version,
+            'rows': self.rows,
+            'numeric_features': list(NUMERIC_FEATURES),
+            'categories': self.categories,
+            'metrics': metrics or {}
+        }
+        return PDModel(meta, weights)
+
+    def export(self, path: str, metrics: Optional[Dict[str, float]] = None) -> PDModel:
+        """Write the serving artifact and the trainer state to the `path` directory"""
+        model = self.serving_model(metrics)
+        os.makedirs(path, exist_ok=True)
+        # Every file is written aside and renamed, so a serving process never
+        # maps a half-written artifact
+        _replace(os.path.join(path, 'weights.npy'), lambda f: np.save(f, np.asarray(model.weights)))
+        _replace(os.path.join(path, 'trainer.pkl'), lambda f: pickle.dump(self, f))
+        _replace(os.path.join(path, 'model.json'), lambda f: f.write(json.dumps(model.meta, indent=2).encode('utf-8')))
+        return model
+
+    @classmethod
+    def load(cls, path: str) -> 'PDModelTrainer':
+        with open(os.path.join(path, 'trainer.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+def _numeric_matrix(data: Mapping[str, Sequence]) -> np.ndarray:
+    return np.column_stack([np.asarray(data[name], dtype=np.float64) for name in NUMERIC_FEATURES])
+
+def _replace(path: str, write):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+def evaluate(probabilities: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    """Discrimination and calibration of PD estimates against observed defaults"""
+    from sklearn.metrics import log_loss, roc_auc_score
+
+    clipped = np.clip(probabilities, 1e-6, 1 - 1e-6)
+    # Expected calibration error over ten equal-width PD bins
+    bins = np.minimum((probabilities * 10).astype(int), 9)
+    counts = np.bincount(bins, minlength=10)
+    gaps = np.abs(np.bincount(bins, probabilities, 10) - np.bincount(bins, labels, 10))
+    return {
+        'auc': float(roc_auc_score(labels, probabilities)) if 0 < labels.sum() < len(labels) else float('nan'),
+        'brier': float(np.mean((probabilities - labels) ** 2)),
+        'log_loss': float(log_loss(labels, clipped, labels=[0, 1])),
+        'calibration_error': float(gaps.sum() / counts.sum()),
+        'mean_pd': float(probabilities.mean()),
+        'default_rate': float(labels.mean())
+    }
+
+def load_outcomes(path: str, assessor: CreditRiskAssessor):
+    """Validated BusinessBatch and 0/1 labels from a CSV of BusinessData fields plus `defaulted`"""
+    frame = pd.read_csv(path)
+    if LABEL not in frame:
+        raise ValueError(f"{path} has no {LABEL} column")
+    labels = pd.to_numeric(frame[LABEL], errors='coerce')
+    labelled = labels.isin([0, 1]).to_numpy()
+    batch, errors = validate_batch(frame[labelled].reset_index(drop=True), assessor.plan.categories)
+    if errors:
+        print(f"Skipping {len(set(error.row for error in errors)):,} invalid rows")
+    return batch, labels.to_numpy(dtype=np.int64, na_value=-1)[labelled][batch.row_index]
+
+def train(path: str, model_path: str, holdout: float = 0.2, seed: int = 0) -> Dict[str, Any]:
+    assessor = CreditRiskAssessor()
+    batch, labels = load_outcomes(path, assessor)
+    rng = np.random.default_rng(seed)
+    is_holdout = rng.random(len(labels)) < holdout
+    train_rows = {name: np.asarray(batch[name])[~is_holdout] for name in batch.keys()}
+    test_rows = {name: np.asarray(batch[name])[is_holdout] for name in batch.keys()}
+
+    trainer = PDModelTrainer.for_data(train_rows, seed=seed)
+    trainer.fit(train_rows, labels[~is_holdout])
+    metrics = evaluate(trainer.serving_model().predict(test_rows), labels[is_holdout])
+    heuristic = evaluate(assessor.score_batch(test_rows)['probability_of_default'], labels[is_holdout])
+    trainer.export(model_path, {**metrics, 'holdout_rows': int(is_holdout.sum())})
+    return {'version': trainer.version, 'rows': trainer.rows, 'model': metrics, 'heuristic': heuristic}
+
+def update(path: str, model_path: str) -> Dict[str, Any]:
+    assessor = CreditRiskAssessor()
+    batch, labels = load_outcomes(path, assessor)
+    trainer = PDModelTrainer.load(model_path)
+    # Scored before the update, the new outcomes are an honest out-of-sample test
+    before = evaluate(PDModel.load(model_path).predict(batch), labels)
+    trainer.partial_fit(batch, labels)
+    trainer.export(model_path, {**before, 'evaluated_on': 'rows of the latest update, before it'})
+    return {'version': trainer.version, 'rows': trainer.rows, 'model_before_update': before}
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or update the probability-of-default model")
+    parser.add_argument('command', choices=['train', 'update'])
+    parser.add_argument('outcomes', help="CSV of BusinessData fields plus a 0/1 'defaulted' column")
+    parser.add_argument('--model', default='pd_model', help="model directory (default: pd_model)")
+    parser.add_argument('--holdout', type=float, default=0.2, help="share of rows held out for evaluation (train)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        result = train(args.outcomes, args.model, args.holdout, args.seed)
+    else:
+        result = update(args.outcomes, args.model)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
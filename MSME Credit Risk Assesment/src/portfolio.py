@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Segment dimensions of the portfolio views, in the order entries store them
+DIMENSIONS = ('industry_risk', 'location_type', 'business_type', 'risk_tier')
+
+# entry: (industry_risk, location_type, business_type, risk_tier, exposure, probability_of_default)
+Entry = Tuple[str, str, str, str, float, float]
+
+class PortfolioAggregator:
+    """Running exposure and PD totals of the assessed book, per segment.
+
+    Every application contributes to one segment per dimension plus the
+    portfolio total. Adding, replacing or removing an application touches
+    only those five accumulators, so each update is O(1) and a breakdown
+    reads totals that are already there.
+
+    With a `snapshot_path`, every update is also appended to a journal next to
+    the snapshot. snapshot() writes the full state and starts a fresh journal.
+    On start-up the snapshot and journals are replayed; updates are idempotent
+    (put sets an application's state, delete removes it), so replaying a
+    journal already covered by the snapshot is harmless.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self.version = 0
+        self.snapshots = 0
+        self._entries: Dict[str, Entry] = {}
+        # dimension -> segment -> [count, exposure, sum of PD, sum of exposure * PD]
+        self._segments: Dict[str, Dict[str, list]] = {dimension: {} for dimension in DIMENSIONS}
+        self._total = [0, 0.0, 0.0, 0.0]
+        self._lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        if snapshot_path:
+            self._restore()
+            self._journal = open(self._journal_path, 'a')
+
+    @property
+    def _journal_path(self) -> str:
+        return self.snapshot_path + '.journal'
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, application_id: str, industry_risk: str, location_type: str, business_type: str, risk_tier: str,
+            exposure: float, probability_of_default: float):
+        """Add an application's latest assessment, replacing any earlier one"""
+        entry = (industry_risk, location_type, business_type, risk_tier, float(exposure), float(probability_of_default))
+        with self._lock:
+            self._apply_put(str(application_id), entry)
+            self._log(['put', str(application_id), *entry])
+
+    def remove(self, application_id: str) -> bool:
+        """Drop an application from the book; False if it was not in it"""
+        with self._lock:
+            removed = self._apply_remove(str(application_id))
+            if removed:
+                self._log(['del', str(application_id)])
+        return removed
+
+    def _apply_put(self, application_id: str, entry: Entry):
+        previous = self._entries.get(application_id)
+        if previous is not None:
+            self._add(previous, -1)
+        self._entries[application_id] = entry
+        self._add(entry, 1)
+        self.version += 1
+
+    def _apply_remove(self, application_id: str) -> bool:
+        previous = self._entries.pop(application_id, None)
+        if previous is None:
+            return False
+        self._add(previous, -1)
+        self.version += 1
+        return True
+
+    def _add(self, entry: Entry, sign: int):
+        exposure, pd = entry[4], entry[5]
+        for totals in [self._total] + [self._segments[dimension].setdefault(entry[i], [0, 0.0, 0.0, 0.0])
+                                       for i, dimension in enumerate(DIMENSIONS)]:
+            totals[0] += sign
+            totals[1] += sign * exposure
+            totals[2] += sign * pd
+            totals[3] += sign * exposure * pd
+        if sign < 0:
+            # Empty segments disappear instead of keeping rounding residue
+            for i, dimension in enumerate(DIMENSIONS):
+                if self._segments[dimension][entry[i]][0] == 0:
+                    del self._segments[dimension][entry[i]]
+            if self._total[0] == 0:
+                self._total = [0, 0.0, 0.0, 0.0]
+
+    def _log(self, operation: list):
+        if self._journal is not None:
+            self._journal.write(json.dumps(operation, separators=(',', ':')) + '\n')
+            self._journal.flush()
+
+    def breakdown(self, dimension: Optional[str] = None) -> Dict[str, Any]:
+        """Totals for the whole book and per segment of one dimension (default: all of them)"""
+        dimensions = DIMENSIONS if dimension is None else (dimension,)
+        if dimension is not None and dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension!r} (expected one of {', '.join(DIMENSIONS)})")
+        with self._lock:
+            total_exposure = self._total[1]
+            return {
+                'version': self.version,
+                'total': _summary(self._total, total_exposure),
+                'segments': {name: {segment: _summary(totals, total_exposure)
+                                    for segment, totals in self._segments[name].items()}
+                             for name in dimensions}
+            }
+
+    def snapshot(self):
+        """Write the whole book to snapshot_path and start a new journal"""
+        if not self.snapshot_path:
+            return
+        old_journal = self._journal_path + '.old'
+        with self._lock:
+            entries = dict(self._entries)
+            version = self.version
+            self._journal.close()
+            if os.path.exists(old_journal):
+                # The last snapshot never completed; keep its journal too
+                with open(old_journal, 'a') as old, open(self._journal_path) as current:
+                    old.write(current.read())
+                os.remove(self._journal_path)
+            else:
+                os.replace(self._journal_path, old_journal)
+            self._journal = open(self._journal_path, 'a')
+
+        # Written outside the lock; updates meanwhile go to the new journal
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': version, 'saved_at': time.time(), 'entries': entries}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        os.remove(old_journal)
+        self.snapshots += 1
+
+    def _restore(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            for application_id, entry in snapshot['entries'].items():
+                self._apply_put(application_id, tuple(entry))
+            self.version = snapshot['version']
+
+        for path in (self._journal_path + '.old', self._journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        operation = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+                    if operation[0] == 'put':
+                        self._apply_put(operation[1], tuple(operation[2:]))
+                    else:
+                        self._apply_remove(operation[1])
+
+    def start_snapshots(self, interval: float = 60.0) -> 'PortfolioAggregator':
+        """Snapshot every `interval` seconds in a background thread, if anything changed"""
+        if self.snapshot_path and self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='portfolio-snapshots', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self, interval: float):
+        saved = self.version
+        while True:
+            time.sleep(interval)
+            if self.version != saved:
+                saved = self.version
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    print(f"Could not snapshot the portfolio to {self.snapshot_path}: {e}")
+
+def _summary(totals: list, total_exposure: float) -> Dict[str, Any]:
+    count, exposure, pd_sum, expected_loss = totals
+    return {
+        'count': count,
+        'exposure': exposure,
+        'exposure_share': exposure / total_exposure if total_exposure else 0.0,
+        'average_pd': pd_sum / count if count else 0.0,
+        # Exposure-weighted PD: expected loss per unit of exposure, at 100% loss given default
+        'exposure_weighted_pd': expected_loss / exposure if exposure else 0.0,
+        'expected_loss': expected_loss
+    }
@@ -0,0 +1,249 @@
+"""Score a whole loan-book file in streaming chunks across a process pool.
+
+Run from the src directory:
+
+    python score_portfolio.py loan_book.csv scores.csv --chunk-size 100000 --workers 8
+
+Input and output may be CSV, NDJSON (.ndjson/.jsonl) or Parquet; the format
+follows the file extension. Only a bounded number of chunks is in flight at
+once, so memory stays flat however large the input is. Results are written in
+input order, and a checkpoint is saved after every chunk so an interrupted run
+can continue with --resume.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from batch_validation import validate_batch
+from credit_risk_model import CreditRiskAssessor
+
+RESULT_COLUMNS = ['row', 'risk_score', 'risk_tier', 'probability_of_default',
+                  'core_score', 'alternative_score', 'metadata_score', 'config_version', 'error']
+
+_assessor = None
+
+def file_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    raise ValueError(f"Unsupported file type: {path} (expected .csv, .ndjson, .jsonl or .parquet)")
+
+def _require_pyarrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Parquet support needs pyarrow: pip install pyarrow")
+    return pyarrow.parquet
+
+def read_chunks(path: str, chunk_size: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield the input as DataFrames of at most `chunk_size` rows, after `skip_rows`"""
+    fmt = file_format(path)
+    if fmt == 'csv':
+        # skiprows takes a range, so skipping costs no memory
+        yield from pd.read_csv(path, chunksize=chunk_size, skiprows=range(1, skip_rows + 1))
+        return
+
+    if fmt == 'ndjson':
+        chunks = pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        parquet = _require_pyarrow()
+        chunks = (batch.to_pandas() for batch in parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size))
+
+    # NDJSON and Parquet readers cannot seek by row; resumed chunks are read
+    # and dropped, which still happens one chunk at a time
+    for chunk in chunks:
+        if skip_rows >= len(chunk):
+            skip_rows -= len(chunk)
+            continue
+        yield chunk.iloc[skip_rows:]
+        skip_rows = 0
+
+def count_rows(path: str) -> Optional[int]:
+    # Only Parquet knows its row count without a full pass
+    if file_format(path) == 'parquet':
+        return _require_pyarrow().ParquetFile(path).metadata.num_rows
+    return None
+
+def _init_worker(config_path: Optional[str] = None):
+    global _assessor
+    _assessor = CreditRiskAssessor(config_path)
+
+def score_chunk(chunk: pd.DataFrame, first_row: int, keep_columns: List[str]) -> pd.DataFrame:
+    """Validate and score one chunk; invalid rows get an error message instead of scores"""
+    if _assessor is None:
+        _init_worker()
+    plan = _assessor.plan
+    batch, errors = validate_batch(chunk, plan.categories)
+    scores = _assessor.score_batch(batch, plan)
+
+    result = pd.DataFrame({'row': pd.RangeIndex(first_row, first_row + len(chunk))})
+    for column in keep_columns:
+        result[column] = chunk[column].to_numpy()
+    for column in RESULT_COLUMNS[1:-2]:
+        result[column] = pd.Series(scores[column], index=batch.row_index)
+    result['config_version'] = plan.version
+
+    messages = {}
+    for error in errors:
+        messages.setdefault(error.row, []).append(f"{error.field}: {error.message}")
+    result['error'] = pd.Series({row: '; '.join(problems) for row, problems in messages.items()}, dtype=object)
+    result['risk_score'] = result['risk_score'].astype('Int64')
+    return result
+
+class ResultWriter:
+    """Append result chunks to the output, supporting truncation back to a checkpoint.
+
+    CSV and NDJSON go to a single file whose byte size is checkpointed.
+    Parquet files cannot be appended to once closed, so Parquet output is a
+    directory holding one part file per chunk.
+    """
+
+    def __init__(self, path: str, resume_position: int = 0):
+        self.path = path
+        self.format = file_format(path)
+        self.position = resume_position
+        if self.format == 'parquet':
+            os.makedirs(path, exist_ok=True)
+            # Drop parts from chunks that finished after the last checkpoint
+            for name in os.listdir(path):
+                if name.startswith('part-') and int(name[5:10]) >= resume_position:
+                    os.remove(os.path.join(path, name))
+        else:
+            with open(path, 'ab') as f:
+                f.truncate(resume_position)
+
+    def write(self, result: pd.DataFrame):
+        if self.format == 'parquet':
+            _require_pyarrow()
+            result.to_parquet(os.path.join(self.path, f'part-{self.position:05d}.parquet'), index=False)
+            self.position += 1
+            return
+
+        if self.format == 'csv':
+            text = result.to_csv(index=False, header=(self.position == 0))
+        else:
+            text = result.to_json(orient='records', lines=True)
+            if not text.endswith('\n'):
+                text += '\n'
+        data = text.encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.position += len(data)
+
+def load_checkpoint(path: str, input_path: str, chunk_size: int) -> dict:
+    if not os.path.exists(path):
+        return {'chunks_done': 0, 'rows_done': 0, 'output_position': 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['input'] != os.path.abspath(input_path) or checkpoint['chunk_size'] != chunk_size:
+        raise SystemExit(f"Checkpoint {path} belongs to a different input or chunk size")
+    return checkpoint
+
+def save_checkpoint(path: str, input_path: str, chunk_size: int, chunks_done: int, rows_done: int, output_position: int):
+    # Write then rename so a crash never leaves a half-written checkpoint
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'input': os.path.abspath(input_path), 'chunk_size': chunk_size, 'chunks_done': chunks_done,
+                   'rows_done': rows_done, 'output_position': output_position}, f)
+    os.replace(temp_path, path)
+
+def print_progress(rows_done: int, total_rows: Optional[int], rows_this_run: int, started: float, errors: int):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    done = f"{rows_done:,}" + (f"/{total_rows:,} ({rows_done / total_rows:.1%})" if total_rows else "")
+    sys.stderr.write(f"\rScored {done} rows, {errors:,} invalid, {rows_this_run / elapsed:,.0f} rows/s ")
+    sys.stderr.flush()
+
+def score_portfolio(input_path: str, output_path: str, chunk_size: int = 100_000, workers: int = 1,
+                    checkpoint_path: Optional[str] = None, resume: bool = False,
+                    keep_columns: Optional[List[str]] = None, progress: bool = True,
+                    config_path: Optional[str] = None) -> dict:
+    """Stream `input_path` through the scorer into `output_path`; returns run statistics"""
+    keep_columns = keep_columns or []
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint.json'
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_path, input_path, chunk_size)
+    else:
+        checkpoint = {'chunks_done': 0, 'rows_done': 0, 'output_position': 0}
+        if os.path.exists(output_path) and file_format(output_path) != 'parquet':
+            os.remove(output_path)
+
+    writer = ResultWriter(output_path, checkpoint['output_position'])
+    chunks_done = checkpoint['chunks_done']
+    rows_done = resumed_rows = checkpoint['rows_done']
+    total_rows = count_rows(input_path)
+    errors = 0
+    started = time.perf_counter()
+
+    def finish(result: pd.DataFrame):
+        nonlocal chunks_done, rows_done, errors
+        writer.write(result)
+        chunks_done += 1
+        rows_done += len(result)
+        errors += int(result['error'].notna().sum())
+        save_checkpoint(checkpoint_path, input_path, chunk_size, chunks_done, rows_done, writer.position)
+        if progress:
+            print_progress(rows_done, total_rows, rows_done - resumed_rows, started, errors)
+
+    chunks = read_chunks(input_path, chunk_size, skip_rows=rows_done)
+    first_row = rows_done
+    if workers <= 1:
+        _init_worker(config_path)
+        for chunk in chunks:
+            finish(score_chunk(chunk, first_row, keep_columns))
+            first_row += len(chunk)
+    else:
+        # At most two chunks per worker are pending; results are written
+        # strictly in submission order, i.e. input order
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, first_row, keep_columns))
+                first_row += len(chunk)
+                if len(pending) >= 2 * workers:
+                    finish(pending.popleft().result())
+            while pending:
+                finish(pending.popleft().result())
+
+    elapsed = time.perf_counter() - started
+    if progress:
+        sys.stderr.write("\n")
+    return {'rows': rows_done, 'rows_this_run': rows_done - resumed_rows, 'chunks': chunks_done - checkpoint['chunks_done'],
+            'invalid_rows': errors, 'seconds': elapsed,
+            'rows_per_second': (rows_done - resumed_rows) / elapsed if elapsed > 0 else 0.0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV, NDJSON or Parquet loan book in streaming chunks")
+    parser.add_argument('input', help="loan book file (.csv, .ndjson/.jsonl or .parquet)")
+    parser.add_argument('output', help="results file (.csv, .ndjson/.jsonl) or directory (.parquet)")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--checkpoint', help="checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument('--resume', action='store_true', help="continue from the last checkpoint")
+    parser.add_argument('--keep', default='', help="comma-separated input columns to copy into the output, e.g. an ID")
+    parser.add_argument('--config', help="scoring config file (default: scoring_config.json)")
+    parser.add_argument('--quiet', action='store_true', help="no progress display")
+    args = parser.parse_args()
+
+    stats = score_portfolio(args.input, args.output, chunk_size=args.chunk_size, workers=args.workers,
+                            checkpoint_path=args.checkpoint, resume=args.resume,
+                            keep_columns=[column for column in args.keep.split(',') if column],
+                            progress=not args.quiet, config_path=args.config)
+
+    print(f"Scored {stats['rows_this_run']:,} rows in {stats['chunks']} chunks "
+          f"({stats['invalid_rows']:,} invalid) in {stats['seconds']:.1f} s: {stats['rows_per_second']:,.0f} rows/s")
+
+if __name__ == "__main__":
+    main()
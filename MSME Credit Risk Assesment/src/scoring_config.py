@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scoring_config.json')
+
+class ScoringPlan(NamedTuple):
+    """Every coefficient, cap and threshold of the scorer as one flat, immutable record.
+
+    Compiled once from the versioned JSON config; the scoring methods read a
+    single plan per call, so swapping in a new plan never mixes two configs.
+    """
+    version: str
+
+    core_weight: float
+    alternative_weight: float
+    metadata_weight: float
+
+    vintage_cap: float
+    delay_penalty: float
+    turnover_cap: float
+    profit_offset: float
+    profit_range: float
+
+    gst_delay_days: float
+    upi_cap: float
+    social_rating_max: float
+    balance_cap: float
+    ecommerce_rating_max: float
+    return_rate_cap: float
+
+    employee_cap: float
+
+    industry_risk_scores: Dict[str, float]
+    location_scores: Dict[str, float]
+
+    low_risk_min: float
+    moderate_risk_min: float
+    pd_floor: float
+    pd_ceiling: float
+
+    @property
+    def categories(self) -> Dict[str, Tuple[str, ...]]:
+        """Allowed values of the categorical fields, for validate_batch"""
+        return {'industry_risk': tuple(self.industry_risk_scores), 'location_type': tuple(self.location_scores)}
+
+def compile_config(config: Dict[str, Any]) -> ScoringPlan:
+    """Check a parsed scoring config and flatten it into a ScoringPlan"""
+    def number(section: str, key: str, positive: bool = False) -> float:
+        try:
+            value = config[section][key]
+        except (KeyError, TypeError):
+            raise ValueError(f"Scoring config is missing {section}.{key}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Scoring config {section}.{key} must be a number")
+        if positive and value <= 0:
+            raise ValueError(f"Scoring config {section}.{key} must be positive")
+        return value
+
+    def scores(section: str) -> Dict[str, float]:
+        mapping = config.get(section)
+        if not isinstance(mapping, dict) or not mapping:
+            raise ValueError(f"Scoring config {section} must be a non-empty mapping")
+        return {str(key).lower(): number(section, key) for key in mapping}
+
+    if not isinstance(config.get('version'), (str, int)):
+        raise ValueError("Scoring config needs a version")
+
+    plan = ScoringPlan(
+        version=str(config['version']),
+
+        core_weight=number('weights', 'core'),
+        alternative_weight=number('weights', 'alternative'),
+        metadata_weight=number('weights', 'metadata'),
+
+        vintage_cap=number('core', 'vintage_cap_years', positive=True),
+        delay_penalty=number('core', 'repayment_delay_penalty'),
+        turnover_cap=number('core', 'turnover_cap_lakhs', positive=True),
+        profit_offset=number('core', 'profit_margin_offset'),
+        profit_range=number('core', 'profit_margin_range', positive=True),
+
+        gst_delay_days=number('alternative', 'gst_delay_days', positive=True),
+        upi_cap=number('alternative', 'upi_volume_cap_lakhs', positive=True),
+        social_rating_max=number('alternative', 'social_rating_max', positive=True),
+        balance_cap=number('alternative', 'balance_cap_thousands', positive=True),
+        ecommerce_rating_max=number('alternative', 'ecommerce_rating_max', positive=True),
+        return_rate_cap=number('alternative', 'return_rate_cap'),
+
+        employee_cap=number('metadata', 'employee_cap', positive=True),
+
+        industry_risk_scores=scores('industry_risk_scores'),
+        location_scores=scores('location_scores'),
+
+        low_risk_min=number('tiers', 'low_risk_min'),
+        moderate_risk_min=number('tiers', 'moderate_risk_min'),
+        pd_floor=number('probability_of_default', 'floor'),
+        pd_ceiling=number('probability_of_default', 'ceiling')
+    )
+
+    if plan.moderate_risk_min > plan.low_risk_min:
+        raise ValueError("Scoring config tiers.moderate_risk_min must not exceed tiers.low_risk_min")
+    if not 0 <= plan.pd_floor <= plan.pd_ceiling <= 1:
+        raise ValueError("Scoring config probability_of_default bounds must satisfy 0 <= floor <= ceiling <= 1")
+    return plan
+
+def load_plan(path: str = DEFAULT_CONFIG_PATH) -> ScoringPlan:
+    with open(path) as f:
+        return compile_config(json.load(f))
+
+class ConfigWatcher:
+    """Poll a scoring config file and hot-swap the assessor's plan when it changes.
+
+    The new file is fully parsed and compiled before the single reference
+    assignment that publishes it, so in-flight requests finish on the plan
+    they started with. A broken file is reported and the old plan kept.
+    """
+
+    def __init__(self, assessor, path: Optional[str] = None, interval: float = 1.0):
+        self.assessor = assessor
+        self.path = path or assessor.config_path
+        self.interval = interval
+        self.reloads = 0
+        self._stamp = self._file_stamp()
+        self._thread = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Reload if the file changed since the last check; True if a new plan went live"""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            plan = load_plan(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Keeping scoring config {self.assessor.plan.version}: could not load {self.path}: {e}")
+            return False
+        self.assessor.plan = plan
+        self.reloads += 1
+        print(f"Loaded scoring config {plan.version} from {self.path}")
+        return True
+
+    def start(self) -> 'ConfigWatcher':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='scoring-config-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
@@ -0,0 +1,363 @@
+"""Derive the UPI and balance fields of BusinessData from raw UPI transaction logs.
+
+Run from the src directory:
+
+    python upi_features.py transactions.csv -o upi_features.csv
+    python upi_features.py transactions.csv --shards 8 --workers 8 --applications applications.csv -o loan_book.csv
+
+A transaction log has one row per UPI transaction with the columns
+business_id, timestamp, amount (rupees, credits and debits alike) and,
+optionally, balance (account balance in rupees after the transaction). Each
+business's transactions must appear in time order, as they do in
+chronological exports; rows of different businesses may interleave freely.
+
+Logs are streamed in chunks and every business is reduced to a fixed set of
+running totals: the month still being filled, plus a Welford mean and
+variance over its finished months. Memory therefore grows with the number
+of businesses, never with the number of transactions. Businesses are
+independent, so logs partitioned by business id (--sharded, or split on the
+fly with --shards) are built in parallel, one shard per process.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from score_portfolio import ResultWriter, read_chunks
+
+TRANSACTION_COLUMNS = ('business_id', 'timestamp', 'amount', 'balance')
+
+# The BusinessData fields the builder produces
+FEATURE_FIELDS = ('upi_monthly_volume', 'upi_volatility', 'avg_monthly_balance', 'min_monthly_balance')
+
+RUPEES_PER_LAKH = 100_000
+RUPEES_PER_THOUSAND = 1_000
+
+# Per-business running totals: (dtype, initial value)
+_STATE = {
+    'first_month': (np.int64, np.iinfo(np.int64).max),
+    # The month currently being filled (-1 before the first transaction)
+    'open_month': (np.int64, -1),
+    'open_volume': (np.float64, 0.0),
+    'open_balance_sum': (np.float64, 0.0),
+    'open_balance_count': (np.int64, 0),
+    'open_balance_min': (np.float64, np.inf),
+    # Welford count, mean and sum of squared deviations of finished monthly volumes
+    'months': (np.float64, 0.0),
+    'volume_mean': (np.float64, 0.0),
+    'volume_m2': (np.float64, 0.0),
+    # Finished months with balances, and the sums of their average and lowest balance
+    'balance_months': (np.int64, 0),
+    'balance_avg_sum': (np.float64, 0.0),
+    'balance_min_sum': (np.float64, 0.0)
+}
+
+def month_number(month: str) -> int:
+    """'2024-03' -> months since year 0, the unit months are counted in"""
+    year, number = month.split('-')
+    return int(year) * 12 + int(number) - 1
+
+def month_name(number: int) -> str:
+    return f"{number // 12:04d}-{number % 12 + 1:02d}"
+
+class UPIFeatureBuilder:
+    """Single-pass, per-business aggregation of UPI transaction chunks.
+
+    Call add() with each chunk in file order, then features() or
+    feature_batches(). Features are defined over every calendar month from a
+    business's first transaction up to `through` (default: the latest month
+    in the data), so months without UPI activity count as zero volume:
+
+    - upi_monthly_volume: mean monthly transaction value, in lakhs
+    - upi_volatility: standard deviation of monthly value over its mean
+    - avg_monthly_balance: mean of each month's average balance, in thousands
+    - min_monthly_balance: mean of each month's lowest balance, in thousands
+
+    The balance fields use only months that have balance readings and are
+    NaN for businesses without any.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.skipped_rows = 0
+        self.last_month = -1
+        self._ids: List = []
+        self._slots: Dict = {}
+        self._state = {name: np.full(0, initial, dtype=dtype) for name, (dtype, initial) in _STATE.items()}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _slot_codes(self, ids: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(ids)
+        slots = self._slots
+        # One dict lookup per distinct business in the chunk, not per row
+        unique_slots = np.fromiter((slots.setdefault(business, len(slots)) for business in uniques.tolist()),
+                                   dtype=np.int64, count=len(uniques))
+        if len(slots) > len(self._ids):
+            self._ids.extend(uniques[unique_slots >= len(self._ids)].tolist())
+            self._grow(len(slots))
+        return unique_slots[codes]
+
+    def _grow(self, size: int):
+        capacity = len(self._state['first_month'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        for name, (dtype, initial) in _STATE.items():
+            grown = np.full(capacity, initial, dtype=dtype)
+            grown[:len(self._state[name])] = self._state[name]
+            self._state[name] = grown
+
+    def add(self, chunk: pd.DataFrame):
+        """Fold one chunk of transactions into the running totals"""
+        missing = [column for column in TRANSACTION_COLUMNS[:3] if column not in chunk]
+        if missing:
+            raise ValueError(f"Transaction log is missing columns: {', '.join(missing)}")
+
+        timestamps = pd.to_datetime(chunk['timestamp'], errors='coerce')
+        amounts = pd.to_numeric(chunk['amount'], errors='coerce')
+        valid = timestamps.notna().to_numpy() & np.isfinite(amounts.to_numpy(dtype=np.float64, na_value=np.nan))
+        valid &= chunk['business_id'].notna().to_numpy()
+        self.rows += len(chunk)
+        self.skipped_rows += int((~valid).sum())
+        if not valid.any():
+            return
+        if not valid.all():
+            chunk, timestamps, amounts = chunk[valid], timestamps[valid], amounts[valid]
+
+        if timestamps.dt.tz is not None:
+            # Bucket by the local calendar month the timestamps were recorded in
+            timestamps = timestamps.dt.tz_localize(None)
+        months = timestamps.to_numpy().astype('datetime64[M]').astype(np.int64) + 1970 * 12
+        if 'balance' in chunk:
+            balances = pd.to_numeric(chunk['balance'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            balances = np.full(len(chunk), np.nan)
+
+        frame = pd.DataFrame({'slot': self._slot_codes(chunk['business_id']), 'month': months,
+                              'volume': np.abs(amounts.to_numpy(dtype=np.float64)), 'balance': balances})
+        grouped = frame.groupby(['slot', 'month'], sort=True)
+        totals = grouped['volume'].sum()
+        slots = totals.index.get_level_values(0).to_numpy()
+        month = totals.index.get_level_values(1).to_numpy()
+        volume = totals.to_numpy(copy=True)
+        balance_sum = grouped['balance'].sum().to_numpy(copy=True)
+        balance_count = grouped['balance'].count().to_numpy(copy=True)
+        balance_min = grouped['balance'].min().fillna(np.inf).to_numpy(copy=True)
+        self._merge_months(slots, month, volume, balance_sum, balance_count, balance_min)
+
+    def _merge_months(self, slots, month, volume, balance_sum, balance_count, balance_min):
+        # Rows are (business, month) totals sorted by business then month
+        s = self._state
+        first = np.r_[True, slots[1:] != slots[:-1]]
+        last = np.r_[slots[1:] != slots[:-1], True]
+
+        open_month = s['open_month'][slots]
+        has_open = first & (open_month >= 0)
+        late = has_open & (month < open_month)
+        if late.any():
+            row = np.flatnonzero(late)[0]
+            raise ValueError(f"Transactions of business {self._ids[slots[row]]!r} are not in time order: "
+                             f"{month_name(month[row])} after {month_name(open_month[row])}")
+
+        # A chunk's first month for a business may continue the open month
+        same = has_open & (month == open_month)
+        if same.any():
+            open_slots = slots[same]
+            volume[same] += s['open_volume'][open_slots]
+            balance_sum[same] += s['open_balance_sum'][open_slots]
+            balance_count[same] += s['open_balance_count'][open_slots]
+            balance_min[same] = np.minimum(balance_min[same], s['open_balance_min'][open_slots])
+
+        # ...otherwise the open month is finished, as is every month but the last per business
+        closed = has_open & (month > open_month)
+        closed_slots = slots[closed]
+        _fold_months(s, np.concatenate([closed_slots, slots[~last]]),
+                     np.concatenate([s['open_volume'][closed_slots], volume[~last]]),
+                     np.concatenate([s['open_balance_sum'][closed_slots], balance_sum[~last]]),
+                     np.concatenate([s['open_balance_count'][closed_slots], balance_count[~last]]),
+                     np.concatenate([s['open_balance_min'][closed_slots], balance_min[~last]]))
+
+        new_open = slots[last]
+        s['first_month'][slots[first]] = np.minimum(s['first_month'][slots[first]], month[first])
+        s['open_month'][new_open] = month[last]
+        s['open_volume'][new_open] = volume[last]
+        s['open_balance_sum'][new_open] = balance_sum[last]
+        s['open_balance_count'][new_open] = balance_count[last]
+        s['open_balance_min'][new_open] = balance_min[last]
+        self.last_month = max(self.last_month, int(month.max()))
+
+    def features(self, through: Optional[int] = None) -> pd.DataFrame:
+        """business_id plus FEATURE_FIELDS for every business seen so far.
+
+        `through` is a month number (see month_number) and must not precede
+        the latest month in the data. The builder can keep taking chunks
+        afterwards.
+        """
+        size = len(self._ids)
+        through = self.last_month if through is None else through
+        if through < self.last_month:
+            raise ValueError(f"Features through {month_name(through)} would drop transactions up to "
+                             f"{month_name(self.last_month)}")
+
+        # Finish the open months on a copy, leaving the running totals untouched
+        s = {name: values[:size].copy() for name, values in self._state.items()}
+        slots = np.arange(size)
+        _fold_months(s, slots, s['open_volume'], s['open_balance_sum'], s['open_balance_count'], s['open_balance_min'])
+
+        # Months without transactions are zero-volume months: merge them in as
+        # one group of `zeros` values with mean 0 and no spread
+        span = (through - s['first_month'] + 1).astype(np.float64)
+        zeros = span - s['months']
+        mean = s['volume_mean'] * s['months'] / span
+        m2 = s['volume_m2'] + s['volume_mean'] ** 2 * s['months'] * zeros / span
+        std = np.sqrt(m2 / span)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volatility = np.where(mean > 0, std / mean, 0.0)
+            avg_balance = s['balance_avg_sum'] / s['balance_months']
+            min_balance = s['balance_min_sum'] / s['balance_months']
+
+        return pd.DataFrame({
+            'business_id': self._ids,
+            'upi_monthly_volume': mean / RUPEES_PER_LAKH,
+            'upi_volatility': volatility,
+            'avg_monthly_balance': avg_balance / RUPEES_PER_THOUSAND,
+            'min_monthly_balance': min_balance / RUPEES_PER_THOUSAND
+        })
+
+    def feature_batches(self, batch_size: int = 100_000, through: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        features = self.features(through)
+        for start in range(0, len(features), batch_size):
+            yield features.iloc[start:start + batch_size]
+
+def _fold_months(s: Dict[str, np.ndarray], slots, volume, balance_sum, balance_count, balance_min):
+    """Merge finished months into the per-business Welford totals (Chan et al.'s pairwise update)"""
+    if not len(slots):
+        return
+    slots, inverse = np.unique(slots, return_inverse=True)
+    count = np.bincount(inverse).astype(np.float64)
+    batch_mean = np.bincount(inverse, volume) / count
+    batch_m2 = np.bincount(inverse, (volume - batch_mean[inverse]) ** 2)
+
+    months = s['months'][slots]
+    total = months + count
+    delta = batch_mean - s['volume_mean'][slots]
+    s['volume_mean'][slots] += delta * count / total
+    s['volume_m2'][slots] += batch_m2 + delta ** 2 * months * count / total
+    s['months'][slots] = total
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        has_balance = balance_count > 0
+        average = np.where(has_balance, balance_sum / balance_count, 0.0)
+    s['balance_months'][slots] += np.bincount(inverse, has_balance).astype(np.int64)
+    s['balance_avg_sum'][slots] += np.bincount(inverse, average)
+    s['balance_min_sum'][slots] += np.bincount(inverse, np.where(has_balance, balance_min, 0.0))
+
+def build_features(paths: Sequence[str], chunk_size: int = 1_000_000) -> UPIFeatureBuilder:
+    """Stream transaction log files, in order, through one builder"""
+    builder = UPIFeatureBuilder()
+    for path in paths:
+        for chunk in read_chunks(path, chunk_size):
+            builder.add(chunk)
+    return builder
+
+def split_into_shards(paths: Sequence[str], out_dir: str, shards: int, chunk_size: int = 1_000_000) -> List[str]:
+    """Partition transaction logs into `shards` CSV files by a stable hash of business_id.
+
+    Row order within each business is preserved, so every shard is a valid
+    input for build_features.
+    """
+    shard_paths = [os.path.join(out_dir, f'shard-{shard:04d}.csv') for shard in range(shards)]
+    for shard_path in shard_paths:
+        if os.path.exists(shard_path):
+            os.remove(shard_path)
+
+    for path in paths:
+        for chunk in read_chunks(path, chunk_size):
+            shard_of = pd.util.hash_pandas_object(chunk['business_id'], index=False).to_numpy() % shards
+            for shard, rows in chunk.groupby(shard_of, sort=False):
+                shard_path = shard_paths[shard]
+                rows.to_csv(shard_path, mode='a', index=False, header=not os.path.exists(shard_path))
+    return [shard_path for shard_path in shard_paths if os.path.exists(shard_path)]
+
+def write_features(builders: Sequence[UPIFeatureBuilder], output_path: str, through: Optional[int] = None,
+                   applications: Optional[pd.DataFrame] = None, batch_size: int = 100_000) -> int:
+    """Write the features of every builder; with `applications`, as complete BusinessData records.
+
+    `applications` holds the other BusinessData fields, one row per
+    business_id; their UPI and balance fields are replaced by the derived
+    ones and businesses without transactions are left out. Returns the rows
+    written.
+    """
+    if through is None:
+        through = max(builder.last_month for builder in builders)
+    if applications is not None:
+        applications = applications.drop(columns=list(FEATURE_FIELDS), errors='ignore').set_index('business_id')
+
+    writer = ResultWriter(output_path)
+    rows = 0
+    for builder in builders:
+        for batch in builder.feature_batches(batch_size, through):
+            if applications is not None:
+                batch = applications.join(batch.set_index('business_id'), how='inner').reset_index()
+            if len(batch):
+                writer.write(batch)
+                rows += len(batch)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive UPI volume, volatility and balance features from transaction logs")
+    parser.add_argument('inputs', nargs='+', help="transaction logs (.csv, .ndjson/.jsonl or .parquet), read in order")
+    parser.add_argument('-o', '--output', required=True, help="features file (.csv, .ndjson/.jsonl) or directory (.parquet)")
+    parser.add_argument('--through', help="last month to count, YYYY-MM (default: the latest month in the logs)")
+    parser.add_argument('--applications', help="file with the other BusinessData fields and business_id; "
+                                               "the output then holds ready-to-score records")
+    parser.add_argument('--sharded', action='store_true', help="inputs are already partitioned by business_id")
+    parser.add_argument('--shards', type=int, default=0, help="split the inputs into this many business_id shards first")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--work-dir', help="where --shards writes its shard files (default: a temporary directory)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    work_dir = None
+    shards = [[path] for path in args.inputs] if args.sharded else [args.inputs]
+    if args.shards > 1:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix='upi-shards-')
+        os.makedirs(work_dir, exist_ok=True)
+        shards = [[path] for path in split_into_shards(args.inputs, work_dir, args.shards, args.chunk_size)]
+        sys.stderr.write(f"Split into {len(shards)} shards in {time.perf_counter() - started:.1f} s\n")
+
+    try:
+        if args.workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                builders = list(pool.map(build_features, shards, [args.chunk_size] * len(shards)))
+        else:
+            builders = [build_features(paths, args.chunk_size) for paths in shards]
+    finally:
+        if work_dir and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    applications = None
+    if args.applications:
+        applications = pd.concat(read_chunks(args.applications, args.chunk_size), ignore_index=True)
+    through = month_number(args.through) if args.through else None
+    rows = write_features(builders, args.output, through, applications)
+
+    elapsed = time.perf_counter() - started
+    transactions = sum(builder.rows for builder in builders)
+    skipped = sum(builder.skipped_rows for builder in builders)
+    print(f"Read {transactions:,} transactions ({skipped:,} unusable) for {sum(map(len, builders)):,} businesses; "
+          f"wrote {rows:,} records in {elapsed:.1f} s: {transactions / max(elapsed, 1e-9):,.0f} transactions/s")
+
+if __name__ == "__main__":
+    main()
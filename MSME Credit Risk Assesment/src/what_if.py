@@ -0,0 +1,193 @@
+"""What-if analysis on top of the piecewise-linear credit score.
+
+Holding every other input fixed, each numeric feature enters the final score
+through one term of the form clip(a + b * x, lo, hi), scaled by its
+component weight. That lets us solve for the tier thresholds directly
+instead of rescoring in a loop, and evaluate sensitivity grids by
+broadcasting the scoring formulas over the grid axes.
+"""
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from batch_validation import FIELD_SPECS
+from credit_risk_model import CreditRiskAssessor
+from scoring_config import ScoringPlan
+
+NUMERIC_FEATURES = ('business_vintage', 'repayment_delays', 'annual_turnover', 'profit_margin', 'debt_to_income_ratio',
+                    'gst_filing_delay', 'upi_monthly_volume', 'social_media_rating', 'avg_monthly_balance',
+                    'ecommerce_rating', 'return_rate', 'employee_count')
+
+# Inputs that feed the score; the other BusinessData fields do not matter here
+SCORED_FIELDS = NUMERIC_FEATURES + ('industry_risk', 'location_type')
+
+def _feature_term(feature: str, columns: Mapping[str, np.ndarray], p: ScoringPlan):
+    """(a, b, lo, hi, weight) such that the feature adds weight * clip(a + b * x, lo, hi) to the final score"""
+    inf = np.inf
+    core = 100 * p.core_weight / 5
+    alternative = 100 * p.alternative_weight / 5
+    metadata = 100 * p.metadata_weight / 3
+
+    if feature == 'business_vintage':
+        return 0.0, 1 / p.vintage_cap, -inf, 1.0, core
+    if feature == 'repayment_delays':
+        return 1.0, -p.delay_penalty, 0.0, inf, core
+    if feature == 'annual_turnover':
+        return 0.0, 1 / p.turnover_cap, -inf, 1.0, core
+    if feature == 'profit_margin':
+        return p.profit_offset / p.profit_range, 1 / p.profit_range, -inf, inf, core
+    if feature == 'debt_to_income_ratio':
+        return 1.0, -1.0, 0.0, inf, core
+    if feature == 'gst_filing_delay':
+        return 1.0, -1 / p.gst_delay_days, 0.0, inf, alternative
+    if feature == 'upi_monthly_volume':
+        return 0.0, 1 / p.upi_cap, -inf, 1.0, alternative
+    if feature == 'social_media_rating':
+        return 0.0, 1 / p.social_rating_max, -inf, inf, alternative
+    if feature == 'avg_monthly_balance':
+        return 0.0, 1 / p.balance_cap, -inf, 1.0, alternative
+    if feature == 'ecommerce_rating':
+        keep = 1 - np.minimum(p.return_rate_cap, columns['return_rate'])
+        return 0.0, keep / p.ecommerce_rating_max, -inf, inf, alternative
+    if feature == 'return_rate':
+        # rating * (1 - min(cap, r)) == clip(rating - rating * r, rating * (1 - cap), inf) for rating >= 0
+        rating = columns['ecommerce_rating'] / p.ecommerce_rating_max
+        return rating, -rating, rating * (1 - p.return_rate_cap), inf, alternative
+    if feature == 'employee_count':
+        return 0.0, 1 / p.employee_cap, -inf, 1.0, metadata
+    raise ValueError(f"{feature} is not a numeric scoring feature")
+
+def _as_columns(data) -> Dict[str, Any]:
+    return {name: (data[name] if name in ('industry_risk', 'location_type') else np.asarray(data[name], dtype=np.float64))
+            for name in SCORED_FIELDS}
+
+def _final_scores(assessor: CreditRiskAssessor, columns: Mapping[str, Any], p: ScoringPlan) -> np.ndarray:
+    return (
+        assessor.calculate_core_scores(columns, p) * p.core_weight +
+        assessor.calculate_alternative_scores(columns, p) * p.alternative_weight +
+        assessor.calculate_metadata_scores(columns, p) * p.metadata_weight
+    ) * 100
+
+def solve_thresholds(assessor: CreditRiskAssessor, data, features: Optional[Sequence[str]] = None,
+                     plan: Optional[ScoringPlan] = None) -> Dict[str, Dict[str, Dict[str, np.ndarray]]]:
+    """Minimum single-feature change that moves each record across each tier threshold.
+
+    `data` is anything score_batch accepts. For a record below a threshold
+    the answer is the nearest value that reaches it; for a record at or above
+    it, the nearest value that drops below it (its safety margin). Other
+    inputs stay fixed. Values outside the feature's valid range, or thresholds
+    the feature cannot move the score across, come back as NaN.
+
+    Returns {tier: {feature: {'value': array, 'change': array}}} with tier
+    'Low Risk' for the low_risk_min threshold and 'Moderate Risk' for
+    moderate_risk_min.
+    """
+    p = plan or assessor.plan
+    features = list(features or NUMERIC_FEATURES)
+    columns = _as_columns(data)
+    score = _final_scores(assessor, columns, p)
+
+    results = {}
+    for tier, threshold in (('Low Risk', p.low_risk_min), ('Moderate Risk', p.moderate_risk_min)):
+        below = score < threshold
+        results[tier] = {}
+        for feature in features:
+            value = _solve_feature(assessor, columns, score, feature, threshold, below, p)
+            results[tier][feature] = {'value': value, 'change': value - columns[feature]}
+    return results
+
+def _solve_feature(assessor, columns, score, feature, threshold, below, p) -> np.ndarray:
+    a, b, lo, hi, weight = _feature_term(feature, columns, p)
+    x = columns[feature]
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), x.shape)
+    current_term = np.clip(a + b * x, lo, hi)
+    # The term value at which the final score sits exactly on the threshold
+    target_term = current_term + (threshold - score) / weight
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        boundary = (target_term - a) / b
+    # Outside (lo, hi) the clipped term can never reach the target
+    reachable = (b != 0) & (target_term > lo) & (target_term <= hi) & np.isfinite(boundary)
+
+    # Moving x in `direction` raises the score when below, lowers it when above
+    direction = np.where(below, np.sign(b), -np.sign(b))
+    integer = FIELD_SPECS[feature][0] == 'int'
+    if integer:
+        candidate = np.where(direction > 0, np.ceil(boundary), np.floor(boundary))
+    else:
+        candidate = boundary.copy()
+
+    # Floating-point rounding can leave the analytic boundary a hair short:
+    # step it across (one integer, or one ulp) where it does not cross yet
+    for _ in range(4):
+        stuck = reachable & ~_crosses(assessor, columns, feature, candidate, threshold, below, p)
+        if not stuck.any():
+            break
+        candidate = np.where(stuck, candidate + direction if integer else np.nextafter(candidate, np.copysign(np.inf, direction)), candidate)
+    else:
+        reachable &= _crosses(assessor, columns, feature, candidate, threshold, below, p)
+
+    if integer:
+        # ...or, for whole-number features, round it one step too far
+        previous = candidate - direction
+        overshot = reachable & _crosses(assessor, columns, feature, previous, threshold, below, p)
+        candidate = np.where(overshot, previous, candidate)
+
+    _, lower, upper = FIELD_SPECS[feature]
+    if lower is not None:
+        reachable &= candidate >= lower
+    if upper is not None:
+        reachable &= candidate <= upper
+    return np.where(reachable, candidate, np.nan)
+
+def _crosses(assessor, columns, feature, candidate, threshold, below, p) -> np.ndarray:
+    trial = dict(columns)
+    trial[feature] = np.where(np.isfinite(candidate), candidate, columns[feature])
+    score = _final_scores(assessor, trial, p)
+    return np.where(below, score >= threshold, score < threshold)
+
+def sensitivity_grid(assessor: CreditRiskAssessor, data, grid: Mapping[str, Sequence[float]],
+                     plan: Optional[ScoringPlan] = None) -> Dict[str, np.ndarray]:
+    """Final score and tier code of every record over a grid of one or two features.
+
+    `grid` maps one or two numeric feature names to the values to try. The
+    scoring formulas are broadcast over the grid axes, so the result is
+    exactly what rescoring each point would give, with shape
+    (records, len(values_1)[, len(values_2)]).
+    """
+    p = plan or assessor.plan
+    if not 1 <= len(grid) <= 2:
+        raise ValueError("A sensitivity grid takes one or two features")
+    for feature in grid:
+        if feature not in NUMERIC_FEATURES:
+            raise ValueError(f"{feature} is not a numeric scoring feature")
+
+    columns = _as_columns(data)
+    axes = len(grid)
+    for name in NUMERIC_FEATURES:
+        columns[name] = columns[name].reshape((-1,) + (1,) * axes)
+    for axis, (feature, values) in enumerate(grid.items()):
+        shape = [1] * (axes + 1)
+        shape[axis + 1] = -1
+        columns[feature] = np.asarray(values, dtype=np.float64).reshape(shape)
+
+    score = _final_scores(assessor, columns, p)
+    # Records whose own columns do not vary still need the full grid shape
+    score = np.broadcast_to(score, (len(columns['industry_risk']),) + tuple(len(values) for values in grid.values()))
+    return {
+        'final_score': score,
+        'risk_score': np.trunc(score).astype(np.int64),
+        'tier_code': (score >= p.moderate_risk_min).astype(np.int8) + (score >= p.low_risk_min)
+    }
+
+def what_if_report(assessor: CreditRiskAssessor, data, features: Optional[Sequence[str]] = None,
+                   plan: Optional[ScoringPlan] = None) -> List[Dict[str, Any]]:
+    """solve_thresholds as one JSON-ready dict per record (None where unreachable)"""
+    solved = solve_thresholds(assessor, data, features, plan)
+    size = len(data['industry_risk'])
+    report = [{tier: {} for tier in solved} for _ in range(size)]
+    for tier, by_feature in solved.items():
+        for feature, result in by_feature.items():
+            for row, (value, change) in enumerate(zip(result['value'].tolist(), result['change'].tolist())):
+                report[row][tier][feature] = None if np.isnan(value) else {'value': value, 'change': change}
+    return report